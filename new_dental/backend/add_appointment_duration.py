@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Скрипт для добавления длительности приема в таблицу appointments
+и защиты от пересекающихся записей к одному врачу
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.database import SessionLocal
+from sqlalchemy import text
+
+def add_appointment_duration():
+    """Добавление duration_minutes, индекса (doctor_id, appointment_datetime) и exclusion-ограничения"""
+    print("🔄 Добавление длительности приема в таблицу appointments...")
+    
+    db = SessionLocal()
+    try:
+        result = db.execute(text("""
+            SELECT column_name 
+            FROM information_schema.columns 
+            WHERE table_name = 'appointments' 
+            AND column_name = 'duration_minutes'
+        """))
+        if result.fetchone() is None:
+            print("➕ Добавляем столбец 'duration_minutes' в appointments...")
+            db.execute(text("ALTER TABLE appointments ADD COLUMN duration_minutes INTEGER NOT NULL DEFAULT 30"))
+            print("✅ Столбец 'duration_minutes' добавлен.")
+        else:
+            print("ℹ️ Столбец 'duration_minutes' уже существует.")
+
+        print("➕ Создаем индекс ix_appointments_doctor_datetime...")
+        db.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_appointments_doctor_datetime
+            ON appointments (doctor_id, appointment_datetime)
+        """))
+
+        result = db.execute(text("""
+            SELECT 1 FROM pg_constraint WHERE conname = 'appointments_no_overlap'
+        """))
+        if result.fetchone() is None:
+            # Ограничение не даст создать две активные записи к врачу на пересекающееся время,
+            # даже если проверка в приложении будет обойдена конкурентными запросами
+            print("➕ Добавляем exclusion-ограничение 'appointments_no_overlap'...")
+            db.execute(text("CREATE EXTENSION IF NOT EXISTS btree_gist"))
+            db.execute(text("""
+                ALTER TABLE appointments ADD CONSTRAINT appointments_no_overlap
+                EXCLUDE USING gist (
+                    doctor_id WITH =,
+                    tsrange(
+                        appointment_datetime,
+                        appointment_datetime + duration_minutes * interval '1 minute'
+                    ) WITH &&
+                ) WHERE (doctor_id IS NOT NULL AND status <> 'cancelled')
+            """))
+            print("✅ Ограничение 'appointments_no_overlap' добавлено.")
+        else:
+            print("ℹ️ Ограничение 'appointments_no_overlap' уже существует.")
+        
+        db.commit()
+        print("✅ Длительность приема и защита от пересечений настроены.")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Ошибка при миграции appointments: {e}")
+        print("ℹ️ Если ограничение не создается, проверьте существующие пересекающиеся записи врачей.")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    add_appointment_duration()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Скрипт для денормализации clinic_id в appointments, visits,
+treatment_plan_services и tooth_services.
+
+Столбцы добавляются без NOT NULL, заполняются пачками по диапазонам id
+(каждая пачка — отдельная короткая транзакция), затем создаются индексы
+(clinic_id, ...) без блокировки записи и, если пустых значений не осталось,
+выставляется NOT NULL. Скрипт можно запускать повторно.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.database import engine, SessionLocal
+from sqlalchemy import text
+
+BATCH_SIZE = 5000
+
+# Таблица -> (UPDATE для пачки id в [:lo, :hi), индекс)
+BACKFILLS = {
+    "appointments": (
+        """
+        UPDATE appointments a SET clinic_id = u.clinic_id
+        FROM users u
+        WHERE u.id = COALESCE(a.doctor_id, a.registrar_id)
+          AND a.clinic_id IS NULL AND a.id >= :lo AND a.id < :hi
+        """,
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_appointments_clinic_datetime ON appointments (clinic_id, appointment_datetime)",
+    ),
+    "visits": (
+        """
+        UPDATE visits v SET clinic_id = u.clinic_id
+        FROM users u
+        WHERE u.id = v.doctor_id
+          AND v.clinic_id IS NULL AND v.id >= :lo AND v.id < :hi
+        """,
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_visits_clinic_visit_date ON visits (clinic_id, visit_date)",
+    ),
+    "treatment_plan_services": (
+        """
+        UPDATE treatment_plan_services s SET clinic_id = p.clinic_id
+        FROM treatment_plans p
+        WHERE p.id = s.treatment_plan_id
+          AND s.clinic_id IS NULL AND s.id >= :lo AND s.id < :hi
+        """,
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_treatment_plan_services_clinic_plan ON treatment_plan_services (clinic_id, treatment_plan_id)",
+    ),
+    "tooth_services": (
+        """
+        UPDATE tooth_services s SET clinic_id = p.clinic_id
+        FROM treatment_plans p
+        WHERE p.id = s.treatment_plan_id
+          AND s.clinic_id IS NULL AND s.id >= :lo AND s.id < :hi
+        """,
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tooth_services_clinic_plan ON tooth_services (clinic_id, treatment_plan_id)",
+    ),
+}
+
+
+def add_column(db, table):
+    result = db.execute(text("""
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_name = :table AND column_name = 'clinic_id'
+    """), {"table": table})
+    if result.fetchone() is None:
+        print(f"➕ Добавляем столбец 'clinic_id' в {table}...")
+        db.execute(text(f"ALTER TABLE {table} ADD COLUMN clinic_id INTEGER REFERENCES clinics(id)"))
+        db.commit()
+    else:
+        print(f"ℹ️ Столбец 'clinic_id' в {table} уже существует.")
+
+
+def backfill(db, table, update_sql):
+    lo, hi = db.execute(text(f"SELECT MIN(id), MAX(id) FROM {table} WHERE clinic_id IS NULL")).fetchone()
+    if lo is None:
+        print(f"ℹ️ В {table} нечего заполнять.")
+        return
+
+    updated = 0
+    while lo <= hi:
+        result = db.execute(text(update_sql), {"lo": lo, "hi": lo + BATCH_SIZE})
+        db.commit()
+        updated += result.rowcount
+        lo += BATCH_SIZE
+    print(f"✅ {table}: заполнено {updated} строк.")
+
+
+def set_not_null(db, table):
+    missing = db.execute(text(f"SELECT COUNT(*) FROM {table} WHERE clinic_id IS NULL")).scalar()
+    if missing:
+        print(f"⚠️ В {table} осталось {missing} строк без clinic_id — NOT NULL не выставлен.")
+        return
+    db.execute(text(f"ALTER TABLE {table} ALTER COLUMN clinic_id SET NOT NULL"))
+    db.commit()
+
+
+def add_clinic_id_columns():
+    print("🔄 Денормализация clinic_id...")
+
+    db = SessionLocal()
+    try:
+        for table, (update_sql, _) in BACKFILLS.items():
+            add_column(db, table)
+            backfill(db, table, update_sql)
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Ошибка при заполнении clinic_id: {e}")
+        return False
+    finally:
+        db.close()
+
+    try:
+        # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for table, (_, index_sql) in BACKFILLS.items():
+                print(f"➕ Создаем индекс по clinic_id для {table}...")
+                conn.execute(text(index_sql))
+    except Exception as e:
+        print(f"❌ Ошибка при создании индексов: {e}")
+        return False
+
+    db = SessionLocal()
+    try:
+        for table in BACKFILLS:
+            set_not_null(db, table)
+    finally:
+        db.close()
+
+    print("✅ clinic_id денормализован.")
+    return True
+
+if __name__ == "__main__":
+    if not add_clinic_id_columns():
+        sys.exit(1)
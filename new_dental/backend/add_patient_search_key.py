@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Скрипт для добавления ключа поиска пациентов (patients.search_key) и индексов списка
+пациентов клиники:
+- столбец search_key и его заполнение пачками (транслитерация считается в Python,
+  см. app/core/search_key.py);
+- расширение pg_trgm и GIN-индекс ix_patients_search_key_trgm для LIKE '%...%';
+- индекс ix_clinic_patients_clinic_active_last_visit для сортировки по последнему визиту.
+Индексы создаются CONCURRENTLY — без блокировки записи в таблицы.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.database import engine, SessionLocal
+from app.core.search_key import patient_search_key
+from sqlalchemy import bindparam, text
+
+BATCH_SIZE = 1000
+
+INDEXES = [
+    ("ix_patients_search_key_trgm", "patients USING gin (search_key gin_trgm_ops)"),
+    (
+        "ix_clinic_patients_clinic_active_last_visit",
+        "clinic_patients (clinic_id, is_active, last_visit_date DESC NULLS LAST, id DESC)"
+    ),
+]
+
+
+def fill_search_keys(db) -> int:
+    """Заполнить search_key пачками; вернуть количество обновленных пациентов"""
+    update = text("UPDATE patients SET search_key = :search_key WHERE id = :patient_id").bindparams(
+        bindparam("search_key"), bindparam("patient_id")
+    )
+    total = 0
+    last_id = 0
+    while True:
+        rows = db.execute(text("""
+            SELECT id, full_name, phone, iin
+            FROM patients
+            WHERE id > :last_id
+            ORDER BY id
+            LIMIT :limit
+        """), {"last_id": last_id, "limit": BATCH_SIZE}).fetchall()
+        if not rows:
+            return total
+        db.execute(update, [
+            {"patient_id": row.id, "search_key": patient_search_key(row.full_name, row.phone, row.iin)}
+            for row in rows
+        ])
+        db.commit()
+        total += len(rows)
+        last_id = rows[-1].id
+
+
+def add_patient_search_key():
+    print("🔄 Добавление ключа поиска пациентов...")
+
+    db = SessionLocal()
+    try:
+        result = db.execute(text("""
+            SELECT column_name
+            FROM information_schema.columns
+            WHERE table_name = 'patients' AND column_name = 'search_key'
+        """))
+        if result.fetchone() is None:
+            print("➕ Добавляем столбец 'search_key' в patients...")
+            db.execute(text("ALTER TABLE patients ADD COLUMN search_key VARCHAR(400)"))
+            db.commit()
+        else:
+            print("ℹ️ Столбец 'search_key' в patients уже существует.")
+
+        # Пересчитываем все ключи: правила нормализации могли измениться
+        print(f"✅ Ключ поиска заполнен для пациентов: {fill_search_keys(db)}")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Ошибка при заполнении ключа поиска: {e}")
+        return False
+    finally:
+        db.close()
+
+    try:
+        # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            for name, target in INDEXES:
+                print(f"➕ {name}")
+                conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {target}"))
+            conn.execute(text("ANALYZE patients"))
+            conn.execute(text("ANALYZE clinic_patients"))
+        print("✅ Индексы для поиска пациентов созданы.")
+    except Exception as e:
+        print(f"❌ Ошибка при создании индексов: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    if not add_patient_search_key():
+        sys.exit(1)
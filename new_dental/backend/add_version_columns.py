@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Скрипт для добавления столбца version (оптимистическая блокировка)
+в appointments, treatment_plans и treatment_orders.
+
+ADD COLUMN ... NOT NULL DEFAULT 1 с константой по умолчанию в PostgreSQL 11+
+не переписывает таблицу, поэтому скрипт можно запускать без окна обслуживания.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.database import SessionLocal
+from sqlalchemy import text
+
+TABLES = ["appointments", "treatment_plans", "treatment_orders"]
+
+
+def add_version_columns():
+    print("🔄 Добавление столбца version...")
+
+    db = SessionLocal()
+    try:
+        for table in TABLES:
+            result = db.execute(text("""
+                SELECT column_name
+                FROM information_schema.columns
+                WHERE table_name = :table AND column_name = 'version'
+            """), {"table": table})
+            if result.fetchone() is None:
+                print(f"➕ Добавляем столбец 'version' в {table}...")
+                db.execute(text(f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+                db.commit()
+                print(f"✅ Столбец 'version' добавлен в {table}.")
+            else:
+                print(f"ℹ️ Столбец 'version' в {table} уже существует.")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Ошибка при добавлении столбца version: {e}")
+        return False
+    finally:
+        db.close()
+
+    return True
+
+if __name__ == "__main__":
+    if not add_version_columns():
+        sys.exit(1)
@@ -0,0 +1,87 @@
+"""
+Архивный уровень для appointments и visits.
+
+Архивирование (``archive_old_records``) переносит строки пачками: в одной транзакции
+выбирает id пачки, копирует строки в ``*_archive`` и удаляет их из горячей таблицы.
+Переносятся:
+- приемы старше ``archive_horizon_days``;
+- отмененные записи старше ``archive_cancelled_after_days`` и любые записи старше горизонта.
+Записи, на которые еще ссылаются приемы или наряды в горячих таблицах, остаются на месте.
+
+Чтение (``archive_reaches``) подмешивает архив только если запрошенный период
+начинается раньше самой поздней архивной даты — обычные запросы календаря
+архив не трогают.
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import delete, exists, func, insert, or_, select
+from sqlalchemy.orm import Session
+from .config import settings
+from ..models.appointment import Appointment, AppointmentStatus
+from ..models.archive import ArchivedAppointment, ArchivedVisit
+from ..models.treatment_order import TreatmentOrder
+from ..models.visit import Visit
+
+
+def _archived_columns(archive_model):
+    return [column.name for column in archive_model.__table__.columns if column.name != "archived_at"]
+
+
+def _move_batch(db: Session, model, archive_model, condition, batch_size: int) -> int:
+    """Перенести одну пачку строк, подходящих под condition; вернуть их количество"""
+    id_query = select(model.id).where(condition).order_by(model.id).limit(batch_size)
+    if db.bind.dialect.name == "postgresql":
+        # Параллельный запуск архивации не возьмет те же строки
+        id_query = id_query.with_for_update(skip_locked=True)
+    ids = db.execute(id_query).scalars().all()
+    if not ids:
+        return 0
+
+    columns = _archived_columns(archive_model)
+    db.execute(insert(archive_model).from_select(
+        columns,
+        select(*[model.__table__.c[name] for name in columns]).where(model.id.in_(ids))
+    ))
+    db.execute(delete(model).where(model.id.in_(ids)))
+    db.commit()
+    return len(ids)
+
+
+def _move_all(db: Session, model, archive_model, condition, batch_size: int) -> int:
+    total = 0
+    while True:
+        moved = _move_batch(db, model, archive_model, condition, batch_size)
+        total += moved
+        if moved < batch_size:
+            return total
+
+
+def archive_old_records(db: Session, now: Optional[datetime] = None, batch_size: Optional[int] = None) -> dict:
+    """Перенести старые приемы и записи в архив; вернуть количество перенесенных строк"""
+    now = now or datetime.now()
+    batch_size = batch_size or settings.archive_batch_size
+    horizon = now - timedelta(days=settings.archive_horizon_days)
+    cancelled_horizon = now - timedelta(days=settings.archive_cancelled_after_days)
+
+    # Сначала приемы: после их переноса часть старых записей перестает быть на них ссылкой
+    visits = _move_all(db, Visit, ArchivedVisit, Visit.visit_date < horizon, batch_size)
+
+    appointment_condition = or_(
+        Appointment.appointment_datetime < horizon,
+        (Appointment.status == AppointmentStatus.CANCELLED) & (Appointment.appointment_datetime < cancelled_horizon)
+    ) & ~exists().where(Visit.appointment_id == Appointment.id) \
+      & ~exists().where(TreatmentOrder.appointment_id == Appointment.id)
+    appointments = _move_all(db, Appointment, ArchivedAppointment, appointment_condition, batch_size)
+
+    return {"visits": visits, "appointments": appointments}
+
+
+def archive_reaches(db: Session, column, range_start: Optional[datetime]) -> bool:
+    """Есть ли в архиве строки не раньше range_start (None — весь период).
+
+    column — столбец даты архивной таблицы; MAX по нему читается из индекса.
+    """
+    latest = db.query(func.max(column)).scalar()
+    if latest is None:
+        return False
+    return range_start is None or latest >= range_start
@@ -10,6 +10,22 @@ class Settings(BaseSettings):
     superuser_phone: str
     superuser_password: str
     superuser_full_name: str
+    # Очередь фоновых задач: "memory" (в процессе) или "database" (durable, таблица background_jobs)
+    task_queue_mode: str = "memory"
+    task_queue_concurrency: int = 4
+    task_queue_max_retries: int = 3
+    # Архивирование: отмененные записи старше N дней и все записи/приемы старше горизонта
+    archive_cancelled_after_days: int = 30
+    archive_horizon_days: int = 730
+    archive_batch_size: int = 1000
+    # Idempotency-Key: сколько хранить ответы на POST-запросы создания и сколько ключей максимум
+    idempotency_ttl_seconds: int = 86400
+    idempotency_max_keys: int = 10000
+    # Ночная сверка показателей дашборда: сколько последних дней пересчитывать
+    metrics_reconcile_days: int = 7
+    # Часовой пояс клиник: в нем хранятся даты записей и приемов (без пояса) и наряды
+    # (visit_date с часовым поясом) относятся к дню показателей
+    metrics_timezone: str = "Asia/Almaty"
 
     class Config:
         env_file = ".env"
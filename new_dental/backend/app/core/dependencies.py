@@ -1,6 +1,7 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
+from typing import Optional
 from .database import get_db
 from .security import verify_token
 from ..models.user import User
@@ -84,3 +85,23 @@ def require_registrar_or_above(current_user: User = Depends(get_current_active_u
             detail="Registrar or above access required"
         )
     return current_user
+
+
+def get_current_user_from_token(token: str, db: Session) -> Optional[User]:
+    """Получить активного пользователя по JWT токену без HTTP-зависимостей (для WebSocket)"""
+    if not token:
+        return None
+    
+    payload = verify_token(token)
+    if payload is None:
+        return None
+    
+    user_identifier = payload.get("sub")
+    if user_identifier is None:
+        return None
+    
+    user = db.query(User).filter(User.phone == user_identifier).first()
+    if user is None or not user.is_active:
+        return None
+    
+    return user
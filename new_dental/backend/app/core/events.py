@@ -0,0 +1,142 @@
+"""
+Доменные события, публикуемые после коммита транзакции.
+
+Изменения отслеживаемых моделей собираются в ``after_flush`` в ``session.info``
+и отправляются в ``after_commit`` одним сообщением на каждый топик.
+При откате транзакции накопленные события отбрасываются.
+"""
+import asyncio
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+SESSION_EVENTS_KEY = "domain_events"
+
+# Модель -> (имя сущности, функция вычисления топиков для объекта)
+_topic_registry: Dict[type, Tuple[str, Callable[[object], List[str]]]] = {}
+
+# Event loop приложения: after_commit может вызываться из threadpool (синхронные эндпоинты)
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def register_model(model: type, entity: str, topics: Callable[[object], List[str]]):
+    """Зарегистрировать модель, изменения которой публикуются как доменные события"""
+    _topic_registry[model] = (entity, topics)
+
+
+def bind_event_loop(loop: asyncio.AbstractEventLoop):
+    """Запомнить event loop приложения (вызывается при старте)"""
+    global _event_loop
+    _event_loop = loop
+
+
+def record_change(session: Session, entity: str, entity_id: Optional[int], action: str, topics: List[str]):
+    """Добавить событие вручную (например, для bulk-операций, которые не проходят через flush)"""
+    pending = session.info.setdefault(SESSION_EVENTS_KEY, {})
+    for topic in topics:
+        changes = pending.setdefault(topic, {})
+        key = (entity, entity_id)
+        changes[key] = _merge_actions(changes.get(key), action)
+
+
+def _merge_actions(previous: Optional[str], current: str) -> Optional[str]:
+    """Схлопнуть несколько изменений одной записи в рамках транзакции"""
+    if previous is None:
+        return current
+    if previous == "created":
+        # Создана и удалена в одной транзакции — клиентам сообщать не о чем
+        return None if current == "deleted" else "created"
+    return "deleted" if current == "deleted" else previous
+
+
+def _collect(session: Session, objects, action: str):
+    for obj in objects:
+        registration = _topic_registry.get(type(obj))
+        if registration is None:
+            continue
+        entity, topics = registration
+        record_change(session, entity, getattr(obj, "id", None), action, topics(obj))
+
+
+@event.listens_for(Session, "after_flush")
+def _after_flush(session: Session, flush_context):
+    # На этапе after_flush коллекции new/dirty/deleted еще содержат состояние до flush,
+    # а первичные ключи новых объектов уже присвоены
+    _collect(session, session.new, "created")
+    _collect(session, [obj for obj in session.dirty if session.is_modified(obj)], "updated")
+    _collect(session, session.deleted, "deleted")
+
+
+@event.listens_for(Session, "after_commit")
+def _after_commit(session: Session):
+    pending = session.info.pop(SESSION_EVENTS_KEY, None)
+    if not pending:
+        return
+
+    messages = []
+    for topic, changes in pending.items():
+        items = [
+            {"entity": entity, "id": entity_id, "action": action}
+            for (entity, entity_id), action in changes.items()
+            if action is not None
+        ]
+        if items:
+            messages.append({"type": "domain_event", "topic": topic, "changes": items})
+
+    if messages:
+        _dispatch(messages)
+
+
+@event.listens_for(Session, "after_rollback")
+def _after_rollback(session: Session):
+    session.info.pop(SESSION_EVENTS_KEY, None)
+
+
+def _dispatch(messages: List[dict]):
+    loop = _event_loop
+    if loop is None or loop.is_closed():
+        # Вне веб-приложения (скрипты миграций и т.п.) публиковать некуда
+        return
+    loop.call_soon_threadsafe(lambda: loop.create_task(_publish(messages)))
+
+
+async def _publish(messages: List[dict]):
+    from ..routers.websocket import manager
+
+    for message in messages:
+        try:
+            await manager.broadcast_to_topic(message["topic"], message)
+        except Exception as e:
+            print(f"❌ Ошибка отправки доменного события {message['topic']}: {e}")
+
+
+def _register_default_models():
+    from ..models.treatment_order import TreatmentOrder, TreatmentOrderService
+    from ..models.treatment_plan import TreatmentPlan, TreatmentPlanService
+    from ..models.tooth_service import ToothService
+    from ..models.visit import Visit
+
+    register_model(TreatmentOrder, "treatment_order", lambda o: [
+        f"clinic:{o.clinic_id}:treatment_orders",
+        f"treatment_order:{o.id}",
+        f"patient:{o.patient_id}",
+    ])
+    register_model(TreatmentOrderService, "treatment_order_service", lambda s: [
+        f"treatment_order:{s.treatment_order_id}",
+    ])
+    register_model(TreatmentPlan, "treatment_plan", lambda p: [
+        f"treatment_plan:{p.id}",
+        f"patient:{p.patient_id}",
+    ])
+    register_model(TreatmentPlanService, "treatment_plan_service", lambda s: [
+        f"treatment_plan:{s.treatment_plan_id}",
+    ])
+    register_model(ToothService, "tooth_service", lambda t: [
+        f"treatment_plan:{t.treatment_plan_id}",
+    ])
+    register_model(Visit, "visit", lambda v: [
+        f"patient:{v.patient_id}",
+    ])
+
+
+_register_default_models()
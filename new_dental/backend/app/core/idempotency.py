@@ -0,0 +1,101 @@
+"""
+Ключи идемпотентности (заголовок ``Idempotency-Key``) для POST-эндпоинтов создания.
+
+Клиент, повторяющий запрос после обрыва связи, присылает тот же ключ. Если первый
+запрос уже выполнен успешно, сохраненный ответ возвращается без повторного выполнения
+обработчика — без проверок, вставки и событий. Пока первый запрос еще выполняется,
+повтор получает 409. Ключ действует в пределах пользователя и пути; повтор с тем же
+ключом, но другим телом запроса — ошибка клиента (422).
+
+Ответы хранятся в TTLCache в памяти процесса (ограничен по времени и числу ключей),
+поэтому при нескольких воркерах повтор защищен, только если попал в тот же воркер.
+"""
+import hashlib
+import threading
+from typing import Optional
+from fastapi import Header, HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from .cache import TTLCache
+from .config import settings
+from .security import verify_token
+
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+# (пользователь, путь, ключ) -> (хеш тела запроса, статус, тело ответа)
+idempotency_store = TTLCache(
+    ttl_seconds=settings.idempotency_ttl_seconds,
+    max_entries=settings.idempotency_max_keys
+)
+
+# Ключи запросов, которые сейчас выполняются
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+class IdempotentRequest:
+    """Ключ идемпотентности текущего запроса (key=None, если заголовок не передан)"""
+
+    def __init__(self, key: Optional[tuple] = None, fingerprint: Optional[str] = None, cached: Optional[tuple] = None):
+        self.key = key
+        self.fingerprint = fingerprint
+        self._cached = cached
+
+    def replay(self) -> Optional[JSONResponse]:
+        """Сохраненный ответ на этот ключ, если запрос уже выполнялся"""
+        if self._cached is None:
+            return None
+        _, status_code, content = self._cached
+        return JSONResponse(content=content, status_code=status_code, headers={REPLAYED_HEADER: "true"})
+
+    def remember(self, response_model, value, status_code: int = 200):
+        """Сохранить успешный ответ для повторов и вернуть value без изменений"""
+        if self.key is not None:
+            content = jsonable_encoder(response_model.model_validate(value))
+            idempotency_store.set(self.key, (self.fingerprint, status_code, content))
+        return value
+
+
+def _caller(request: Request) -> Optional[str]:
+    """Пользователь из токена (без запроса к базе); None для анонимных запросов"""
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    payload = verify_token(token)
+    return payload.get("sub") if payload else None
+
+
+async def idempotency(
+    request: Request,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """Зависимость для POST-эндпоинтов: разбирает Idempotency-Key и ищет сохраненный ответ"""
+    if not idempotency_key:
+        yield IdempotentRequest()
+        return
+    if len(idempotency_key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise HTTPException(status_code=400, detail=f"Idempotency-Key длиннее {IDEMPOTENCY_KEY_MAX_LENGTH} символов")
+
+    fingerprint = hashlib.sha256(await request.body()).hexdigest()
+    key = (_caller(request), request.url.path, idempotency_key)
+
+    with _in_flight_lock:
+        cached = idempotency_store.get(key)
+        if cached is None:
+            if key in _in_flight:
+                raise HTTPException(status_code=409, detail="Запрос с этим Idempotency-Key еще выполняется")
+            _in_flight.add(key)
+
+    if cached is not None:
+        if cached[0] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key уже использован с другим телом запроса")
+        yield IdempotentRequest(key, fingerprint, cached)
+        return
+
+    try:
+        yield IdempotentRequest(key, fingerprint)
+    finally:
+        with _in_flight_lock:
+            _in_flight.discard(key)
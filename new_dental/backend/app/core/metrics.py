@@ -0,0 +1,340 @@
+"""
+Предрасчитанные показатели дашборда клиники.
+
+В clinic_daily_metrics хранится строка на (клиника, врач, день): записи, выполненные,
+отмененные, разные пациенты и выручка нарядов. Дашборд читает O(дней) строк вместо
+прохода по всей истории записей.
+
+Поддержка инкрементальная: запись или наряд, изменившиеся в транзакции, отмечают пары
+(врач, день) до и после изменения. Перед коммитом отмеченные дни врача пересчитываются
+из appointments (вместе с архивом) и treatment_orders и заменяют свои строки.
+Счетчики пересчитываются, а не увеличиваются, потому что число разных пациентов
+приращениями не поддержать; день одного врача — десятки строк по индексу
+(doctor_id, appointment_datetime). Перед пересчетом берется блокировка врача
+(lock_doctor): параллельные транзакции по одному врачу пересчитывают его дни по очереди
+и видят изменения друг друга.
+
+Число разных пациентов врача за всю историю из дневных строк не сложить, поэтому
+в clinic_doctor_patients хранится множество пар (клиника, врач, пациент) по записям
+вместе с архивом. Запись, у которой появились, исчезли или сменились врач, пациент
+или клиника, отмечает пары (врач, пациент), и перед коммитом они пересчитываются.
+
+Bulk-операции, которые не проходят через flush, отмечают дни через mark_metrics_changed
+и пары через mark_doctor_patients_changed. Ночная сверка (reconcile_clinic_metrics.py)
+пересчитывает последние дни целиком и заново строит множество пар.
+
+Записи без врача в показатели не попадают. Наряд относится к создавшему его врачу
+(created_by_id) и дню visit_date; отмененные наряды в выручку не входят. visit_date
+хранится с часовым поясом, поэтому день наряда и в Python, и в SQL берется в поясе
+settings.metrics_timezone, а не в поясе процесса или сессии базы.
+"""
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Dict, Iterable, Optional, Tuple
+from zoneinfo import ZoneInfo
+from sqlalchemy import Date, and_, case, delete, event, func, insert, inspect, literal, or_, select, true, tuple_, union, union_all
+from sqlalchemy.orm import Session
+from .config import settings
+from .scheduling import lock_doctor
+from ..models.appointment import Appointment, AppointmentStatus
+from ..models.archive import ArchivedAppointment
+from ..models.clinic_metrics import ClinicDailyMetrics, ClinicDoctorPatient
+from ..models.treatment_order import TreatmentOrder
+
+METRICS_KEY = "clinic_metrics_changed"
+DOCTOR_PATIENTS_KEY = "clinic_doctor_patients_changed"
+
+METRICS_TIMEZONE = ZoneInfo(settings.metrics_timezone)
+
+# Вставка при пересчете за большой период идет пачками
+INSERT_BATCH_SIZE = 1000
+
+# Модель -> (поле врача, поле даты, остальные поля, влияющие на показатели)
+TRACKED_MODELS = {
+    Appointment: ("doctor_id", "appointment_datetime", ("status", "patient_id", "clinic_id")),
+    TreatmentOrder: ("created_by_id", "visit_date", ("total_amount", "status", "clinic_id")),
+}
+
+
+def metrics_day(value) -> Optional[date]:
+    """День показателей для даты записи или наряда"""
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        # visit_date хранится с часовым поясом — день в том же поясе, что и order_day в SQL
+        value = value.astimezone(METRICS_TIMEZONE)
+    return value.date()
+
+
+def order_day(db: Session, column):
+    """День наряда в SQL; пара к metrics_day для столбцов с часовым поясом"""
+    if db.get_bind().dialect.name == "postgresql":
+        # date(timestamptz) зависит от TimeZone сессии — переводим в пояс показателей явно
+        # Пояс — литералом: одно и то же выражение в SELECT и GROUP BY
+        column = func.timezone(literal(settings.metrics_timezone, literal_execute=True), column)
+    return func.date(column, type_=Date)
+
+
+def order_day_start(day: date) -> datetime:
+    """Начало дня наряда: граница с часовым поясом для сравнения с visit_date"""
+    return datetime.combine(day, time.min, tzinfo=METRICS_TIMEZONE)
+
+
+def _attribute_values(obj, name: str):
+    """Текущее и прежнее (до flush) значения атрибута"""
+    return [getattr(obj, name)] + list(inspect(obj).attrs[name].history.deleted)
+
+
+def _changed_keys(obj, is_dirty: bool):
+    doctor_field, date_field, other_fields = TRACKED_MODELS[type(obj)]
+    if is_dirty:
+        attrs = inspect(obj).attrs
+        if not any(attrs[name].history.has_changes() for name in (doctor_field, date_field) + other_fields):
+            return set()
+    doctors = {doctor_id for doctor_id in _attribute_values(obj, doctor_field) if doctor_id is not None}
+    days = {metrics_day(value) for value in _attribute_values(obj, date_field)} - {None}
+    return {(doctor_id, day) for doctor_id in doctors for day in days}
+
+
+def _changed_doctor_patients(obj: Appointment, is_dirty: bool):
+    """Пары (врач, пациент) записи, если она могла изменить множество пациентов врача"""
+    if is_dirty:
+        attrs = inspect(obj).attrs
+        if not any(attrs[name].history.has_changes() for name in ("doctor_id", "patient_id", "clinic_id")):
+            return set()
+    doctors = {doctor_id for doctor_id in _attribute_values(obj, "doctor_id") if doctor_id is not None}
+    patients = {patient_id for patient_id in _attribute_values(obj, "patient_id") if patient_id is not None}
+    return {(doctor_id, patient_id) for doctor_id in doctors for patient_id in patients}
+
+
+def mark_doctor_patients_changed(session: Session, pairs: Iterable[Tuple[int, int]]):
+    """Отметить пары (врач, пациент) для пересчета (для bulk-операций, не проходящих через flush)"""
+    session.info.setdefault(DOCTOR_PATIENTS_KEY, set()).update(
+        (doctor_id, patient_id) for doctor_id, patient_id in pairs if doctor_id is not None
+    )
+
+
+def mark_metrics_changed(session: Session, keys: Iterable[Tuple[int, date]]):
+    """Отметить пары (врач, день) для пересчета (для bulk-операций, не проходящих через flush)"""
+    session.info.setdefault(METRICS_KEY, set()).update(
+        (doctor_id, day) for doctor_id, day in keys if doctor_id is not None
+    )
+
+
+def _aggregate(db: Session, appointment_condition, order_condition) -> Dict[tuple, dict]:
+    """Показатели по (клиника, врач, день) для записей и нарядов, подходящих под условия.
+
+    Условия — функции model -> SQL-условие: для записей они применяются и к архиву.
+    """
+    sources = [
+        select(
+            model.clinic_id, model.doctor_id, model.appointment_datetime, model.status, model.patient_id
+        ).where(model.doctor_id.isnot(None), model.clinic_id.isnot(None), appointment_condition(model))
+        for model in (Appointment, ArchivedAppointment)
+    ]
+    rows = union_all(*sources).subquery()
+    day = func.date(rows.c.appointment_datetime, type_=Date)
+    appointment_stats = db.execute(
+        select(
+            rows.c.clinic_id,
+            rows.c.doctor_id,
+            day.label("day"),
+            func.count().label("appointments"),
+            func.sum(case((rows.c.status == AppointmentStatus.COMPLETED, 1), else_=0)).label("completed"),
+            func.sum(case((rows.c.status == AppointmentStatus.CANCELLED, 1), else_=0)).label("cancelled"),
+            func.count(func.distinct(rows.c.patient_id)).label("patients")
+        ).group_by(rows.c.clinic_id, rows.c.doctor_id, day)
+    ).all()
+
+    revenue_day = order_day(db, TreatmentOrder.visit_date)
+    revenue_stats = db.execute(
+        select(
+            TreatmentOrder.clinic_id,
+            TreatmentOrder.created_by_id,
+            revenue_day.label("day"),
+            func.sum(TreatmentOrder.total_amount).label("revenue")
+        ).where(
+            func.coalesce(TreatmentOrder.status, "") != "cancelled",
+            order_condition(TreatmentOrder)
+        ).group_by(TreatmentOrder.clinic_id, TreatmentOrder.created_by_id, revenue_day)
+    ).all()
+
+    metrics: Dict[tuple, dict] = {}
+
+    def slot(clinic_id, doctor_id, day_value):
+        return metrics.setdefault((clinic_id, doctor_id, day_value), {
+            "clinic_id": clinic_id,
+            "doctor_id": doctor_id,
+            "day": day_value,
+            "appointments": 0,
+            "completed": 0,
+            "cancelled": 0,
+            "patients": 0,
+            "revenue": Decimal("0"),
+        })
+
+    for row in appointment_stats:
+        slot(row.clinic_id, row.doctor_id, row.day).update(
+            appointments=row.appointments,
+            completed=row.completed or 0,
+            cancelled=row.cancelled or 0,
+            patients=row.patients
+        )
+    for row in revenue_stats:
+        slot(row.clinic_id, row.created_by_id, row.day)["revenue"] = row.revenue or Decimal("0")
+    return metrics
+
+
+def _insert_rows(db: Session, model, rows):
+    rows = list(rows)
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        db.execute(insert(model).values(rows[start:start + INSERT_BATCH_SIZE]))
+
+
+def refresh_metrics(db: Session, keys: Iterable[Tuple[int, date]]):
+    """Пересчитать показатели для пар (врач, день) во всех клиниках"""
+    days_by_doctor = defaultdict(set)
+    for doctor_id, day in keys:
+        days_by_doctor[doctor_id].add(day)
+    if not days_by_doctor:
+        return
+
+    # В порядке id, чтобы транзакции с несколькими врачами не ждали друг друга по кругу
+    for doctor_id in sorted(days_by_doctor):
+        lock_doctor(db, doctor_id)
+
+    # Один диапазон дней на врача; лишние дни внутри диапазона отбрасываются после агрегации
+    ranges = {doctor_id: (min(days), max(days) + timedelta(days=1)) for doctor_id, days in days_by_doctor.items()}
+    metrics = _aggregate(
+        db,
+        lambda model: or_(*[
+            and_(
+                model.doctor_id == doctor_id,
+                model.appointment_datetime >= datetime.combine(first, time.min),
+                model.appointment_datetime < datetime.combine(end, time.min)
+            )
+            for doctor_id, (first, end) in ranges.items()
+        ]),
+        lambda model: or_(*[
+            and_(
+                model.created_by_id == doctor_id,
+                model.visit_date >= order_day_start(first),
+                model.visit_date < order_day_start(end)
+            )
+            for doctor_id, (first, end) in ranges.items()
+        ])
+    )
+
+    db.execute(delete(ClinicDailyMetrics).where(or_(*[
+        and_(ClinicDailyMetrics.doctor_id == doctor_id, ClinicDailyMetrics.day.in_(days))
+        for doctor_id, days in days_by_doctor.items()
+    ])))
+    _insert_rows(db, ClinicDailyMetrics, (
+        row for (_, doctor_id, day), row in metrics.items()
+        if day in days_by_doctor.get(doctor_id, ())
+    ))
+
+
+def _doctor_patient_rows(condition):
+    """Различные (клиника, врач, пациент) по записям и архиву, подходящим под condition(model)"""
+    return union(*[
+        select(model.clinic_id, model.doctor_id, model.patient_id).where(
+            model.doctor_id.isnot(None), model.clinic_id.isnot(None), condition(model)
+        )
+        for model in (Appointment, ArchivedAppointment)
+    ])
+
+
+def refresh_doctor_patients(db: Session, pairs: Iterable[Tuple[int, int]]):
+    """Пересчитать множество пациентов врачей для пар (врач, пациент)"""
+    pairs = sorted(set(pairs))
+    if not pairs:
+        return
+
+    rows = db.execute(
+        _doctor_patient_rows(lambda model: tuple_(model.doctor_id, model.patient_id).in_(pairs))
+    ).mappings().all()
+    db.execute(delete(ClinicDoctorPatient).where(
+        tuple_(ClinicDoctorPatient.doctor_id, ClinicDoctorPatient.patient_id).in_(pairs)
+    ))
+    _insert_rows(db, ClinicDoctorPatient, [dict(row) for row in rows])
+
+
+def rebuild_doctor_patients(db: Session) -> int:
+    """Построить множество пациентов врачей заново по всей истории; вернуть число пар.
+
+    Коммит — за вызывающим.
+    """
+    db.execute(delete(ClinicDoctorPatient))
+    source = _doctor_patient_rows(lambda model: true()).subquery()
+    result = db.execute(
+        insert(ClinicDoctorPatient).from_select(
+            ["clinic_id", "doctor_id", "patient_id"],
+            select(source.c.clinic_id, source.c.doctor_id, source.c.patient_id)
+        )
+    )
+    return result.rowcount
+
+
+def reconcile_metrics(db: Session, date_from: Optional[date] = None, date_to: Optional[date] = None) -> int:
+    """Пересчитать показатели за период целиком (без границ — за всю историю); вернуть число строк.
+
+    Коммит — за вызывающим.
+    """
+    def period(column, day_start):
+        conditions = []
+        if date_from is not None:
+            conditions.append(column >= day_start(date_from))
+        if date_to is not None:
+            conditions.append(column < day_start(date_to + timedelta(days=1)))
+        return and_(true(), *conditions)
+
+    metrics = _aggregate(
+        db,
+        lambda model: period(model.appointment_datetime, lambda day: datetime.combine(day, time.min)),
+        lambda model: period(model.visit_date, order_day_start)
+    )
+
+    stale = delete(ClinicDailyMetrics)
+    if date_from is not None:
+        stale = stale.where(ClinicDailyMetrics.day >= date_from)
+    if date_to is not None:
+        stale = stale.where(ClinicDailyMetrics.day <= date_to)
+    db.execute(stale)
+    _insert_rows(db, ClinicDailyMetrics, metrics.values())
+    return len(metrics)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_metrics(session: Session, flush_context):
+    changed = session.info.setdefault(METRICS_KEY, set())
+    doctor_patients = session.info.setdefault(DOCTOR_PATIENTS_KEY, set())
+    for objects, is_dirty in ((session.new, False), (session.dirty, True), (session.deleted, False)):
+        for obj in objects:
+            if type(obj) in TRACKED_MODELS:
+                changed.update(_changed_keys(obj, is_dirty))
+            if isinstance(obj, Appointment):
+                doctor_patients.update(_changed_doctor_patients(obj, is_dirty))
+
+
+@event.listens_for(Session, "before_commit")
+def _refresh_changed_metrics(session: Session):
+    # Изменения, еще не отправленные в базу, должны успеть отметить свои дни
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    keys = session.info.pop(METRICS_KEY, None) or set()
+    pairs = session.info.pop(DOCTOR_PATIENTS_KEY, None) or set()
+    # Все блокировки врачей — сразу и по порядку id, чтобы два пересчета не ждали друг друга
+    for doctor_id in sorted({doctor_id for doctor_id, _ in keys} | {doctor_id for doctor_id, _ in pairs}):
+        lock_doctor(session, doctor_id)
+    if keys:
+        refresh_metrics(session, keys)
+    if pairs:
+        refresh_doctor_patients(session, pairs)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_metrics(session: Session):
+    session.info.pop(METRICS_KEY, None)
+    session.info.pop(DOCTOR_PATIENTS_KEY, None)
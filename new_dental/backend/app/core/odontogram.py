@@ -0,0 +1,143 @@
+"""
+Компактная зубная карта (одонтограмма) плана лечения на битовых масках.
+
+Каждому зубу по FDI соответствует бит:
+- постоянные зубы 11–48 — биты 0–31 (квадранты 1–4 по 8 зубов);
+- молочные зубы 51–85 — биты 32–51 (квадранты 5–8 по 5 зубов).
+Все биты ниже 53, поэтому маски передаются в JSON числами без потери точности
+и в JavaScript.
+
+Карта плана:
+- selected_mask — зубы, на которые назначены услуги;
+- treated_mask — вылеченные зубы (TreatmentPlan.treated_teeth);
+- completed_mask — зубы, все услуги которых выполнены;
+- services и service_masks — упакованная по столбцам матрица «зуб × услуга»:
+  service_masks[i] — зубы, на которые назначена услуга services[i];
+- completed_service_masks[i] — зубы, на которых услуга services[i] выполнена.
+
+Зубы вне FDI (например, tooth_id 0 у строк без зуба) и записи без услуг в карту не
+попадают: полные teeth_services и selected_teeth отдает GET /treatment-plans/{id} по строкам.
+
+Карта кэшируется по плану. Кэш сбрасывается после коммита, который изменил зубы,
+статусы услуг или сам план.
+"""
+from typing import Dict, Iterable, List, Optional
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.base import NO_VALUE
+from .cache import TTLCache
+from ..models.tooth_service import ServiceStatus, ToothService, ToothServiceStatus
+from ..models.treatment_plan import TreatmentPlan
+
+# Номера зубов в порядке битов
+TOOTH_NUMBERS = [
+    quadrant * 10 + tooth for quadrant in (1, 2, 3, 4) for tooth in range(1, 9)
+] + [
+    quadrant * 10 + tooth for quadrant in (5, 6, 7, 8) for tooth in range(1, 6)
+]
+TOOTH_BITS = {tooth_id: bit for bit, tooth_id in enumerate(TOOTH_NUMBERS)}
+
+
+def tooth_bit(tooth_id: int) -> Optional[int]:
+    """Бит зуба или None для номера вне FDI (например, 0 — услуга без зуба)"""
+    return TOOTH_BITS.get(tooth_id)
+
+
+def teeth_mask(teeth: Iterable[int]) -> int:
+    mask = 0
+    for tooth_id in teeth:
+        bit = TOOTH_BITS.get(tooth_id)
+        if bit is not None:
+            mask |= 1 << bit
+    return mask
+
+
+def mask_teeth(mask: int) -> List[int]:
+    """Номера зубов, биты которых выставлены в mask"""
+    return [tooth_id for bit, tooth_id in enumerate(TOOTH_NUMBERS) if mask >> bit & 1]
+
+
+# TTL ограничивает устаревание в других воркерах; в своем процессе кэш сбрасывается сразу
+plan_chart_cache = TTLCache(ttl_seconds=300, max_entries=2048)
+
+PLAN_CHARTS_KEY = "plan_charts_changed"
+
+
+def build_plan_chart(db: Session, treatment_plan_id: int) -> Optional[dict]:
+    """Битовая карта плана (None, если плана нет); строится одним запросом по зубам"""
+    cached = plan_chart_cache.get(treatment_plan_id)
+    if cached is not None:
+        return cached
+
+    plan = db.query(TreatmentPlan.treated_teeth).filter(TreatmentPlan.id == treatment_plan_id).first()
+    if plan is None:
+        return None
+
+    rows = db.query(
+        ToothService.tooth_id,
+        ToothServiceStatus.service_id,
+        ToothServiceStatus.status
+    ).join(
+        ToothServiceStatus, ToothServiceStatus.tooth_service_id == ToothService.id
+    ).filter(
+        ToothService.treatment_plan_id == treatment_plan_id
+    ).all()
+
+    selected = pending = 0
+    service_masks: Dict[int, int] = {}
+    completed_service_masks: Dict[int, int] = {}
+    for tooth_id, service_id, status in rows:
+        bit = tooth_bit(tooth_id)
+        if bit is None:
+            continue
+        flag = 1 << bit
+        selected |= flag
+        service_masks[service_id] = service_masks.get(service_id, 0) | flag
+        if status == ServiceStatus.COMPLETED:
+            completed_service_masks[service_id] = completed_service_masks.get(service_id, 0) | flag
+        else:
+            pending |= flag
+
+    services = sorted(service_masks)
+    chart = {
+        "treatment_plan_id": treatment_plan_id,
+        "selected_mask": selected,
+        "treated_mask": teeth_mask(plan.treated_teeth or []),
+        "completed_mask": selected & ~pending,
+        "services": services,
+        "service_masks": [service_masks[service_id] for service_id in services],
+        "completed_service_masks": [completed_service_masks.get(service_id, 0) for service_id in services],
+    }
+    plan_chart_cache.set(treatment_plan_id, chart)
+    return chart
+
+
+def mark_plan_chart_changed(session: Session, treatment_plan_ids):
+    """Отметить планы для сброса карты (для bulk-операций, не проходящих через flush)"""
+    session.info.setdefault(PLAN_CHARTS_KEY, set()).update(treatment_plan_ids)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_charts(session: Session, flush_context):
+    changed = session.info.setdefault(PLAN_CHARTS_KEY, set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, TreatmentPlan):
+            changed.add(obj.id)
+        elif isinstance(obj, ToothService):
+            changed.add(obj.treatment_plan_id)
+        elif isinstance(obj, ToothServiceStatus):
+            # Без ленивой загрузки внутри flush: статусы меняются через загруженный ToothService
+            parent = inspect(obj).attrs.tooth_service.loaded_value
+            if parent is not NO_VALUE and parent is not None:
+                changed.add(parent.treatment_plan_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_charts(session: Session):
+    for treatment_plan_id in session.info.pop(PLAN_CHARTS_KEY, None) or ():
+        plan_chart_cache.invalidate(treatment_plan_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_charts(session: Session):
+    session.info.pop(PLAN_CHARTS_KEY, None)
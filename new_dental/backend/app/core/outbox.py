@@ -0,0 +1,262 @@
+"""
+Transactional outbox для real-time уведомлений.
+
+Обработчик запроса только добавляет строку в ``outbox_events`` в своей транзакции.
+Фоновый диспетчер каждого воркера gunicorn делает два шага:
+
+1. Публикация (один раз на событие): забирает неотправленные события пачкой
+   (FOR UPDATE SKIP LOCKED — воркеры не ждут друг друга) и проставляет dispatched_at.
+2. Рассылка (в каждом воркере): читает события, опубликованные после своего курсора,
+   одним запросом загружает данные записей и пациентов и рассылает их своим
+   WebSocket/SSE-соединениям.
+
+Курсор — время публикации с запасом FANOUT_LAG (публикация другого воркера могла
+закоммититься позже, чем наступило ее dispatched_at) и множество уже разосланных id.
+Другие воркеры узнают о событии через poll_interval; свой — сразу после коммита.
+Доставка "как минимум один раз": после ошибки рассылки события пачки повторяются
+(клиенты могут отбрасывать дубликаты по ``event_id``).
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+from .database import SessionLocal
+from ..models.outbox import OutboxEvent
+
+OUTBOX_PENDING_KEY = "outbox_pending"
+
+# Запас курсора рассылки: публикация видна другим воркерам только после коммита
+FANOUT_LAG = timedelta(seconds=30)
+
+
+def enqueue_event(
+    db: Session,
+    event_type: str,
+    aggregate_type: str,
+    aggregate_id: int,
+    doctor_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    payload: Optional[dict] = None,
+):
+    """Записать событие в outbox в текущей транзакции (коммит делает вызывающий код)"""
+    db.add(OutboxEvent(
+        event_type=event_type,
+        aggregate_type=aggregate_type,
+        aggregate_id=aggregate_id,
+        doctor_id=doctor_id,
+        user_id=user_id,
+        payload=payload,
+    ))
+    db.info[OUTBOX_PENDING_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_dispatcher(session: Session):
+    if session.info.pop(OUTBOX_PENDING_KEY, False):
+        dispatcher.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session: Session):
+    session.info.pop(OUTBOX_PENDING_KEY, None)
+
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+
+def build_appointment_messages(db: Session, events: List[OutboxEvent]) -> Dict[int, dict]:
+    """Собрать данные уведомлений для пачки событий по записям одним запросом"""
+    from ..models.appointment import Appointment
+    from ..models.patient import Patient
+
+    appointment_ids = {e.aggregate_id for e in events if e.aggregate_type == "appointment"}
+    if not appointment_ids:
+        return {}
+
+    rows = db.query(Appointment, Patient.full_name, Patient.phone).outerjoin(
+        Patient, Patient.id == Appointment.patient_id
+    ).filter(Appointment.id.in_(appointment_ids)).all()
+
+    data = {}
+    for appointment, patient_name, patient_phone in rows:
+        data[appointment.id] = {
+            "id": appointment.id,
+            "patient_id": appointment.patient_id,
+            "doctor_id": appointment.doctor_id,
+            "appointment_datetime": _isoformat(appointment.appointment_datetime),
+            "duration_minutes": appointment.duration_minutes,
+            "status": appointment.status,
+            "service_type": appointment.service_type,
+            "notes": appointment.notes,
+            "patient_name": patient_name,
+            "patient_phone": patient_phone,
+            "created_at": _isoformat(appointment.created_at),
+            "updated_at": _isoformat(appointment.updated_at),
+        }
+    return data
+
+
+class OutboxDispatcher:
+    """Фоновая задача, вычитывающая outbox пачками"""
+
+    def __init__(self, batch_size: int = 100, poll_interval: float = 1.0, retention: timedelta = timedelta(days=1)):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_purge: Optional[datetime] = None
+        # Курсор рассылки этого воркера: опубликованные после _since и еще не разосланные
+        self._since: Optional[datetime] = None
+        self._sent: Dict[int, datetime] = {}
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self):
+        """Разбудить диспетчер после коммита (безопасно из любого потока)"""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _run(self):
+        while True:
+            try:
+                published = await asyncio.to_thread(self._publish_pending)
+                dispatched = await self.drain_once()
+            except Exception as e:
+                print(f"❌ Ошибка диспетчера outbox: {e}")
+                published = dispatched = 0
+
+            # Полная пачка — вероятно, есть еще события, не ждем
+            if published >= self.batch_size or dispatched >= self.batch_size:
+                continue
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def drain_once(self) -> int:
+        """Разослать своим соединениям одну пачку опубликованных событий, вернуть их количество"""
+        batch = await asyncio.to_thread(self._read_published)
+        if not batch:
+            await asyncio.to_thread(self._purge_dispatched)
+            return 0
+
+        from ..routers.websocket import manager
+
+        for event_id, event_type, data, doctor_id, user_id, dispatched_at in batch:
+            if data is not None:
+                # data None — запись уже удалена, уведомлять не о чем
+                if event_type == "appointment_created":
+                    await manager.broadcast_appointment_created(data, doctor_id, user_id, event_id=event_id)
+                elif event_type == "appointment_updated":
+                    await manager.broadcast_appointment_update(data, doctor_id, user_id, event_id=event_id)
+                elif event_type == "appointments_batch":
+                    await manager.broadcast_appointments_batch(data, doctor_id, user_id, event_id=event_id)
+            # Отмечаем по одному: после ошибки повторяются только неразосланные
+            self._sent[event_id] = dispatched_at
+        self._advance_cursor()
+        return len(batch)
+
+    def _publish_pending(self) -> int:
+        """Опубликовать пачку неотправленных событий: проставить dispatched_at (один раз на событие).
+
+        FOR UPDATE SKIP LOCKED: диспетчеры других воркеров пропускают строки, которые
+        публикуются сейчас, и берут следующие.
+        """
+        db = SessionLocal()
+        try:
+            event_ids = db.execute(
+                select(OutboxEvent.id).where(
+                    OutboxEvent.dispatched_at.is_(None)
+                ).order_by(OutboxEvent.id).limit(self.batch_size).with_for_update(skip_locked=True)
+            ).scalars().all()
+            if not event_ids:
+                return 0
+            db.query(OutboxEvent).filter(OutboxEvent.id.in_(event_ids)).update(
+                {OutboxEvent.dispatched_at: datetime.now(timezone.utc)},
+                synchronize_session=False
+            )
+            db.commit()
+            return len(event_ids)
+        finally:
+            db.close()
+
+    def _read_published(self):
+        """Опубликованные после курсора и еще не разосланные этим воркером события с данными"""
+        if self._since is None:
+            # Новый воркер рассылает события, опубликованные с его запуска
+            self._since = datetime.now(timezone.utc)
+
+        db = SessionLocal()
+        try:
+            query = db.query(OutboxEvent).filter(
+                OutboxEvent.dispatched_at >= self._since - FANOUT_LAG
+            )
+            if self._sent:
+                query = query.filter(OutboxEvent.id.notin_(list(self._sent)))
+            events = query.order_by(OutboxEvent.id).limit(self.batch_size).all()
+            if not events:
+                return []
+
+            appointments = build_appointment_messages(db, events)
+            batch = []
+            for e in events:
+                data = appointments.get(e.aggregate_id) if e.aggregate_type == "appointment" else e.payload
+                batch.append((e.id, e.event_type, data, e.doctor_id, e.user_id, e.dispatched_at))
+            return batch
+        finally:
+            db.close()
+
+    def _advance_cursor(self):
+        """Сдвинуть курсор к последней разосланной публикации и забыть id за пределами запаса"""
+        self._since = max([self._since] + [self._aware(value) for value in self._sent.values()])
+        horizon = self._since - FANOUT_LAG
+        self._sent = {
+            event_id: dispatched_at
+            for event_id, dispatched_at in self._sent.items()
+            if self._aware(dispatched_at) >= horizon
+        }
+
+    @staticmethod
+    def _aware(value: datetime) -> datetime:
+        # SQLite возвращает dispatched_at без часового пояса (записан в UTC)
+        return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+    def _purge_dispatched(self):
+        """Удалять отправленные события старше retention (не чаще раза в час)"""
+        now = datetime.now(timezone.utc)
+        if self._last_purge and now - self._last_purge < timedelta(hours=1):
+            return
+        self._last_purge = now
+
+        db = SessionLocal()
+        try:
+            db.query(OutboxEvent).filter(
+                OutboxEvent.dispatched_at.isnot(None),
+                OutboxEvent.dispatched_at < now - self.retention
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+
+# Глобальный диспетчер, запускается при старте приложения
+dispatcher = OutboxDispatcher()
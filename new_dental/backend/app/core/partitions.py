@@ -0,0 +1,129 @@
+"""
+Помесячное секционирование appointments и visits (PostgreSQL, PARTITION BY RANGE).
+
+Секция таблицы за месяц называется ``<таблица>_YYYY_MM`` и покрывает
+[1-е число месяца, 1-е число следующего месяца). Строки вне созданных секций
+попадают в ``<таблица>_default``. Перевод таблиц на секционирование выполняет
+partition_appointments_visits.py, создание будущих и отсоединение старых
+секций — manage_partitions.py.
+
+Чтобы планировщик отсекал секции, фильтр по ключу секционирования должен
+сравнивать столбец ``timestamp without time zone`` с наивным datetime
+(см. ``naive_datetime``): сравнение с timestamptz приводит столбец к другому
+типу, и отсечение (и индекс) перестают работать. Наивные даты — местное время
+клиник (settings.metrics_timezone).
+"""
+import re
+from datetime import date, datetime
+from typing import List, Optional
+from zoneinfo import ZoneInfo
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+from .config import settings
+
+LOCAL_TIMEZONE = ZoneInfo(settings.metrics_timezone)
+
+# Таблица -> ключ секционирования
+PARTITIONED_TABLES = {
+    "appointments": "appointment_datetime",
+    "visits": "visit_date",
+}
+
+# Exclusion-ограничение на пересечение записей врача действует только внутри секции
+APPOINTMENTS_OVERLAP_CONSTRAINT = """
+    ALTER TABLE {partition} ADD CONSTRAINT {partition}_no_overlap
+    EXCLUDE USING gist (
+        doctor_id WITH =,
+        tsrange(
+            appointment_datetime,
+            appointment_datetime + duration_minutes * interval '1 minute'
+        ) WITH &&
+    ) WHERE (doctor_id IS NOT NULL AND status <> 'cancelled')
+"""
+
+
+def naive_datetime(value: Optional[datetime]) -> Optional[datetime]:
+    """Местное время клиник без часового пояса: даты записей и приемов хранятся без него.
+
+    Дата со смещением переводится в LOCAL_TIMEZONE (09:00+00:00 — это 14:00 в Алматы),
+    наивная возвращается как есть.
+    """
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(LOCAL_TIMEZONE).replace(tzinfo=None)
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_{month:%Y_%m}"
+
+
+def is_partitioned(conn: Connection, table: str) -> bool:
+    relkind = conn.execute(
+        text("SELECT relkind FROM pg_class WHERE relname = :table AND relkind IN ('r', 'p')"),
+        {"table": table}
+    ).scalar()
+    return relkind == "p"
+
+
+def list_month_partitions(conn: Connection, table: str) -> List[date]:
+    """Месяцы, для которых у таблицы есть присоединенная секция"""
+    rows = conn.execute(text("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE parent.relname = :table
+    """), {"table": table}).scalars().all()
+
+    pattern = re.compile(rf"^{table}_(\d{{4}})_(\d{{2}})$")
+    months = []
+    for name in rows:
+        match = pattern.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+def create_month_partition(conn: Connection, table: str, month: date, parent: Optional[str] = None) -> bool:
+    """Создать секцию за месяц; вернуть False, если она уже есть.
+
+    parent — фактическое имя родительской таблицы, если оно отличается от table
+    (во время первичного перевода таблицы на секционирование).
+    """
+    name = partition_name(table, month)
+    exists = conn.execute(text("SELECT 1 FROM pg_class WHERE relname = :name"), {"name": name}).scalar()
+    if exists:
+        return False
+
+    conn.execute(text(
+        f"CREATE TABLE {name} PARTITION OF {parent or table} "
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')"
+    ))
+    if table == "appointments":
+        conn.execute(text(APPOINTMENTS_OVERLAP_CONSTRAINT.format(partition=name)))
+    return True
+
+
+def create_default_partition(conn: Connection, table: str, parent: Optional[str] = None):
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {parent or table} DEFAULT"))
+
+
+def detach_partitions_before(conn: Connection, table: str, cutoff: date) -> List[str]:
+    """Отсоединить секции за месяцы раньше cutoff (таблицы остаются для архива)"""
+    detached = []
+    for month in list_month_partitions(conn, table):
+        if month >= month_start(cutoff):
+            break
+        name = partition_name(table, month)
+        conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+        detached.append(name)
+    return detached
@@ -0,0 +1,207 @@
+"""
+Массовый импорт пациентов из CSV или NDJSON.
+
+Порядок:
+1. Файл читается построчно; каждая строка проверяется схемой PatientCreate.
+2. Дубли ИИН и телефонов внутри файла отсекаются сразу.
+3. Уникальность в базе проверяется пачками: один SELECT ... WHERE iin IN (...) и один
+   по телефонам на IMPORT_BATCH_SIZE строк вместо двух запросов на пациента.
+4. Новые пациенты вставляются многострочным INSERT ... RETURNING id.
+5. Пациенты, уже известные по ИИН (с тем же телефоном), не создаются заново, а только
+   привязываются к клинике — так переносится база клиники, часть пациентов которой
+   уже лечилась в другой клинике сети.
+6. Связи clinic_patients для новых и найденных пациентов вставляются одним INSERT на пачку.
+
+Все изменения — в транзакции вызывающего; строки с ошибками попадают в отчет и не мешают
+остальным.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+from ..models.clinic_patient import ClinicPatient
+from ..models.patient import Patient
+from ..schemas.patient import PatientCreate
+from .search_key import patient_search_key
+
+IMPORT_BATCH_SIZE = 1000
+# Больше строк за один запрос не принимаем — такой файл стоит разбить
+IMPORT_MAX_ROWS = 50000
+
+IMPORT_FORMATS = ("csv", "ndjson")
+
+
+class ImportFileError(ValueError):
+    """Файл нельзя разобрать целиком (формат, кодировка, заголовок)"""
+
+
+def import_format(filename: Optional[str], content_type: Optional[str]) -> str:
+    """Формат файла по расширению или Content-Type"""
+    name = (filename or "").lower()
+    if name.endswith((".ndjson", ".jsonl")) or (content_type or "").startswith(("application/x-ndjson", "application/jsonl")):
+        return "ndjson"
+    return "csv"
+
+
+def read_rows(stream, format: str) -> Iterator[Tuple[int, dict]]:
+    """Строки файла как (номер строки в файле, словарь полей)"""
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    try:
+        if format == "ndjson":
+            for line_number, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    row = None
+                yield line_number, row if isinstance(row, dict) else None
+            return
+
+        sample = text.read(4096)
+        text.seek(0)
+        try:
+            # Excel с русской локалью сохраняет CSV через точку с запятой
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(text, dialect=dialect)
+        if not reader.fieldnames or "iin" not in [name.strip() for name in reader.fieldnames]:
+            raise ImportFileError("В заголовке CSV нет обязательных столбцов (full_name, phone, iin, birth_date)")
+        for row in reader:
+            yield reader.line_num, {
+                (key or "").strip(): (value.strip() or None) if isinstance(value, str) else value
+                for key, value in row.items()
+            }
+    except UnicodeDecodeError:
+        raise ImportFileError("Файл должен быть в кодировке UTF-8")
+    finally:
+        text.detach()
+
+
+def _error_messages(error: ValidationError) -> List[str]:
+    return [f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors()]
+
+
+class PatientImport:
+    """Состояние одного импорта: отчет и пачка проверенных строк"""
+
+    def __init__(self, db: Session, clinic_id: int, dry_run: bool = False):
+        self.db = db
+        self.clinic_id = clinic_id
+        self.dry_run = dry_run
+        self.total = 0
+        self.created = 0
+        self.linked = 0
+        self.errors: List[dict] = []
+        self._batch: List[Tuple[int, PatientCreate]] = []
+        self._seen_iins: Dict[str, int] = {}
+        self._seen_phones: Dict[str, int] = {}
+
+    def add(self, line: int, row: Optional[dict]):
+        self.total += 1
+        if self.total > IMPORT_MAX_ROWS:
+            raise ImportFileError(f"Не больше {IMPORT_MAX_ROWS} пациентов за один импорт")
+        if row is None:
+            self._fail(line, None, ["Строка не является JSON-объектом"])
+            return
+        try:
+            patient = PatientCreate(**row)
+        except ValidationError as e:
+            self._fail(line, row.get("iin"), _error_messages(e))
+            return
+
+        if patient.iin in self._seen_iins:
+            self._fail(line, patient.iin, [f"ИИН повторяется в файле (строка {self._seen_iins[patient.iin]})"])
+            return
+        if patient.phone in self._seen_phones:
+            self._fail(line, patient.iin, [f"Телефон повторяется в файле (строка {self._seen_phones[patient.phone]})"])
+            return
+        self._seen_iins[patient.iin] = line
+        self._seen_phones[patient.phone] = line
+
+        self._batch.append((line, patient))
+        if len(self._batch) >= IMPORT_BATCH_SIZE:
+            self.flush()
+
+    def _fail(self, line: int, iin: Optional[str], messages: List[str]):
+        self.errors.append({"line": line, "iin": iin, "errors": messages})
+
+    def flush(self):
+        """Проверить пачку по базе одним запросом на ИИН и одним на телефоны, затем записать"""
+        batch, self._batch = self._batch, []
+        if not batch:
+            return
+
+        by_iin = {
+            row.iin: (row.id, row.phone)
+            for row in self.db.execute(
+                select(Patient.id, Patient.iin, Patient.phone).where(Patient.iin.in_([p.iin for _, p in batch]))
+            )
+        }
+        by_phone = dict(self.db.execute(
+            select(Patient.phone, Patient.id).where(Patient.phone.in_([p.phone for _, p in batch]))
+        ).all())
+
+        new_rows, existing_ids = [], []
+        for line, patient in batch:
+            found = by_iin.get(patient.iin)
+            phone_owner = by_phone.get(patient.phone)
+            if found is not None:
+                if phone_owner is not None and phone_owner != found[0]:
+                    self._fail(line, patient.iin, ["Телефон принадлежит другому пациенту"])
+                    continue
+                existing_ids.append(found[0])
+            elif phone_owner is not None:
+                self._fail(line, patient.iin, ["Пациент с таким телефоном уже существует"])
+            else:
+                new_rows.append({
+                    **patient.dict(),
+                    "search_key": patient_search_key(patient.full_name, patient.phone, patient.iin)
+                })
+
+        if self.dry_run:
+            self.created += len(new_rows)
+            self.linked += len(existing_ids)
+            return
+
+        created_ids = []
+        if new_rows:
+            created_ids = self.db.execute(insert(Patient).returning(Patient.id), new_rows).scalars().all()
+        self.created += len(created_ids)
+        self.linked += len(existing_ids)
+        self._link(created_ids + existing_ids)
+
+    def _link(self, patient_ids: List[int]):
+        """Привязать пациентов к клинике, если активной связи еще нет"""
+        if not patient_ids:
+            return
+        already = set(self.db.execute(
+            select(ClinicPatient.patient_id).where(
+                ClinicPatient.clinic_id == self.clinic_id,
+                ClinicPatient.patient_id.in_(patient_ids),
+                ClinicPatient.is_active == True
+            )
+        ).scalars())
+        now = datetime.now()
+        links = [
+            {"clinic_id": self.clinic_id, "patient_id": patient_id, "first_visit_date": now, "is_active": True}
+            for patient_id in dict.fromkeys(patient_ids) if patient_id not in already
+        ]
+        if links:
+            self.db.execute(insert(ClinicPatient).values(links))
+
+    def report(self) -> dict:
+        return {
+            "clinic_id": self.clinic_id,
+            "dry_run": self.dry_run,
+            "total": self.total,
+            "created": self.created,
+            "linked": self.linked,
+            "failed": len(self.errors),
+            "errors": sorted(self.errors, key=lambda error: error["line"]),
+        }
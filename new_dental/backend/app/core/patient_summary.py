@@ -0,0 +1,312 @@
+"""
+Сводка пациента (GET /patients/{id}/summary) одним документом.
+
+Разделы — данные пациента со счетчиками, записи, приемы, планы лечения с услугами и
+наряды с услугами — загружаются по очереди в сессии запроса, одним-двумя пакетными
+запросами на раздел (всего до семи) без ленивых загрузок. Одна сессия — одно соединение
+пула на запрос и одна транзакция для всех разделов. Списки ограничены SUMMARY_PAGE_SIZE
+последними элементами; полные списки — в постраничных эндпоинтах. Записи и приемы вместе
+с архивом (core/archive.py): счетчики и списки включают архивные строки, у архивной записи
+version — null.
+
+Сводка кэшируется по пациенту. Кэш сбрасывается после коммита, который изменил самого
+пациента, его записи, приемы, планы или наряды (в том числе строки услуг). Bulk-операции,
+не проходящие через flush, отмечают пациентов через mark_patient_summary_changed. Строки
+услуг, добавленные только с treatment_plan_id/treatment_order_id, без загруженного родителя,
+разрешаются в пациента одним запросом на тип родителя в after_flush.
+"""
+from decimal import Decimal
+from typing import Iterable, List, Optional, Set
+from sqlalchemy import event, func, inspect, literal, null, select, union_all
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.base import NO_VALUE
+from .cache import TTLCache
+from ..models.appointment import Appointment
+from ..models.archive import ArchivedAppointment, ArchivedVisit
+from ..models.patient import Patient
+from ..models.treatment_order import TreatmentOrder, TreatmentOrderService
+from ..models.treatment_plan import TreatmentPlan, TreatmentPlanService
+from ..models.user import User
+from ..models.visit import Visit
+
+SUMMARY_PAGE_SIZE = 20
+
+# TTL ограничивает устаревание в других воркерах; в своем процессе кэш сбрасывается сразу
+patient_summary_cache = TTLCache(ttl_seconds=300, max_entries=1024)
+
+PATIENT_SUMMARIES_KEY = "patient_summaries_changed"
+
+
+def _plain(row) -> dict:
+    """Строка выборки как словарь; Numeric — в float для JSON"""
+    return {key: float(value) if isinstance(value, Decimal) else value for key, value in row.items()}
+
+
+def _load_patient(db: Session, patient_id: int) -> Optional[dict]:
+    def count(model, column=None):
+        return select(func.count(column if column is not None else model.id)).where(
+            model.patient_id == patient_id
+        ).scalar_subquery()
+
+    row = db.execute(
+        select(
+            Patient.id,
+            Patient.full_name,
+            Patient.phone,
+            Patient.iin,
+            Patient.birth_date,
+            Patient.allergies,
+            Patient.chronic_diseases,
+            Patient.contraindications,
+            Patient.special_notes,
+            Patient.created_at,
+            Patient.updated_at,
+            (count(Appointment) + count(ArchivedAppointment)).label("appointments_count"),
+            (count(Visit) + count(ArchivedVisit)).label("visits_count"),
+            count(TreatmentPlan).label("treatment_plans_count"),
+            count(TreatmentOrder).label("treatment_orders_count"),
+            select(func.coalesce(func.sum(TreatmentOrder.total_amount), 0)).where(
+                TreatmentOrder.patient_id == patient_id,
+                func.coalesce(TreatmentOrder.status, "") != "cancelled"
+            ).scalar_subquery().label("treatment_orders_total")
+        ).where(Patient.id == patient_id)
+    ).mappings().first()
+    if row is None:
+        return None
+
+    patient = _plain(row)
+    stats = {
+        "appointments": patient.pop("appointments_count"),
+        "visits": patient.pop("visits_count"),
+        "treatment_plans": patient.pop("treatment_plans_count"),
+        "treatment_orders": patient.pop("treatment_orders_count"),
+        "treatment_orders_total": patient.pop("treatment_orders_total"),
+    }
+    return {"patient": patient, "stats": stats}
+
+
+def _latest_with_archive(db: Session, patient_id: int, model, archive_model, columns, date_column: str) -> List[dict]:
+    """Последние SUMMARY_PAGE_SIZE строк пациента из горячей таблицы и архива с именем врача.
+
+    Каждая часть берет свои последние строки по индексу (patient_id, дата); столбцов, которых
+    нет в архиве (version), у архивных строк нет — null.
+    """
+    def latest(source, archived: bool):
+        return select(
+            *[
+                null().label(name) if archived and name not in source.__table__.c else source.__table__.c[name]
+                for name in columns
+            ],
+            literal(archived).label("archived")
+        ).where(
+            source.patient_id == patient_id
+        ).order_by(getattr(source, date_column).desc()).limit(SUMMARY_PAGE_SIZE)
+
+    history = union_all(
+        latest(model, False).subquery().select(),
+        latest(archive_model, True).subquery().select()
+    ).subquery()
+    rows = db.execute(
+        select(
+            history,
+            User.full_name.label("doctor_name")
+        ).outerjoin(
+            User, User.id == history.c.doctor_id
+        ).order_by(history.c[date_column].desc(), history.c.id.desc()).limit(SUMMARY_PAGE_SIZE)
+    ).mappings()
+    return [_plain(row) for row in rows]
+
+
+def _load_appointments(db: Session, patient_id: int) -> List[dict]:
+    return _latest_with_archive(db, patient_id, Appointment, ArchivedAppointment, (
+        "id", "doctor_id", "clinic_id", "appointment_datetime", "duration_minutes",
+        "status", "service_type", "notes", "version"
+    ), "appointment_datetime")
+
+
+def _load_visits(db: Session, patient_id: int) -> List[dict]:
+    return _latest_with_archive(db, patient_id, Visit, ArchivedVisit, (
+        "id", "doctor_id", "clinic_id", "appointment_id", "visit_date", "service_id",
+        "service_name", "service_price", "diagnosis", "treatment_notes", "status"
+    ), "visit_date")
+
+
+def _attach_lines(parents: List[dict], lines, parent_key: str) -> List[dict]:
+    by_parent = {parent["id"]: parent for parent in parents}
+    for parent in parents:
+        parent["services"] = []
+    for line in lines:
+        line = _plain(line)
+        by_parent[line.pop(parent_key)]["services"].append(line)
+    return parents
+
+
+def _load_treatment_plans(db: Session, patient_id: int) -> List[dict]:
+    plans = [_plain(row) for row in db.execute(
+        select(
+            TreatmentPlan.id,
+            TreatmentPlan.doctor_id,
+            User.full_name.label("doctor_name"),
+            TreatmentPlan.clinic_id,
+            TreatmentPlan.diagnosis,
+            TreatmentPlan.notes,
+            TreatmentPlan.treated_teeth,
+            TreatmentPlan.created_at,
+            TreatmentPlan.updated_at,
+            TreatmentPlan.version
+        ).outerjoin(
+            User, User.id == TreatmentPlan.doctor_id
+        ).where(
+            TreatmentPlan.patient_id == patient_id
+        ).order_by(TreatmentPlan.created_at.desc(), TreatmentPlan.id.desc()).limit(SUMMARY_PAGE_SIZE)
+    ).mappings()]
+    if not plans:
+        return plans
+
+    # Услуги всех планов страницы — одним запросом
+    lines = db.execute(
+        select(
+            TreatmentPlanService.treatment_plan_id,
+            TreatmentPlanService.id,
+            TreatmentPlanService.service_id,
+            TreatmentPlanService.service_name,
+            TreatmentPlanService.service_price,
+            TreatmentPlanService.quantity,
+            TreatmentPlanService.tooth_id,
+            TreatmentPlanService.is_completed
+        ).where(
+            TreatmentPlanService.treatment_plan_id.in_([plan["id"] for plan in plans])
+        ).order_by(TreatmentPlanService.id)
+    ).mappings()
+    return _attach_lines(plans, lines, "treatment_plan_id")
+
+
+def _load_treatment_orders(db: Session, patient_id: int) -> List[dict]:
+    orders = [_plain(row) for row in db.execute(
+        select(
+            TreatmentOrder.id,
+            TreatmentOrder.created_by_id.label("doctor_id"),
+            User.full_name.label("doctor_name"),
+            TreatmentOrder.clinic_id,
+            TreatmentOrder.appointment_id,
+            TreatmentOrder.visit_date,
+            TreatmentOrder.total_amount,
+            TreatmentOrder.status,
+            TreatmentOrder.created_at,
+            TreatmentOrder.version
+        ).outerjoin(
+            User, User.id == TreatmentOrder.created_by_id
+        ).where(
+            TreatmentOrder.patient_id == patient_id
+        ).order_by(TreatmentOrder.visit_date.desc(), TreatmentOrder.id.desc()).limit(SUMMARY_PAGE_SIZE)
+    ).mappings()]
+    if not orders:
+        return orders
+
+    lines = db.execute(
+        select(
+            TreatmentOrderService.treatment_order_id,
+            TreatmentOrderService.id,
+            TreatmentOrderService.service_id,
+            TreatmentOrderService.service_name,
+            TreatmentOrderService.service_price,
+            TreatmentOrderService.quantity,
+            TreatmentOrderService.tooth_number,
+            TreatmentOrderService.is_completed
+        ).where(
+            TreatmentOrderService.treatment_order_id.in_([order["id"] for order in orders])
+        ).order_by(TreatmentOrderService.id)
+    ).mappings()
+    return _attach_lines(orders, lines, "treatment_order_id")
+
+
+def load_patient_summary(db: Session, patient_id: int) -> Optional[dict]:
+    """Сводка пациента из кэша или загрузкой разделов в сессии db; None, если пациента нет"""
+    cached = patient_summary_cache.get(patient_id)
+    if cached is not None:
+        return cached
+
+    header = _load_patient(db, patient_id)
+    if header is None:
+        return None
+    appointments = _load_appointments(db, patient_id)
+    visits = _load_visits(db, patient_id)
+    treatment_plans = _load_treatment_plans(db, patient_id)
+    treatment_orders = _load_treatment_orders(db, patient_id)
+
+    summary = {
+        **header,
+        "page_size": SUMMARY_PAGE_SIZE,
+        "appointments": appointments,
+        "visits": visits,
+        "treatment_plans": treatment_plans,
+        "treatment_orders": treatment_orders,
+    }
+    patient_summary_cache.set(patient_id, summary)
+    return summary
+
+
+def mark_patient_summary_changed(session: Session, patient_ids: Iterable[int]):
+    """Отметить пациентов для сброса сводки (для bulk-операций, не проходящих через flush)"""
+    session.info.setdefault(PATIENT_SUMMARIES_KEY, set()).update(patient_ids)
+
+
+def _loaded_parent_patient(obj, relation: str) -> Optional[int]:
+    # Без ленивой загрузки внутри flush: родитель берется, только если уже загружен
+    parent = inspect(obj).attrs[relation].loaded_value
+    if parent is NO_VALUE or parent is None:
+        return None
+    return parent.patient_id
+
+
+def _parent_patients(session: Session, parent_model, parent_ids: Set[int]) -> Set[int]:
+    """Пациенты родителей строк услуг, добавленных без загруженного родителя (один SELECT)"""
+    parent_ids.discard(None)
+    if not parent_ids:
+        return set()
+    return set(session.execute(
+        select(parent_model.patient_id).where(parent_model.id.in_(parent_ids))
+    ).scalars())
+
+
+def _attribute_history(obj, name: str) -> List[Optional[int]]:
+    """Текущее и прежнее (до flush) значения внешнего ключа"""
+    return [getattr(obj, name)] + list(inspect(obj).attrs[name].history.deleted)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_changed_summaries(session: Session, flush_context):
+    changed = session.info.setdefault(PATIENT_SUMMARIES_KEY, set())
+    # Родители строк услуг, которые не загружены в сессию: по внешнему ключу
+    plan_ids, order_ids = set(), set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Patient):
+            changed.add(obj.id)
+        elif isinstance(obj, (Appointment, Visit, TreatmentPlan, TreatmentOrder)):
+            changed.add(obj.patient_id)
+            # Запись или прием могли перенести на другого пациента
+            changed.update(inspect(obj).attrs.patient_id.history.deleted)
+        elif isinstance(obj, TreatmentPlanService):
+            patient_id = _loaded_parent_patient(obj, "treatment_plan")
+            if patient_id is None:
+                plan_ids.update(_attribute_history(obj, "treatment_plan_id"))
+            changed.add(patient_id)
+        elif isinstance(obj, TreatmentOrderService):
+            patient_id = _loaded_parent_patient(obj, "treatment_order")
+            if patient_id is None:
+                order_ids.update(_attribute_history(obj, "treatment_order_id"))
+            changed.add(patient_id)
+    changed.update(_parent_patients(session, TreatmentPlan, plan_ids))
+    changed.update(_parent_patients(session, TreatmentOrder, order_ids))
+    changed.discard(None)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_summaries(session: Session):
+    for patient_id in session.info.pop(PATIENT_SUMMARIES_KEY, None) or ():
+        patient_summary_cache.invalidate(patient_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_summaries(session: Session):
+    session.info.pop(PATIENT_SUMMARIES_KEY, None)
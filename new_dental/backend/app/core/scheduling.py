@@ -0,0 +1,271 @@
+"""
+Расписание врачей: поиск свободных окон и проверка пересечений записей.
+
+Занятые интервалы врача за окно поиска загружаются одним запросом по индексу
+(doctor_id, appointment_datetime) в отсортированную структуру ``DoctorSchedule``;
+поиск пересечений и свободных слотов выполняется бинарным поиском и одним проходом.
+От двойных записей при конкурентных запросах защищают блокировка строки врача
+(``lock_doctor``) и, в PostgreSQL, exclusion-ограничение ``appointments_no_overlap``
+(см. add_appointment_duration.py).
+
+Дневное расписание клиники (``build_clinic_schedule``) кэшируется по (клиника, день);
+после коммита изменений записей кэш затронутых дней сбрасывается.
+"""
+from bisect import bisect_left
+from datetime import datetime, date, time, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, aliased
+from .cache import TTLCache
+from .partitions import naive_datetime
+from ..models.appointment import Appointment, AppointmentStatus
+from ..models.patient import Patient
+from ..models.user import User
+
+DEFAULT_DURATION_MINUTES = 30
+# Максимальная длительность записи: ограничивает диапазон сканирования назад по индексу
+MAX_DURATION_MINUTES = 480
+
+
+class DoctorSchedule:
+    """Отсортированный по началу список занятых интервалов [start, end) одного врача"""
+
+    def __init__(self, intervals: Optional[List[Tuple[datetime, datetime, int]]] = None):
+        self._starts: List[datetime] = []
+        self._intervals: List[Tuple[datetime, datetime, int]] = []
+        for interval in sorted(intervals or []):
+            self.add(*interval)
+
+    def add(self, start: datetime, end: datetime, appointment_id: int):
+        index = bisect_left(self._starts, start)
+        self._starts.insert(index, start)
+        self._intervals.insert(index, (start, end, appointment_id))
+
+    def conflicts(self, start: datetime, end: datetime, exclude_id: Optional[int] = None) -> List[int]:
+        """ID записей, пересекающихся с [start, end)"""
+        # Кандидаты — интервалы, начавшиеся не раньше чем за MAX_DURATION до start и до end
+        lo = bisect_left(self._starts, start - timedelta(minutes=MAX_DURATION_MINUTES))
+        hi = bisect_left(self._starts, end)
+        return [
+            appointment_id
+            for busy_start, busy_end, appointment_id in self._intervals[lo:hi]
+            if busy_end > start and appointment_id != exclude_id
+        ]
+
+    def free_slots(self, window_start: datetime, window_end: datetime, duration: timedelta, step: timedelta) -> List[datetime]:
+        """Начала слотов длительности duration с шагом step внутри окна, не пересекающихся с занятыми"""
+        slots = []
+        lo = bisect_left(self._starts, window_start - timedelta(minutes=MAX_DURATION_MINUTES))
+        busy = self._intervals[lo:]
+        index = 0
+        candidate = window_start
+        while candidate + duration <= window_end:
+            candidate_end = candidate + duration
+            # Пропускаем интервалы, которые закончились до начала кандидата
+            while index < len(busy) and busy[index][1] <= candidate:
+                index += 1
+            blocking = None
+            for busy_start, busy_end, _ in busy[index:]:
+                if busy_start >= candidate_end:
+                    break
+                if busy_end > candidate:
+                    blocking = busy_end if blocking is None else max(blocking, busy_end)
+            if blocking is None:
+                slots.append(candidate)
+                candidate += step
+            else:
+                # Перепрыгиваем к первому шагу сетки после окончания занятого интервала
+                steps = -(-(blocking - window_start) // step)
+                candidate = window_start + steps * step
+        return slots
+
+
+def appointment_end(appointment: Appointment) -> datetime:
+    return appointment.appointment_datetime + timedelta(minutes=appointment.duration_minutes or DEFAULT_DURATION_MINUTES)
+
+
+def load_doctor_schedule(db: Session, doctor_id: int, range_start: datetime, range_end: datetime) -> DoctorSchedule:
+    """Загрузить занятые интервалы врача, которые могут пересекать [range_start, range_end)"""
+    rows = db.query(
+        Appointment.id,
+        Appointment.appointment_datetime,
+        Appointment.duration_minutes
+    ).filter(
+        Appointment.doctor_id == doctor_id,
+        Appointment.appointment_datetime >= range_start - timedelta(minutes=MAX_DURATION_MINUTES),
+        Appointment.appointment_datetime < range_end,
+        Appointment.status != AppointmentStatus.CANCELLED
+    ).all()
+
+    return DoctorSchedule([
+        (start, start + timedelta(minutes=duration or DEFAULT_DURATION_MINUTES), appointment_id)
+        for appointment_id, start, duration in rows
+    ])
+
+
+def lock_doctor(db: Session, doctor_id: int):
+    """Сериализовать запись к одному врачу до конца транзакции (SELECT ... FOR UPDATE)"""
+    db.query(User.id).filter(User.id == doctor_id).with_for_update().first()
+
+
+def find_conflicts(db: Session, doctor_id: int, start: datetime, duration_minutes: int, exclude_id: Optional[int] = None) -> List[int]:
+    # appointment_datetime хранится без часового пояса (смещение отбрасывается при записи)
+    start = naive_datetime(start)
+    end = start + timedelta(minutes=duration_minutes)
+    schedule = load_doctor_schedule(db, doctor_id, start, end)
+    return schedule.conflicts(start, end, exclude_id=exclude_id)
+
+
+def expand_recurrence(start: datetime, frequency: str, interval: int, count: Optional[int], until: Optional[date], limit: int) -> List[datetime]:
+    """Развернуть правило повторения в список начал приемов (не больше limit + 1)"""
+    step = timedelta(days=interval) if frequency == "daily" else timedelta(weeks=interval)
+    result = []
+    current = start
+    # limit + 1 позволяет вызывающему коду отличить "ровно limit" от "слишком много"
+    while len(result) <= limit:
+        if count is not None and len(result) >= count:
+            break
+        if until is not None and current.date() > until:
+            break
+        result.append(current)
+        current += step
+    return result
+
+
+def find_free_slots(
+    db: Session,
+    doctor_id: int,
+    date_from: date,
+    date_to: date,
+    duration_minutes: int,
+    work_start: time,
+    work_end: time,
+    step_minutes: int,
+    limit: int
+) -> List[dict]:
+    """Свободные слоты врача по дням в рабочие часы"""
+    range_start = datetime.combine(date_from, work_start)
+    range_end = datetime.combine(date_to, work_end)
+    schedule = load_doctor_schedule(db, doctor_id, range_start, range_end)
+
+    duration = timedelta(minutes=duration_minutes)
+    step = timedelta(minutes=step_minutes)
+    result = []
+    day = date_from
+    while day <= date_to and len(result) < limit:
+        day_slots = schedule.free_slots(
+            datetime.combine(day, work_start),
+            datetime.combine(day, work_end),
+            duration,
+            step
+        )
+        for slot in day_slots[:limit - len(result)]:
+            result.append({"start": slot, "end": slot + duration})
+        day += timedelta(days=1)
+    return result
+
+
+# --- Дневное расписание клиники ---
+
+# TTL ограничивает устаревание в других воркерах; в своем процессе кэш сбрасывается сразу
+clinic_schedule_cache = TTLCache(ttl_seconds=60, max_entries=512)
+
+SCHEDULE_DAYS_KEY = "schedule_days_changed"
+
+
+def build_clinic_schedule(db: Session, clinic_id: int, day: date, include_cancelled: bool = False) -> dict:
+    """Записи всех врачей клиники за день, сгруппированные по врачу, одним запросом"""
+    cache_key = (clinic_id, day, include_cancelled)
+    cached = clinic_schedule_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    doctor = aliased(User)
+    query = db.query(
+        Appointment.id,
+        Appointment.doctor_id,
+        doctor.full_name,
+        Appointment.patient_id,
+        Patient.full_name,
+        Appointment.appointment_datetime,
+        Appointment.duration_minutes,
+        Appointment.status,
+        Appointment.service_type
+    ).join(
+        Patient, Patient.id == Appointment.patient_id
+    ).outerjoin(
+        doctor, doctor.id == Appointment.doctor_id
+    ).filter(
+        # Диапазонное сканирование ix_appointments_clinic_datetime
+        Appointment.clinic_id == clinic_id,
+        Appointment.appointment_datetime >= datetime.combine(day, time.min),
+        Appointment.appointment_datetime < datetime.combine(day + timedelta(days=1), time.min)
+    )
+    if not include_cancelled:
+        query = query.filter(Appointment.status != AppointmentStatus.CANCELLED)
+
+    doctors: Dict[int, dict] = {}
+    unassigned = []
+    for (appointment_id, doctor_id, doctor_name, patient_id, patient_name,
+         start, duration, status, service_type) in query.order_by(Appointment.appointment_datetime):
+        item = {
+            "id": appointment_id,
+            "patient_id": patient_id,
+            "patient_name": patient_name,
+            "start": start.isoformat(timespec="minutes"),
+            "duration_minutes": duration,
+            "status": status,
+            "service_type": service_type,
+        }
+        if doctor_id is None:
+            unassigned.append(item)
+            continue
+        group = doctors.get(doctor_id)
+        if group is None:
+            group = doctors[doctor_id] = {"doctor_id": doctor_id, "doctor_name": doctor_name, "appointments": []}
+        group["appointments"].append(item)
+
+    schedule = {
+        "clinic_id": clinic_id,
+        "date": day.isoformat(),
+        "doctors": sorted(doctors.values(), key=lambda group: group["doctor_name"] or ""),
+        "unassigned": unassigned,
+    }
+    clinic_schedule_cache.set(cache_key, schedule)
+    return schedule
+
+
+def _appointment_days(obj: Appointment) -> Set[date]:
+    """Дни, расписание которых затрагивает изменение записи (включая день до переноса)"""
+    days = set()
+    if obj.appointment_datetime is not None:
+        days.add(obj.appointment_datetime.date())
+    for previous in inspect(obj).attrs.appointment_datetime.history.deleted:
+        if previous is not None:
+            days.add(previous.date())
+    return days
+
+
+def mark_schedule_days_changed(session: Session, days):
+    """Отметить дни для сброса кэша расписания (для bulk-операций, не проходящих через flush)"""
+    session.info.setdefault(SCHEDULE_DAYS_KEY, set()).update(days)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_schedule_days(session: Session, flush_context):
+    changed = session.info.setdefault(SCHEDULE_DAYS_KEY, set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Appointment):
+            changed.update(_appointment_days(obj))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_schedule_days(session: Session):
+    days = session.info.pop(SCHEDULE_DAYS_KEY, None)
+    if days:
+        clinic_schedule_cache.invalidate_where(lambda key: key[1] in days)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_schedule_days(session: Session):
+    session.info.pop(SCHEDULE_DAYS_KEY, None)
@@ -0,0 +1,64 @@
+"""
+Ключ поиска пациента для списков клиники.
+
+Вместо ILIKE с ICU-коллацией (не использует индексы и падает, если коллации
+ru-RU-x-icu нет в базе) ищем подстроку в заранее вычисленном patients.search_key:
+- ФИО в нижнем регистре, транслитерированное с кириллицы (включая казахские буквы)
+  в латиницу — «Иванов» находится и по «иван», и по «ivan»;
+- телефон только цифрами — «+7 (701) 123-45-67» и «+77011234567» дают одни цифры;
+- ИИН.
+Запрос нормализуется той же функцией и разбивается на слова; каждое слово должно
+встречаться в ключе. Для LIKE '%...%' в PostgreSQL служит GIN-индекс pg_trgm.
+"""
+import re
+from typing import List, Optional
+from sqlalchemy import and_
+
+TRANSLIT = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e", "ж": "zh",
+    "з": "z", "и": "i", "й": "i", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o",
+    "п": "p", "р": "r", "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts",
+    "ч": "ch", "ш": "sh", "щ": "sch", "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu",
+    "я": "ya",
+    # Казахский алфавит
+    "ә": "a", "ғ": "g", "қ": "k", "ң": "n", "ө": "o", "ұ": "u", "ү": "u", "һ": "h", "і": "i",
+}
+_TRANSLIT_TABLE = str.maketrans(TRANSLIT)
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+_NON_DIGIT = re.compile(r"\D+")
+
+
+def fold_text(value: Optional[str]) -> str:
+    """Нижний регистр, транслитерация и только латинские буквы/цифры через пробел"""
+    if not value:
+        return ""
+    folded = value.casefold().translate(_TRANSLIT_TABLE)
+    return _NON_WORD.sub(" ", folded).strip()
+
+
+def digits_only(value: Optional[str]) -> str:
+    return _NON_DIGIT.sub("", value or "")
+
+
+def patient_search_key(full_name: Optional[str], phone: Optional[str], iin: Optional[str]) -> str:
+    return " ".join(part for part in (fold_text(full_name), digits_only(phone), digits_only(iin)) if part)
+
+
+def search_terms(query: Optional[str]) -> List[str]:
+    """Слова запроса в том же виде, что и в ключе; «+7 (701) 123-45-67» — одно число"""
+    if not query:
+        return []
+    query = query.strip()
+    # Телефон, набранный со скобками и дефисами, ищем целиком по цифрам
+    if re.fullmatch(r"[\d\s()+\-]+", query):
+        digits = digits_only(query)
+        return [digits] if digits else []
+    return fold_text(query).split()
+
+
+def search_key_condition(column, query: Optional[str]):
+    """Условие «все слова запроса есть в ключе» или None для пустого запроса"""
+    terms = search_terms(query)
+    if not terms:
+        return None
+    return and_(*[column.contains(term, autoescape=True) for term in terms])
@@ -0,0 +1,90 @@
+"""
+Обновление строк услуг плана лечения и наряда по разнице с сохраненными строками.
+
+Раньше каждое сохранение удаляло все строки и вставляло список заново. Теперь входящие
+строки сопоставляются с существующими по ключу (зуб, услуга):
+- совпавшая строка обновляется, только если изменились ее поля;
+- лишние строки удаляются;
+- новые строки вставляются.
+На каждое действие уходит одна инструкция: DELETE ... WHERE id IN, UPDATE по первичному
+ключу через executemany и INSERT со списком значений. Неизмененные строки сохраняют
+свой id и поля, которых нет во входящих данных (например, is_completed в плане).
+"""
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, List, Sequence, Tuple
+from sqlalchemy import bindparam, delete, insert, update
+from sqlalchemy.orm import Session
+
+
+def _same(old, new) -> bool:
+    # Numeric читается как Decimal, а из JSON приходит float
+    if isinstance(old, Decimal) and new is not None:
+        return old == Decimal(str(new))
+    return old == new
+
+
+def diff_lines(
+    existing: Sequence,
+    incoming: List[dict],
+    key_fields: Sequence[str],
+    value_fields: Sequence[str]
+) -> Tuple[List[dict], List[Tuple[int, dict]], List[int]]:
+    """Разница между сохраненными строками (ORM-объекты) и входящими (словари).
+
+    Строки с одинаковым ключом сопоставляются по порядку. Возвращает
+    (строки для вставки, [(id, изменившиеся поля)], id строк для удаления).
+    """
+    unmatched = defaultdict(list)
+    for row in existing:
+        unmatched[tuple(getattr(row, field) for field in key_fields)].append(row)
+
+    inserts, updates = [], []
+    for line in incoming:
+        rows = unmatched.get(tuple(line[field] for field in key_fields))
+        if not rows:
+            inserts.append(line)
+            continue
+        row = rows.pop(0)
+        changed = {field: line[field] for field in value_fields if not _same(getattr(row, field), line[field])}
+        if changed:
+            updates.append((row.id, changed))
+
+    deletes = [row.id for rows in unmatched.values() for row in rows]
+    return inserts, updates, deletes
+
+
+def apply_line_diff(
+    db: Session,
+    model,
+    existing: Sequence,
+    incoming: List[dict],
+    key_fields: Sequence[str],
+    value_fields: Sequence[str]
+) -> Dict[str, int]:
+    """Привести строки model к incoming минимальным набором изменений; вернуть размер разницы.
+
+    Словари incoming должны содержать все поля, нужные для вставки новой строки.
+    """
+    inserts, updates, deletes = diff_lines(existing, incoming, key_fields, value_fields)
+    table = model.__table__
+
+    if deletes:
+        db.execute(delete(table).where(table.c.id.in_(deletes)))
+
+    # executemany требует одинакового набора параметров — группируем по изменившимся полям
+    groups = defaultdict(list)
+    for line_id, changed in updates:
+        groups[tuple(sorted(changed))].append({"line_id": line_id, **{f"new_{field}": value for field, value in changed.items()}})
+    for fields, params in groups.items():
+        db.execute(
+            update(table).where(table.c.id == bindparam("line_id")).values(
+                {field: bindparam(f"new_{field}") for field in fields}
+            ),
+            params
+        )
+
+    if inserts:
+        db.execute(insert(table).values(inserts))
+
+    return {"inserted": len(inserts), "updated": len(updates), "deleted": len(deletes)}
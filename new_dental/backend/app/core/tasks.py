@@ -0,0 +1,304 @@
+"""
+Очередь фоновых задач для побочных эффектов, которые можно выполнить после ответа.
+
+Задача — синхронная функция ``fn(db, **payload)``, зарегистрированная через
+``@background_task("имя")``. Обработчик запроса вызывает ``enqueue_task(db, "имя", ...)``;
+задача попадает в очередь только после коммита транзакции запроса.
+
+Режимы (settings.task_queue_mode):
+- ``memory`` — asyncio-очередь в процессе, задачи теряются при перезапуске;
+- ``database`` — задачи пишутся в ``background_jobs`` в той же транзакции,
+  что и изменения запроса, и переживают перезапуск процесса.
+"""
+import asyncio
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .config import settings
+from .database import SessionLocal
+from ..models.background_job import BackgroundJob, BackgroundJobStatus
+
+PENDING_TASKS_KEY = "pending_tasks"
+DURABLE_WAKE_KEY = "pending_durable_tasks"
+
+# Задержка перед повторной попыткой: base * 2^(attempt-1), секунд
+RETRY_BASE_DELAY_SECONDS = 2
+
+_task_registry: Dict[str, Callable] = {}
+
+
+def background_task(name: str):
+    """Зарегистрировать функцию fn(db, **payload) как фоновую задачу"""
+    def decorator(fn: Callable) -> Callable:
+        _task_registry[name] = fn
+        return fn
+    return decorator
+
+
+def enqueue_task(db: Session, name: str, **payload):
+    """Поставить задачу в очередь; выполнится только после коммита текущей транзакции.
+
+    payload должен сериализоваться в JSON (даты передавайте строками ISO).
+    """
+    if name not in _task_registry:
+        raise ValueError(f"Неизвестная фоновая задача: {name}")
+
+    if task_queue.durable:
+        db.add(BackgroundJob(name=name, payload=payload, status=BackgroundJobStatus.PENDING))
+        db.info[DURABLE_WAKE_KEY] = True
+    else:
+        db.info.setdefault(PENDING_TASKS_KEY, []).append((name, payload))
+
+
+@event.listens_for(Session, "after_commit")
+def _submit_after_commit(session: Session):
+    jobs = session.info.pop(PENDING_TASKS_KEY, None)
+    if jobs:
+        task_queue.submit_threadsafe(jobs)
+    if session.info.pop(DURABLE_WAKE_KEY, False):
+        task_queue.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session: Session):
+    session.info.pop(PENDING_TASKS_KEY, None)
+    session.info.pop(DURABLE_WAKE_KEY, None)
+
+
+class Job:
+    def __init__(self, name: str, payload: dict, attempts: int = 0, job_id: Optional[int] = None):
+        self.name = name
+        self.payload = payload or {}
+        self.attempts = attempts
+        self.job_id = job_id  # id строки background_jobs в durable-режиме
+
+
+class TaskQueue:
+    """Пул воркеров с ограничением параллелизма, повторами и метриками"""
+
+    def __init__(self, mode: str = "memory", concurrency: int = 4, max_retries: int = 3, poll_interval: float = 1.0):
+        self.durable = mode == "database"
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.poll_interval = poll_interval
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._workers: List[asyncio.Task] = []
+        self._in_flight = 0
+        self._stats = {"enqueued": 0, "succeeded": 0, "failed": 0, "retried": 0}
+        self._per_task: Dict[str, Dict[str, float]] = {}
+
+    # --- Жизненный цикл ---
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+        # В durable-режиме очередь — лишь буфер между опросом таблицы и воркерами
+        self._queue = asyncio.Queue(maxsize=self.concurrency if self.durable else 0)
+        self._wakeup = asyncio.Event()
+        self._workers = [self._loop.create_task(self._worker()) for _ in range(self.concurrency)]
+        if self.durable:
+            self._workers.append(self._loop.create_task(self._poll_database()))
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        for worker in self._workers:
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+        self._workers = []
+
+    # --- Постановка задач ---
+
+    def submit_threadsafe(self, jobs: List[tuple]):
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            # Очередь не запущена (скрипты): выполняем сразу, чтобы не потерять побочный эффект
+            for name, payload in jobs:
+                self._run_job(Job(name, payload))
+            return
+        loop.call_soon_threadsafe(self._put_jobs, [Job(name, payload) for name, payload in jobs])
+
+    def _put_jobs(self, jobs: List[Job]):
+        for job in jobs:
+            self._stats["enqueued"] += 1
+            self._queue.put_nowait(job)
+
+    def wake(self):
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wakeup.set)
+
+    # --- Выполнение ---
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            self._in_flight += 1
+            try:
+                await self._execute(job)
+            finally:
+                self._in_flight -= 1
+                self._queue.task_done()
+
+    async def _execute(self, job: Job):
+        started = time.perf_counter()
+        job.attempts += 1
+        try:
+            await asyncio.to_thread(self._run_job, job)
+        except Exception as e:
+            error = traceback.format_exc(limit=5)
+            print(f"❌ Фоновая задача {job.name} (попытка {job.attempts}) завершилась ошибкой: {e}")
+            await self._handle_failure(job, error)
+            self._record(job.name, "failed_attempts", time.perf_counter() - started)
+            return
+
+        self._stats["succeeded"] += 1
+        self._record(job.name, "succeeded", time.perf_counter() - started)
+        if job.job_id is not None:
+            await asyncio.to_thread(self._finish_durable, job.job_id)
+
+    def _run_job(self, job: Job):
+        fn = _task_registry[job.name]
+        db = SessionLocal()
+        try:
+            fn(db, **job.payload)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def _handle_failure(self, job: Job, error: str):
+        if job.attempts > self.max_retries:
+            self._stats["failed"] += 1
+            if job.job_id is not None:
+                await asyncio.to_thread(self._fail_durable, job.job_id, error, None)
+            return
+
+        self._stats["retried"] += 1
+        delay = RETRY_BASE_DELAY_SECONDS * 2 ** (job.attempts - 1)
+        if job.job_id is not None:
+            await asyncio.to_thread(self._fail_durable, job.job_id, error, delay)
+        else:
+            self._loop.call_later(delay, self._queue.put_nowait, job)
+
+    def _record(self, name: str, outcome: str, duration: float):
+        stats = self._per_task.setdefault(name, {
+            "succeeded": 0, "failed_attempts": 0, "total_duration_ms": 0.0, "max_duration_ms": 0.0
+        })
+        duration_ms = duration * 1000
+        stats[outcome] += 1
+        stats["total_duration_ms"] += duration_ms
+        stats["max_duration_ms"] = max(stats["max_duration_ms"], duration_ms)
+
+    # --- Durable-режим ---
+
+    async def _poll_database(self):
+        await asyncio.to_thread(self._recover_running)
+        while True:
+            try:
+                free_slots = self.concurrency - self._queue.qsize()
+                jobs = await asyncio.to_thread(self._claim_due_jobs, free_slots) if free_slots > 0 else []
+                for job in jobs:
+                    await self._queue.put(job)
+            except Exception as e:
+                print(f"❌ Ошибка опроса очереди background_jobs: {e}")
+                jobs = []
+
+            if jobs:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    def _recover_running(self):
+        """Вернуть в очередь задачи, оставшиеся в статусе running после падения процесса"""
+        db = SessionLocal()
+        try:
+            db.query(BackgroundJob).filter(BackgroundJob.status == BackgroundJobStatus.RUNNING).update(
+                {BackgroundJob.status: BackgroundJobStatus.PENDING}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+    def _claim_due_jobs(self, limit: int) -> List[Job]:
+        db = SessionLocal()
+        try:
+            rows = db.query(BackgroundJob).filter(
+                BackgroundJob.status == BackgroundJobStatus.PENDING,
+                BackgroundJob.run_at <= datetime.now(timezone.utc)
+            ).order_by(BackgroundJob.run_at).limit(limit).with_for_update(skip_locked=True).all()
+
+            jobs = []
+            for row in rows:
+                row.status = BackgroundJobStatus.RUNNING
+                jobs.append(Job(row.name, row.payload, attempts=row.attempts, job_id=row.id))
+            db.commit()
+            self._stats["enqueued"] += len(jobs)
+            return jobs
+        finally:
+            db.close()
+
+    def _finish_durable(self, job_id: int):
+        db = SessionLocal()
+        try:
+            db.query(BackgroundJob).filter(BackgroundJob.id == job_id).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def _fail_durable(self, job_id: int, error: str, retry_delay: Optional[float]):
+        db = SessionLocal()
+        try:
+            row = db.query(BackgroundJob).filter(BackgroundJob.id == job_id).first()
+            if row is None:
+                return
+            row.attempts += 1
+            row.last_error = error
+            if retry_delay is None:
+                row.status = BackgroundJobStatus.FAILED
+            else:
+                row.status = BackgroundJobStatus.PENDING
+                row.run_at = datetime.now(timezone.utc) + timedelta(seconds=retry_delay)
+            db.commit()
+        finally:
+            db.close()
+
+    # --- Метрики ---
+
+    def metrics(self) -> dict:
+        per_task = {}
+        for name, stats in self._per_task.items():
+            runs = stats["succeeded"] + stats["failed_attempts"]
+            per_task[name] = {
+                "succeeded": stats["succeeded"],
+                "failed_attempts": stats["failed_attempts"],
+                "avg_duration_ms": round(stats["total_duration_ms"] / runs, 2) if runs else 0.0,
+                "max_duration_ms": round(stats["max_duration_ms"], 2),
+            }
+        return {
+            "mode": "database" if self.durable else "memory",
+            "concurrency": self.concurrency,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "in_flight": self._in_flight,
+            **self._stats,
+            "tasks": per_task,
+        }
+
+
+# Глобальная очередь, запускается при старте приложения
+task_queue = TaskQueue(
+    mode=settings.task_queue_mode,
+    concurrency=settings.task_queue_concurrency,
+    max_retries=settings.task_queue_max_retries,
+)
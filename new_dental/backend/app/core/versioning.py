@@ -0,0 +1,62 @@
+"""
+Оптимистическая блокировка записей, планов лечения и нарядов по столбцу ``version``.
+
+Модели объявляют version как ``version_id_col``: SQLAlchemy выполняет каждое UPDATE
+через ORM как ``UPDATE ... WHERE id = :id AND version = :прочитанная`` и увеличивает
+версию. Если строку изменили между чтением и записью, UPDATE не затрагивает строк,
+SQLAlchemy поднимает StaleDataError, и ``commit_versioned`` отвечает 409.
+
+Клиент передает версию, которую видел, в заголовке ``If-Match``. Ответы содержат
+поле version, ответы PUT и GET /appointments/{id} — еще и заголовок ETag. Если текущая
+версия другая, ответ — 412, и изменение не применяется. Без If-Match побеждает
+последняя запись, как раньше; CAS защищает только от гонки внутри одного запроса.
+"""
+from typing import Optional
+from fastapi import Header, HTTPException, Response, status
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+
+STALE_DETAIL = "Данные изменены другим пользователем — обновите страницу и повторите изменение"
+
+
+def parse_if_match(value: Optional[str]) -> Optional[int]:
+    """Версия из If-Match: "3", W/"3" или 3; None — заголовка нет или он равен *"""
+    if value is None:
+        return None
+    value = value.strip()
+    if value == "*":
+        return None
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный заголовок If-Match")
+
+
+def if_match_version(if_match: Optional[str] = Header(None, alias="If-Match")) -> Optional[int]:
+    """Зависимость: ожидаемая клиентом версия из If-Match"""
+    return parse_if_match(if_match)
+
+
+def check_version(instance, expected: Optional[int]):
+    """412, если клиент редактировал устаревшую версию"""
+    if expected is not None and instance.version != expected:
+        raise HTTPException(
+            status_code=status.HTTP_412_PRECONDITION_FAILED,
+            detail={"message": STALE_DETAIL, "current_version": instance.version}
+        )
+
+
+def set_etag(response: Response, version: Optional[int]):
+    if version is not None:
+        response.headers["ETag"] = f'"{version}"'
+
+
+def commit_versioned(db: Session):
+    """Коммит с переводом конфликта версий (строку изменили параллельно) в 409"""
+    try:
+        db.commit()
+    except StaleDataError:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail={"message": STALE_DETAIL})
@@ -1,7 +1,11 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .routers import auth_router, patients_router, appointments_router, services_router, clinics_router, users_router, tooth_services, treatment_plans, treatment_orders, visits, clinic_patients, deploy, websocket
+from .routers import auth_router, patients_router, appointments_router, services_router, clinics_router, users_router, tooth_services, treatment_plans, treatment_orders, visits, clinic_patients, deploy, websocket, sse, task_queue, reports
 from .core.database import engine
+from .core import events
+from .core.outbox import dispatcher as outbox_dispatcher
+from .core.tasks import task_queue as background_task_queue
 from .models import Base
 
 # Создаем таблицы (отключено для деплоя)
@@ -52,6 +56,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Без этого браузер не отдает JS заголовки ответа для If-Match и повторов по Idempotency-Key
+    expose_headers=["ETag", "Idempotent-Replayed"],
 )
 
 # Подключаем роутеры
@@ -67,6 +73,35 @@ app.include_router(treatment_orders.router, prefix="/treatment-orders", tags=["t
 app.include_router(visits.router, prefix="/visits", tags=["visits"])
 app.include_router(clinic_patients.router, prefix="/clinic-patients", tags=["clinic-patients"])
 app.include_router(websocket.router, prefix="/ws", tags=["websocket"])
+app.include_router(sse.router, prefix="/sse", tags=["sse"])
+app.include_router(task_queue.router, prefix="/tasks", tags=["tasks"])
+app.include_router(reports.router, prefix="/reports", tags=["reports"])
+
+@app.on_event("startup")
+async def bind_domain_events():
+    # Доменные события публикуются после коммита, в том числе из синхронных эндпоинтов
+    events.bind_event_loop(asyncio.get_running_loop())
+
+
+@app.on_event("startup")
+async def start_outbox_dispatcher():
+    outbox_dispatcher.start()
+
+
+@app.on_event("shutdown")
+async def stop_outbox_dispatcher():
+    await outbox_dispatcher.stop()
+
+
+@app.on_event("startup")
+async def start_background_task_queue():
+    background_task_queue.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_task_queue():
+    await background_task_queue.stop()
+
 
 @app.get("/")
 async def root():
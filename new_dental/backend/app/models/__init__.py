@@ -9,7 +9,12 @@ from .visit import Visit
 from .clinic_patient import ClinicPatient
 from .role import UserRole
 from .support import Support
-from .tooth_service import ToothService
+from .tooth_service import ToothService, ToothServiceStatus, ServiceStatus
+from .outbox import OutboxEvent
+from .background_job import BackgroundJob, BackgroundJobStatus
+from .archive import ArchivedAppointment, ArchivedVisit
+from .clinic_metrics import ClinicDailyMetrics, ClinicDoctorPatient
+from . import clinic_scope  # noqa: F401 — заполнение денормализованного clinic_id при записи
 from ..core.database import Base
 
 __all__ = [
@@ -28,5 +33,14 @@ __all__ = [
     "ClinicPatient",
     "UserRole",
     "Support",
-    "ToothService"
+    "ToothService",
+    "ToothServiceStatus",
+    "ServiceStatus",
+    "OutboxEvent",
+    "BackgroundJob",
+    "BackgroundJobStatus",
+    "ArchivedAppointment",
+    "ArchivedVisit",
+    "ClinicDailyMetrics",
+    "ClinicDoctorPatient"
 ]
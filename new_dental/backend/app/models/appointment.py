@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, DateTime as SQLDateTime
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Index, DateTime as SQLDateTime
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..core.database import Base
@@ -17,12 +17,17 @@ class Appointment(Base):
     patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
     doctor_id = Column(Integer, ForeignKey("users.id"), nullable=True)  # Может быть медсестра
     registrar_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # Денормализовано из врача (или регистратора), см. clinic_scope.py
+    clinic_id = Column(Integer, ForeignKey("clinics.id"), nullable=False)
     appointment_datetime = Column(DateTime, nullable=False)
+    duration_minutes = Column(Integer, nullable=False, default=30, server_default="30")
     status = Column(String(20), default=AppointmentStatus.SCHEDULED)
     service_type = Column(String(100), nullable=True)
     notes = Column(Text, nullable=True)
     created_at = Column(SQLDateTime(timezone=True), server_default=func.now())
     updated_at = Column(SQLDateTime(timezone=True), onupdate=func.now())
+    # Версия строки для оптимистической блокировки, см. core/versioning.py
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     # Relationships
     patient = relationship("Patient", back_populates="appointments")
@@ -30,3 +35,17 @@ class Appointment(Base):
     registrar = relationship("User", foreign_keys=[registrar_id], back_populates="appointments_as_registrar")
     visits = relationship("Visit", back_populates="appointment")
     treatment_order = relationship("TreatmentOrder", back_populates="appointment")
+
+    __table_args__ = (
+        # Поиск занятых интервалов врача за период (свободные слоты, проверка пересечений).
+        # INCLUDE делает индекс покрывающим для календаря: /appointments/calendar читает только индекс
+        Index(
+            "ix_appointments_doctor_datetime",
+            "doctor_id",
+            "appointment_datetime",
+            postgresql_include=["id", "patient_id", "duration_minutes", "status", "service_type"]
+        ),
+        # Списки и расписание клиники за период
+        Index("ix_appointments_clinic_datetime", "clinic_id", "appointment_datetime"),
+    )
+    __mapper_args__ = {"version_id_col": version}
@@ -0,0 +1,56 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, Numeric, Index
+from sqlalchemy.sql import func
+from ..core.database import Base
+
+
+class ArchivedAppointment(Base):
+    """Архив записей на прием: отмененные и старые записи, перенесенные из appointments"""
+    __tablename__ = "appointments_archive"
+
+    # id сохраняется из appointments; внешних ключей нет, чтобы архив не мешал удалениям
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    patient_id = Column(Integer, nullable=False)
+    doctor_id = Column(Integer, nullable=True)
+    registrar_id = Column(Integer, nullable=False)
+    clinic_id = Column(Integer, nullable=True)
+    appointment_datetime = Column(DateTime, nullable=False)
+    duration_minutes = Column(Integer, nullable=False, default=30)
+    status = Column(String(20))
+    service_type = Column(String(100), nullable=True)
+    notes = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_appointments_archive_patient_datetime", "patient_id", "appointment_datetime"),
+        # MAX(appointment_datetime) — граница архива для read-through
+        Index("ix_appointments_archive_datetime", "appointment_datetime"),
+    )
+
+
+class ArchivedVisit(Base):
+    """Архив приемов старше горизонта хранения"""
+    __tablename__ = "visits_archive"
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    patient_id = Column(Integer, nullable=False)
+    doctor_id = Column(Integer, nullable=False)
+    clinic_id = Column(Integer, nullable=True)
+    appointment_id = Column(Integer, nullable=True)
+    visit_date = Column(DateTime, nullable=False)
+    service_id = Column(Integer, nullable=True)
+    service_name = Column(String(255), nullable=True)
+    service_price = Column(Numeric(10, 2), nullable=True)
+    diagnosis = Column(Text, nullable=True)
+    treatment_notes = Column(Text, nullable=True)
+    status = Column(String(50))
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_visits_archive_patient_visit_date", "patient_id", "visit_date"),
+        Index("ix_visits_archive_doctor_visit_date", "doctor_id", "visit_date"),
+        Index("ix_visits_archive_visit_date", "visit_date"),
+    )
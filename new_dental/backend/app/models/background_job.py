@@ -0,0 +1,31 @@
+from enum import Enum
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Text, Index
+from sqlalchemy.sql import func
+from ..core.database import Base
+
+
+class BackgroundJobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class BackgroundJob(Base):
+    """Фоновая задача для durable-режима очереди (TASK_QUEUE_MODE=database)"""
+    __tablename__ = "background_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(100), nullable=False)
+    payload = Column(JSON, nullable=True)
+    status = Column(String(20), nullable=False, default=BackgroundJobStatus.PENDING.value)
+    attempts = Column(Integer, nullable=False, default=0)
+    run_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    __table_args__ = (
+        # Выборка готовых к выполнению задач: WHERE status = 'pending' AND run_at <= now() ORDER BY run_at
+        Index("ix_background_jobs_status_run_at", "status", "run_at"),
+    )
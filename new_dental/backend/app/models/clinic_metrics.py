@@ -0,0 +1,48 @@
+from sqlalchemy import Column, Integer, Date, DateTime, ForeignKey, Numeric, Index, UniqueConstraint
+from sqlalchemy.sql import func
+from ..core.database import Base
+
+
+class ClinicDailyMetrics(Base):
+    """Показатели врача в клинике за день; поддерживаются core/metrics.py"""
+    __tablename__ = "clinic_daily_metrics"
+
+    id = Column(Integer, primary_key=True, index=True)
+    clinic_id = Column(Integer, ForeignKey("clinics.id"), nullable=False)
+    doctor_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    day = Column(Date, nullable=False)
+    appointments = Column(Integer, nullable=False, default=0, server_default="0")
+    completed = Column(Integer, nullable=False, default=0, server_default="0")
+    cancelled = Column(Integer, nullable=False, default=0, server_default="0")
+    patients = Column(Integer, nullable=False, default=0, server_default="0")  # Разные пациенты за день
+    revenue = Column(Numeric(12, 2), nullable=False, default=0, server_default="0")  # Сумма нарядов
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        UniqueConstraint("clinic_id", "doctor_id", "day", name="uq_clinic_daily_metrics_clinic_doctor_day"),
+        # Дашборд клиники за период
+        Index("ix_clinic_daily_metrics_clinic_day", "clinic_id", "day"),
+        # Пересчет затронутых дней врача
+        Index("ix_clinic_daily_metrics_doctor_day", "doctor_id", "day"),
+    )
+
+
+class ClinicDoctorPatient(Base):
+    """Пациент, хотя бы раз записанный к врачу в клинике; поддерживается core/metrics.py.
+
+    Число разных пациентов врача за всю историю не складывается из дневных показателей,
+    поэтому хранится отдельным множеством пар (врач, пациент).
+    """
+    __tablename__ = "clinic_doctor_patients"
+
+    id = Column(Integer, primary_key=True, index=True)
+    clinic_id = Column(Integer, ForeignKey("clinics.id"), nullable=False)
+    doctor_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
+
+    __table_args__ = (
+        # Пациенты врачей клиники (статистика по врачам)
+        UniqueConstraint("clinic_id", "doctor_id", "patient_id", name="uq_clinic_doctor_patients_clinic_doctor_patient"),
+        # Пересчет затронутых пар (врач, пациент)
+        Index("ix_clinic_doctor_patients_doctor_patient", "doctor_id", "patient_id"),
+    )
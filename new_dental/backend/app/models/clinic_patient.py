@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..core.database import Base
@@ -20,5 +20,16 @@ class ClinicPatient(Base):
     clinic = relationship("Clinic", back_populates="clinic_patients")
     patient = relationship("Patient", back_populates="clinic_patients")
 
+    __table_args__ = (
+        # Список пациентов клиники: последние визиты первыми, без визитов — в конце
+        Index(
+            "ix_clinic_patients_clinic_active_last_visit",
+            "clinic_id",
+            "is_active",
+            last_visit_date.desc().nullslast(),
+            id.desc()
+        ),
+    )
+
     def __repr__(self):
         return f"<ClinicPatient(id={self.id}, clinic_id={self.clinic_id}, patient_id={self.patient_id})>"
@@ -0,0 +1,86 @@
+"""
+Поддержание денормализованного clinic_id при записи.
+
+clinic_id хранится прямо в appointments, visits, treatment_plan_services и tooth_services,
+чтобы запросы в рамках клиники шли по индексам (clinic_id, ...) без JOIN с users.
+Перед каждым flush значение выставляется из источника истины:
+- запись на прием — клиника врача, а без врача — клиника регистратора;
+- прием — клиника врача;
+- план лечения без clinic_id — клиника врача;
+- услуги плана и услуги зубов — клиника плана.
+"""
+from typing import Dict, Optional
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from .appointment import Appointment
+from .visit import Visit
+from .treatment_plan import TreatmentPlan, TreatmentPlanService
+from .tooth_service import ToothService
+from .user import User
+
+
+def _changed(obj, *attributes) -> bool:
+    state = inspect(obj)
+    if state.pending or obj.clinic_id is None:
+        return True
+    return any(state.attrs[name].history.has_changes() for name in attributes)
+
+
+class _ClinicResolver:
+    """Кэш clinic_id пользователей и планов в рамках одного flush"""
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.users: Dict[int, Optional[int]] = {}
+        self.plans: Dict[int, Optional[int]] = {}
+
+    def user_clinic(self, user_id: Optional[int]) -> Optional[int]:
+        if user_id is None:
+            return None
+        if user_id not in self.users:
+            user = self.session.get(User, user_id)
+            self.users[user_id] = user.clinic_id if user else None
+        return self.users[user_id]
+
+    def plan_clinic(self, obj) -> Optional[int]:
+        # План мог быть создан в этом же flush и еще не иметь id
+        plan = obj.__dict__.get("treatment_plan")
+        if plan is not None:
+            return plan.clinic_id
+        if obj.treatment_plan_id is None:
+            return None
+        if obj.treatment_plan_id not in self.plans:
+            plan = self.session.get(TreatmentPlan, obj.treatment_plan_id)
+            self.plans[obj.treatment_plan_id] = plan.clinic_id if plan else None
+        return self.plans[obj.treatment_plan_id]
+
+
+@event.listens_for(Session, "before_flush")
+def _assign_clinic_ids(session: Session, flush_context, instances):
+    objects = list(session.new) + list(session.dirty)
+    if not objects:
+        return
+
+    resolver = _ClinicResolver(session)
+    with session.no_autoflush:
+        # Сначала планы: от них берут clinic_id услуги, добавленные в том же flush
+        for obj in objects:
+            if isinstance(obj, TreatmentPlan) and obj.clinic_id is None:
+                obj.clinic_id = resolver.user_clinic(obj.doctor_id)
+
+        for obj in objects:
+            if isinstance(obj, Appointment):
+                if _changed(obj, "doctor_id", "registrar_id"):
+                    clinic_id = resolver.user_clinic(obj.doctor_id) or resolver.user_clinic(obj.registrar_id)
+                    if clinic_id is not None:
+                        obj.clinic_id = clinic_id
+            elif isinstance(obj, Visit):
+                if _changed(obj, "doctor_id"):
+                    clinic_id = resolver.user_clinic(obj.doctor_id)
+                    if clinic_id is not None:
+                        obj.clinic_id = clinic_id
+            elif isinstance(obj, (TreatmentPlanService, ToothService)):
+                if _changed(obj, "treatment_plan_id"):
+                    clinic_id = resolver.plan_clinic(obj)
+                    if clinic_id is not None:
+                        obj.clinic_id = clinic_id
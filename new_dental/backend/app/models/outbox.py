@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Index
+from sqlalchemy.sql import func
+from ..core.database import Base
+
+
+class OutboxEvent(Base):
+    """Событие для real-time уведомлений, записанное в той же транзакции, что и изменение данных"""
+    __tablename__ = "outbox_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    event_type = Column(String(50), nullable=False)  # appointment_created / appointment_updated
+    aggregate_type = Column(String(50), nullable=False)  # appointment
+    aggregate_id = Column(Integer, nullable=False)
+    doctor_id = Column(Integer, nullable=True)  # Получатели уведомления
+    user_id = Column(Integer, nullable=True)
+    payload = Column(JSON, nullable=True)  # Дополнительные данные, если не хватает агрегата
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    dispatched_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # Диспетчер выбирает только неотправленные события — частичный индекс остается маленьким
+        Index("ix_outbox_events_pending", "id", postgresql_where=dispatched_at.is_(None)),
+        # Рассылка в каждом воркере читает события, опубликованные после своего курсора
+        Index("ix_outbox_events_dispatched_at", "dispatched_at"),
+    )
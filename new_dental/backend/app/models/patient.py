@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Date, DateTime, Text
+from sqlalchemy import Column, Integer, String, Date, DateTime, Text, Index, event, inspect
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..core.database import Base
+from ..core.search_key import patient_search_key
 
 
 class Patient(Base):
@@ -18,6 +19,8 @@ class Patient(Base):
     special_notes = Column(Text, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # ФИО (транслит, нижний регистр), цифры телефона и ИИН для поиска, см. core/search_key.py
+    search_key = Column(String(400), nullable=True)
 
     # Relationships
     appointments = relationship("Appointment", back_populates="patient")
@@ -26,5 +29,26 @@ class Patient(Base):
     visits = relationship("Visit", back_populates="patient")
     clinic_patients = relationship("ClinicPatient", back_populates="patient")
 
+    __table_args__ = (
+        # LIKE '%слово%' по ключу поиска (расширение pg_trgm, см. add_patient_search_key.py)
+        Index(
+            "ix_patients_search_key_trgm",
+            "search_key",
+            postgresql_using="gin",
+            postgresql_ops={"search_key": "gin_trgm_ops"}
+        ),
+    )
+
     def __repr__(self):
-        return f"<Patient(id={self.id}, full_name='{self.full_name}', phone='{self.phone}')>"
\ No newline at end of file
+        return f"<Patient(id={self.id}, full_name='{self.full_name}', phone='{self.phone}')>"
+
+
+@event.listens_for(Patient, "before_insert")
+@event.listens_for(Patient, "before_update")
+def _update_search_key(mapper, connection, target: Patient):
+    # Core-вставки (импорт пациентов) заполняют search_key сами
+    state = inspect(target)
+    if state.pending or target.search_key is None or any(
+        state.attrs[name].history.has_changes() for name in ("full_name", "phone", "iin")
+    ):
+        target.search_key = patient_search_key(target.full_name, target.phone, target.iin)
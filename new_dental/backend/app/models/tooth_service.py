@@ -1,16 +1,78 @@
-from sqlalchemy import Column, Integer, ForeignKey, JSON
+from enum import Enum
+from typing import Dict, List, Optional
+from sqlalchemy import Column, Integer, ForeignKey, Index, String, DateTime, UniqueConstraint
 from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
 from ..core.database import Base
 
 
+class ServiceStatus(str, Enum):
+    PENDING = "pending"
+    COMPLETED = "completed"
+
+
 class ToothService(Base):
     __tablename__ = "tooth_services"
 
     id = Column(Integer, primary_key=True, index=True)
     treatment_plan_id = Column(Integer, ForeignKey("treatment_plans.id"), nullable=False)
+    clinic_id = Column(Integer, ForeignKey("clinics.id"), nullable=False)  # Денормализовано из плана
     tooth_id = Column(Integer, nullable=False)  # ID зуба (например, 11, 12, 21, 22, etc.)
-    service_ids = Column(JSON, nullable=False)  # Массив ID услуг для этого зуба
-    service_statuses = Column(JSON, nullable=True)  # Статусы услуг: {service_id: "completed"/"pending"}
 
     # Relationships
     treatment_plan = relationship("TreatmentPlan", back_populates="tooth_services")
+    # Услуги зуба и их статусы (раньше — JSON service_ids/service_statuses, см. migrate_tooth_service_statuses.py)
+    statuses = relationship(
+        "ToothServiceStatus",
+        back_populates="tooth_service",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        order_by="ToothServiceStatus.id",
+        lazy="selectin"
+    )
+
+    __table_args__ = (
+        Index("ix_tooth_services_clinic_plan", "clinic_id", "treatment_plan_id"),
+    )
+
+    @property
+    def service_ids(self) -> List[int]:
+        return [status.service_id for status in self.statuses]
+
+    @property
+    def service_statuses(self) -> Dict[int, str]:
+        return {status.service_id: status.status for status in self.statuses}
+
+    def set_services(self, service_ids: List[int], service_statuses: Optional[Dict[int, str]] = None):
+        """Привести услуги зуба к service_ids; статус сохраняется, если не передан в service_statuses"""
+        service_statuses = service_statuses or {}
+        current = {status.service_id: status for status in self.statuses}
+        statuses = []
+        for service_id in dict.fromkeys(service_ids):
+            row = current.get(service_id)
+            if row is None:
+                row = ToothServiceStatus(service_id=service_id, status=service_statuses.get(service_id, ServiceStatus.PENDING))
+            elif service_id in service_statuses:
+                row.status = service_statuses[service_id]
+            statuses.append(row)
+        # Услуги, которых нет в списке, удаляются (delete-orphan)
+        self.statuses = statuses
+
+
+class ToothServiceStatus(Base):
+    __tablename__ = "tooth_service_statuses"
+
+    id = Column(Integer, primary_key=True, index=True)
+    tooth_service_id = Column(Integer, ForeignKey("tooth_services.id", ondelete="CASCADE"), nullable=False)
+    service_id = Column(Integer, ForeignKey("services.id"), nullable=False)
+    status = Column(String(20), nullable=False, default=ServiceStatus.PENDING.value, server_default=ServiceStatus.PENDING.value)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    # Relationships
+    tooth_service = relationship("ToothService", back_populates="statuses")
+
+    __table_args__ = (
+        UniqueConstraint("tooth_service_id", "service_id", name="uq_tooth_service_statuses_tooth_service_service"),
+        # Выборки вида «все невыполненные услуги» по всем пациентам
+        Index("ix_tooth_service_statuses_status_service", "status", "service_id"),
+    )
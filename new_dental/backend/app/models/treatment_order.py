@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Numeric, ForeignKey, DateTime, Text, String
+from sqlalchemy import Column, Integer, Numeric, ForeignKey, DateTime, Text, String, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..core.database import Base
@@ -16,6 +16,7 @@ class TreatmentOrder(Base):
     status = Column(String(50), default="completed")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     clinic_id = Column(Integer, ForeignKey("clinics.id"), nullable=False) # Added clinic_id
+    version = Column(Integer, nullable=False, default=1, server_default="1") # Версия для оптимистической блокировки
 
     patient = relationship("Patient", back_populates="treatment_orders")
     creator = relationship("User", back_populates="created_treatment_orders")
@@ -23,6 +24,12 @@ class TreatmentOrder(Base):
     services = relationship("TreatmentOrderService", back_populates="treatment_order", cascade="all, delete-orphan")
     clinic = relationship("Clinic", back_populates="treatment_orders") # Added clinic relationship
 
+    __table_args__ = (
+        # Отчеты по выручке клиники за период (/reports/revenue)
+        Index("ix_treatment_orders_clinic_visit_date", "clinic_id", "visit_date"),
+    )
+    __mapper_args__ = {"version_id_col": version}
+
 
 class TreatmentOrderService(Base):
     __tablename__ = "treatment_order_services"
@@ -39,3 +46,8 @@ class TreatmentOrderService(Base):
 
     treatment_order = relationship("TreatmentOrder", back_populates="services")
     service = relationship("Service")
+
+    __table_args__ = (
+        # Строки нарядов при соединении с treatment_orders (услуги наряда, отчет по услугам)
+        Index("ix_treatment_order_services_order", "treatment_order_id"),
+    )
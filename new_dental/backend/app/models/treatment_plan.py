@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Text, ForeignKey, DateTime, String, Numeric, JSON
+from sqlalchemy import Column, Integer, Text, ForeignKey, DateTime, String, Numeric, JSON, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..core.database import Base
@@ -16,6 +16,8 @@ class TreatmentPlan(Base):
     treated_teeth = Column(JSON, nullable=True)  # Массив ID вылеченных зубов
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # Версия строки для оптимистической блокировки, см. core/versioning.py
+    version = Column(Integer, nullable=False, default=1, server_default="1")
 
     # Relationships
     patient = relationship("Patient", back_populates="treatment_plans")
@@ -23,12 +25,15 @@ class TreatmentPlan(Base):
     services = relationship("TreatmentPlanService", back_populates="treatment_plan", cascade="all, delete-orphan")
     tooth_services = relationship("ToothService", back_populates="treatment_plan")
 
+    __mapper_args__ = {"version_id_col": version}
+
 
 class TreatmentPlanService(Base):
     __tablename__ = "treatment_plan_services"
 
     id = Column(Integer, primary_key=True, index=True)
     treatment_plan_id = Column(Integer, ForeignKey("treatment_plans.id"), nullable=False)
+    clinic_id = Column(Integer, ForeignKey("clinics.id"), nullable=False)  # Денормализовано из плана
     service_id = Column(Integer, ForeignKey("services.id"), nullable=False)
     tooth_id = Column(Integer, nullable=False)  # Добавлено поле tooth_id
     service_name = Column(String(255), nullable=False)  # Добавлено поле service_name
@@ -40,3 +45,7 @@ class TreatmentPlanService(Base):
     # Relationships
     treatment_plan = relationship("TreatmentPlan", back_populates="services")
     service = relationship("Service", back_populates="treatment_plan_services")
+
+    __table_args__ = (
+        Index("ix_treatment_plan_services_clinic_plan", "clinic_id", "treatment_plan_id"),
+    )
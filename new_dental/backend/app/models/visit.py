@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Numeric
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Numeric, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..core.database import Base
@@ -10,6 +10,7 @@ class Visit(Base):
     id = Column(Integer, primary_key=True, index=True)
     patient_id = Column(Integer, ForeignKey("patients.id"), nullable=False)
     doctor_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    clinic_id = Column(Integer, ForeignKey("clinics.id"), nullable=False)  # Денормализовано из врача
     appointment_id = Column(Integer, ForeignKey("appointments.id"), nullable=True)
     visit_date = Column(DateTime, nullable=False)
     service_id = Column(Integer, ForeignKey("services.id"), nullable=True)
@@ -27,5 +28,9 @@ class Visit(Base):
     appointment = relationship("Appointment", back_populates="visits")
     service = relationship("Service", foreign_keys=[service_id])
 
+    __table_args__ = (
+        Index("ix_visits_clinic_visit_date", "clinic_id", "visit_date"),
+    )
+
     def __repr__(self):
         return f"<Visit(id={self.id}, patient_id={self.patient_id}, doctor_id={self.doctor_id}, visit_date={self.visit_date})>"
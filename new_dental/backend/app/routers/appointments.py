@@ -1,14 +1,78 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, Response, status, Query
+from fastapi.responses import JSONResponse
+from sqlalchemy import bindparam, insert, select, union_all, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from typing import List, Optional
+from datetime import date, datetime, time, timedelta
 from ..core.database import get_db
 from ..core.dependencies import require_registrar_or_above
+from ..core.archive import archive_reaches
+from ..core.idempotency import IdempotentRequest, idempotency
+from ..core.metrics import mark_doctor_patients_changed, mark_metrics_changed
+from ..core.outbox import enqueue_event
+from ..core.patient_summary import mark_patient_summary_changed
+from ..core.partitions import naive_datetime
+from ..core.scheduling import (
+    expand_recurrence,
+    find_conflicts,
+    find_free_slots,
+    load_doctor_schedule,
+    lock_doctor,
+    mark_schedule_days_changed,
+)
+from ..core.tasks import background_task, enqueue_task
+from ..core.versioning import check_version, commit_versioned, if_match_version, set_etag
 from ..models.user import User
 from ..models.appointment import Appointment
-from ..schemas.appointment import AppointmentCreate, AppointmentUpdate, AppointmentResponse
+from ..models.archive import ArchivedAppointment
+from ..schemas.appointment import (
+    AppointmentCreate,
+    AppointmentUpdate,
+    AppointmentResponse,
+    FreeSlotsResponse,
+    AppointmentBulkCreate,
+    AppointmentBulkReschedule,
+)
 
 router = APIRouter()
 
+# Максимальный период поиска свободных слотов, дней
+FREE_SLOTS_MAX_DAYS = 31
+# Максимальный период календаря (месячная сетка с соседними неделями), дней
+CALENDAR_MAX_DAYS = 42
+
+# Колонки строк ответа /appointments/calendar
+CALENDAR_COLUMNS = ["id", "doctor_id", "patient_id", "start", "duration_minutes", "status", "service_type"]
+
+# Максимальное количество записей в одном bulk-запросе
+BULK_MAX_APPOINTMENTS = 100
+
+SLOT_TAKEN_DETAIL = "У врача уже есть запись на это время"
+
+
+def ensure_slot_available(db: Session, doctor_id: int, start, duration_minutes: int, exclude_id: int = None):
+    """Проверить, что интервал врача свободен; блокирует врача до конца транзакции"""
+    lock_doctor(db, doctor_id)
+    conflicts = find_conflicts(db, doctor_id, start, duration_minutes, exclude_id=exclude_id)
+    if conflicts:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": SLOT_TAKEN_DETAIL, "conflicting_appointment_ids": conflicts}
+        )
+
+
+def commit_appointment(db: Session):
+    """Коммит с переводом нарушения ограничения пересечения записей (PostgreSQL) и конфликта версий в 409"""
+    try:
+        commit_versioned(db)
+    except IntegrityError as e:
+        db.rollback()
+        # appointments_no_overlap или appointments_YYYY_MM_no_overlap в секционированной таблице
+        if "_no_overlap" in str(e.orig):
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail={"message": SLOT_TAKEN_DETAIL})
+        raise
+
 
 @router.get("/", response_model=List[AppointmentResponse])
 async def get_appointments(
@@ -27,53 +91,72 @@ async def get_appointments(
 ):
     from ..models.patient import Patient
     
-    query = db.query(Appointment).join(Patient, Appointment.patient_id == Patient.id)
-    
-    if patient_id:
-        query = query.filter(Appointment.patient_id == patient_id)
-    if doctor_id:
-        query = query.filter(Appointment.doctor_id == doctor_id)
-    if status:
-        query = query.filter(Appointment.status == status)
-    
-    # Фильтрация по клинике
-    if clinic_id:
-        from ..models.user import User
-        query = query.join(User, Appointment.doctor_id == User.id).filter(User.clinic_id == clinic_id)
-    
-    # Поиск по данным пациента
-    if search:
-        search_term = f"%{search.strip()}%"
-        query = query.filter(
-            (Patient.full_name.ilike(search_term)) |
-            (Patient.phone.ilike(search_term)) |
-            (Patient.iin.ilike(search_term))
-        )
+    # Фильтры по датам сравнивают столбец с наивным datetime — так работают индекс
+    # и отсечение месячных секций appointments
+    range_start = range_end = None
+    range_end_inclusive = True
     
-    # Фильтр по текущей неделе
+    # Фильтр по текущей неделе: [понедельник 00:00, следующий понедельник 00:00)
     if current_week_only:
-        from datetime import datetime, timedelta
-        today = datetime.now()  # Убираем хардкод года
-        start_of_week = today - timedelta(days=today.weekday())
-        end_of_week = start_of_week + timedelta(days=6)
-        
-        query = query.filter(
-            Appointment.appointment_datetime >= start_of_week,
-            Appointment.appointment_datetime <= end_of_week
-        )
+        today = date.today()
+        range_start = datetime.combine(today - timedelta(days=today.weekday()), time.min)
+        range_end = range_start + timedelta(days=7)
+        range_end_inclusive = False
     
     # Фильтр по диапазону дат
     if start_date:
-        from datetime import datetime
-        start_datetime = datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-        query = query.filter(Appointment.appointment_datetime >= start_datetime)
-    
+        range_start = naive_datetime(datetime.fromisoformat(start_date.replace('Z', '+00:00')))
     if end_date:
-        from datetime import datetime
-        end_datetime = datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-        query = query.filter(Appointment.appointment_datetime <= end_datetime)
+        range_end = naive_datetime(datetime.fromisoformat(end_date.replace('Z', '+00:00')))
+        range_end_inclusive = True
     
-    appointments = query.offset(skip).limit(limit).all()
+    def conditions(model):
+        """Условия выборки; одинаково применяются к горячей таблице и к архиву"""
+        result = []
+        if patient_id:
+            result.append(model.patient_id == patient_id)
+        if doctor_id:
+            result.append(model.doctor_id == doctor_id)
+        if status:
+            result.append(model.status == status)
+        # Фильтрация по клинике (clinic_id хранится в самой записи, включая записи без врача)
+        if clinic_id:
+            result.append(model.clinic_id == clinic_id)
+        # Поиск по данным пациента
+        if search:
+            search_term = f"%{search.strip()}%"
+            result.append(
+                (Patient.full_name.ilike(search_term)) |
+                (Patient.phone.ilike(search_term)) |
+                (Patient.iin.ilike(search_term))
+            )
+        if range_start:
+            result.append(model.appointment_datetime >= range_start)
+        if range_end:
+            result.append(
+                model.appointment_datetime <= range_end if range_end_inclusive
+                else model.appointment_datetime < range_end
+            )
+        return result
+    
+    # История пациента подмешивает архив, только если запрошенный период доходит до него
+    if patient_id and archive_reaches(db, ArchivedAppointment.appointment_datetime, range_start):
+        columns = [
+            "id", "patient_id", "doctor_id", "registrar_id", "appointment_datetime", "duration_minutes",
+            "status", "service_type", "notes", "created_at", "updated_at"
+        ]
+        history = union_all(*[
+            select(*[model.__table__.c[name] for name in columns]).join(
+                Patient, model.patient_id == Patient.id
+            ).where(*conditions(model))
+            for model in (Appointment, ArchivedAppointment)
+        ]).subquery()
+        appointments = db.execute(
+            select(history).order_by(history.c.appointment_datetime.desc()).offset(skip).limit(limit)
+        ).all()
+    else:
+        query = db.query(Appointment).join(Patient, Appointment.patient_id == Patient.id).filter(*conditions(Appointment))
+        appointments = query.offset(skip).limit(limit).all()
     
     # Преобразуем в формат с данными пациента
     result = []
@@ -85,11 +168,14 @@ async def get_appointments(
             "doctor_id": appointment.doctor_id,
             "registrar_id": appointment.registrar_id,
             "appointment_datetime": appointment.appointment_datetime,
+            "duration_minutes": appointment.duration_minutes,
             "status": appointment.status,
             "service_type": appointment.service_type,
             "notes": appointment.notes,
             "created_at": appointment.created_at,
             "updated_at": appointment.updated_at,
+            # В строках архива версии нет
+            "version": getattr(appointment, "version", None),
             "patient_name": patient.full_name if patient else None,
             "patient_phone": patient.phone if patient else None,
             "patient_iin": patient.iin if patient else None,
@@ -104,84 +190,370 @@ async def get_appointments(
     return result
 
 
+@router.get("/free-slots", response_model=FreeSlotsResponse)
+async def get_free_slots(
+    doctor_id: int,
+    date_from: date,
+    date_to: date,
+    duration: int = Query(30, ge=5, le=480, description="Длительность приема в минутах"),
+    work_start: time = Query(time(9, 0), description="Начало рабочего дня"),
+    work_end: time = Query(time(18, 0), description="Конец рабочего дня"),
+    step: int = Query(15, ge=5, le=240, description="Шаг сетки слотов в минутах"),
+    limit: int = Query(200, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_registrar_or_above)
+):
+    """Свободные слоты врача в рабочие часы за период"""
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="date_to не может быть раньше date_from")
+    if date_to - date_from > timedelta(days=FREE_SLOTS_MAX_DAYS):
+        raise HTTPException(status_code=400, detail=f"Период поиска не может превышать {FREE_SLOTS_MAX_DAYS} дней")
+    if work_end <= work_start:
+        raise HTTPException(status_code=400, detail="work_end должен быть позже work_start")
+
+    slots = find_free_slots(db, doctor_id, date_from, date_to, duration, work_start, work_end, step, limit)
+    return {"doctor_id": doctor_id, "duration_minutes": duration, "slots": slots}
+
+
+@router.get("/calendar")
+async def get_calendar(
+    date_from: date,
+    date_to: date,
+    doctor_id: List[int] = Query(..., description="ID врачей (можно несколько: ?doctor_id=1&doctor_id=2)"),
+    include_cancelled: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_registrar_or_above)
+):
+    """Компактные данные для сетки календаря за период [date_from, date_to] включительно.
+
+    Записи возвращаются массивами в порядке ``columns``; имена пациентов — отдельным
+    словарем ``patients`` без повторов. Запрос по записям читает только покрывающий
+    индекс ix_appointments_doctor_datetime.
+    """
+    from ..models.patient import Patient
+
+    if date_to < date_from:
+        raise HTTPException(status_code=400, detail="date_to не может быть раньше date_from")
+    if date_to - date_from > timedelta(days=CALENDAR_MAX_DAYS):
+        raise HTTPException(status_code=400, detail=f"Период календаря не может превышать {CALENDAR_MAX_DAYS} дней")
+
+    query = db.query(
+        Appointment.id,
+        Appointment.doctor_id,
+        Appointment.patient_id,
+        Appointment.appointment_datetime,
+        Appointment.duration_minutes,
+        Appointment.status,
+        Appointment.service_type
+    ).filter(
+        Appointment.doctor_id.in_(doctor_id),
+        Appointment.appointment_datetime >= datetime.combine(date_from, time.min),
+        Appointment.appointment_datetime < datetime.combine(date_to + timedelta(days=1), time.min)
+    )
+    if not include_cancelled:
+        query = query.filter(Appointment.status != "cancelled")
+
+    rows = []
+    patient_ids = set()
+    for appointment_id, doctor, patient_id, start, duration, appointment_status, service_type in query.order_by(
+        Appointment.appointment_datetime
+    ):
+        rows.append([
+            appointment_id,
+            doctor,
+            patient_id,
+            start.isoformat(timespec="minutes"),
+            duration,
+            appointment_status,
+            service_type
+        ])
+        patient_ids.add(patient_id)
+
+    patients = {}
+    if patient_ids:
+        patients = {
+            str(patient_id): full_name
+            for patient_id, full_name in db.query(Patient.id, Patient.full_name).filter(Patient.id.in_(patient_ids))
+        }
+
+    # Данные уже состоят из примитивов — отдаем без повторной сериализации через модели
+    return JSONResponse(content={
+        "date_from": date_from.isoformat(),
+        "date_to": date_to.isoformat(),
+        "columns": CALENDAR_COLUMNS,
+        "rows": rows,
+        "patients": patients,
+    })
+
+
 @router.post("/", response_model=AppointmentResponse)
 async def create_appointment(
     appointment: AppointmentCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_registrar_or_above)
+    current_user: User = Depends(require_registrar_or_above),
+    idempotent: IdempotentRequest = Depends(idempotency)
 ):
-    from ..models.clinic_patient import ClinicPatient
-    from datetime import datetime
-    from ..routers.websocket import notify_appointment_created
+    replay = idempotent.replay()
+    if replay is not None:
+        return replay
+
+    if appointment.doctor_id:
+        ensure_slot_available(db, appointment.doctor_id, appointment.appointment_datetime, appointment.duration_minutes)
     
-    # Создаем запись
-    db_appointment = Appointment(**appointment.dict())
+    # Создаем запись; время со смещением — в местное, как при проверке пересечений
+    db_appointment = Appointment(**{
+        **appointment.dict(),
+        "appointment_datetime": naive_datetime(appointment.appointment_datetime)
+    })
     db.add(db_appointment)
     
-    # Автоматически привязываем пациента к клинике врача (если врач указан)
+    # Привязка пациента к клинике врача не нужна для ответа — выполняется в фоне после коммита
     if appointment.doctor_id:
-        doctor = db.query(User).filter(User.id == appointment.doctor_id).first()
-        if doctor and doctor.clinic_id:
-            # Проверяем, не привязан ли уже пациент к этой клинике
-            existing_clinic_patient = db.query(ClinicPatient).filter(
-                ClinicPatient.clinic_id == doctor.clinic_id,
-                ClinicPatient.patient_id == appointment.patient_id,
-                ClinicPatient.is_active == True
-            ).first()
-            
-            if not existing_clinic_patient:
-                # Создаем новую связь пациент-клиника
-                clinic_patient = ClinicPatient(
-                    clinic_id=doctor.clinic_id,
-                    patient_id=appointment.patient_id,
-                    first_visit_date=datetime.now(),
-                    is_active=True
-                )
-                db.add(clinic_patient)
-                print(f"✅ Пациент {appointment.patient_id} автоматически привязан к клинике {doctor.clinic_id}")
+        enqueue_task(
+            db,
+            "bind_patient_to_doctor_clinic",
+            doctor_id=appointment.doctor_id,
+            patient_id=appointment.patient_id
+        )
+    
+    # Уведомление записываем в outbox в той же транзакции — отправит фоновый диспетчер
+    db.flush()
+    enqueue_event(
+        db,
+        "appointment_created",
+        "appointment",
+        db_appointment.id,
+        doctor_id=db_appointment.doctor_id,
+        user_id=current_user.id
+    )
     
-    db.commit()
+    commit_appointment(db)
     db.refresh(db_appointment)
     
-    # Отправляем WebSocket уведомление о новой записи
-    try:
-        # Получаем данные пациента для уведомления
-        patient = db.query(Patient).filter(Patient.id == db_appointment.patient_id).first()
-        appointment_data = {
-            "id": db_appointment.id,
-            "patient_id": db_appointment.patient_id,
-            "doctor_id": db_appointment.doctor_id,
-            "appointment_datetime": db_appointment.appointment_datetime.isoformat() if db_appointment.appointment_datetime else None,
-            "status": db_appointment.status,
-            "service_type": db_appointment.service_type,
-            "notes": db_appointment.notes,
-            "patient_name": patient.full_name if patient else None,
-            "patient_phone": patient.phone if patient else None,
-            "created_at": db_appointment.created_at.isoformat() if db_appointment.created_at else None
-        }
-        
-        # Уведомляем врача и текущего пользователя
-        await notify_appointment_created(
-            appointment_data, 
-            doctor_id=db_appointment.doctor_id,
-            user_id=current_user.id
+    return idempotent.remember(AppointmentResponse, db_appointment)
+
+
+@router.post("/bulk")
+async def create_appointments_bulk(
+    payload: AppointmentBulkCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_registrar_or_above)
+):
+    """Создать серию записей (курс лечения) одной транзакцией"""
+    if (payload.datetimes is None) == (payload.recurrence is None):
+        raise HTTPException(status_code=400, detail="Укажите либо datetimes, либо recurrence")
+
+    if payload.recurrence is not None:
+        rule = payload.recurrence
+        if rule.count is None and rule.until is None:
+            raise HTTPException(status_code=400, detail="Для recurrence укажите count или until")
+        # Серию разворачиваем в местном времени: until сравнивается с местной датой
+        starts = expand_recurrence(naive_datetime(rule.start), rule.frequency, rule.interval, rule.count, rule.until, BULK_MAX_APPOINTMENTS)
+    else:
+        starts = list(payload.datetimes)
+
+    # appointment_datetime хранится без часового пояса: время со смещением — в местное
+    starts = sorted({naive_datetime(start) for start in starts})
+    if not starts:
+        raise HTTPException(status_code=400, detail="Нет ни одного времени приема")
+    if len(starts) > BULK_MAX_APPOINTMENTS:
+        raise HTTPException(status_code=400, detail=f"Не больше {BULK_MAX_APPOINTMENTS} записей за один запрос")
+
+    # Клиника записи — клиника врача, без врача — регистратора (как в clinic_scope)
+    owner_id = payload.doctor_id or payload.registrar_id
+    clinic_id = db.query(User.clinic_id).filter(User.id == owner_id).scalar()
+    if clinic_id is None:
+        raise HTTPException(status_code=404, detail="Врач не найден" if payload.doctor_id else "Регистратор не найден")
+
+    duration = timedelta(minutes=payload.duration_minutes)
+    skipped = []
+    if payload.doctor_id:
+        # Один замок и одна выборка занятых интервалов на всю серию
+        lock_doctor(db, payload.doctor_id)
+        schedule = load_doctor_schedule(db, payload.doctor_id, starts[0], starts[-1] + duration)
+        free = []
+        for index, start in enumerate(starts):
+            if schedule.conflicts(start, start + duration):
+                skipped.append(start)
+                continue
+            # Приемы серии не должны пересекаться и между собой
+            schedule.add(start, start + duration, -(index + 1))
+            free.append(start)
+        if skipped and not payload.skip_conflicts:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail={"message": SLOT_TAKEN_DETAIL, "conflicting_datetimes": [start.isoformat() for start in skipped]}
+            )
+        starts = free
+
+    created = []
+    if starts:
+        rows = [
+            {
+                "patient_id": payload.patient_id,
+                "doctor_id": payload.doctor_id,
+                "registrar_id": payload.registrar_id,
+                "clinic_id": clinic_id,
+                "appointment_datetime": start,
+                "duration_minutes": payload.duration_minutes,
+                "status": "scheduled",
+                "service_type": payload.service_type,
+                "notes": payload.notes,
+            }
+            for start in starts
+        ]
+        # Одна многострочная вставка вместо INSERT на каждую запись
+        result = db.execute(
+            insert(Appointment).returning(Appointment.id, Appointment.appointment_datetime),
+            rows
         )
-        print(f"📡 WebSocket уведомление отправлено для записи {db_appointment.id}")
-    except Exception as e:
-        print(f"❌ Ошибка отправки WebSocket уведомления: {e}")
-    
-    return db_appointment
+        created = [{"id": row.id, "appointment_datetime": row.appointment_datetime} for row in result]
+        mark_schedule_days_changed(db, {start.date() for start in starts})
+        mark_metrics_changed(db, {(payload.doctor_id, start.date()) for start in starts})
+        mark_doctor_patients_changed(db, {(payload.doctor_id, payload.patient_id)})
+        mark_patient_summary_changed(db, {payload.patient_id})
+
+        if payload.doctor_id:
+            enqueue_task(db, "bind_patient_to_doctor_clinic", doctor_id=payload.doctor_id, patient_id=payload.patient_id)
+
+        # Одно уведомление на всю серию
+        enqueue_event(
+            db,
+            "appointments_batch",
+            "appointment_batch",
+            created[0]["id"],
+            doctor_id=payload.doctor_id,
+            user_id=current_user.id,
+            payload={
+                "action": "created",
+                "doctor_id": payload.doctor_id,
+                "patient_id": payload.patient_id,
+                "appointment_ids": [item["id"] for item in created],
+                "dates": sorted({start.date().isoformat() for start in starts}),
+            }
+        )
+
+    commit_appointment(db)
+    return {"created": created, "skipped": skipped}
+
+
+@router.patch("/bulk")
+async def reschedule_appointments_bulk(
+    payload: AppointmentBulkReschedule,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_registrar_or_above)
+):
+    """Перенести все запланированные записи врача за день на другой день и/или к другому врачу"""
+    target_date = payload.target_date or payload.date
+    target_doctor_id = payload.target_doctor_id or payload.doctor_id
+    if target_date == payload.date and target_doctor_id == payload.doctor_id:
+        raise HTTPException(status_code=400, detail="Укажите target_date или target_doctor_id")
+
+    target_clinic_id = db.query(User.clinic_id).filter(User.id == target_doctor_id).scalar()
+    if target_clinic_id is None:
+        raise HTTPException(status_code=404, detail="Врач не найден")
+
+    # Замки обоих врачей (по возрастанию id, как в core/metrics): записи уходят из расписания
+    # исходного врача и не должны меняться между выборкой и переносом
+    for doctor_id in sorted({payload.doctor_id, target_doctor_id}):
+        lock_doctor(db, doctor_id)
+
+    day_start = datetime.combine(payload.date, time.min)
+    appointments = db.query(
+        Appointment.id,
+        Appointment.appointment_datetime,
+        Appointment.duration_minutes,
+        Appointment.patient_id
+    ).filter(
+        Appointment.doctor_id == payload.doctor_id,
+        Appointment.appointment_datetime >= day_start,
+        Appointment.appointment_datetime < day_start + timedelta(days=1),
+        Appointment.status == "scheduled"
+    ).order_by(Appointment.appointment_datetime).all()
+
+    if not appointments:
+        return {"moved": [], "count": 0}
+
+    shift = target_date - payload.date
+    moves = [
+        (appointment_id, start + shift, timedelta(minutes=duration or 30))
+        for appointment_id, start, duration, _ in appointments
+    ]
+    moved_ids = {appointment_id for appointment_id, _, _ in moves}
+
+    # Проверяем все переносимые записи за один проход по расписанию целевого врача
+    schedule = load_doctor_schedule(db, target_doctor_id, moves[0][1], moves[-1][1] + max(d for _, _, d in moves))
+    conflicts = []
+    for appointment_id, start, duration in moves:
+        blocking = [other for other in schedule.conflicts(start, start + duration) if other not in moved_ids]
+        if blocking:
+            conflicts.append({"appointment_id": appointment_id, "conflicting_appointment_ids": blocking})
+    if conflicts:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": SLOT_TAKEN_DETAIL, "conflicts": conflicts}
+        )
+
+    # Одно UPDATE по первичным ключам для всех записей; версия растет, как при изменении
+    # через ORM, — правки со старым If-Match получат 412
+    appointments_table = Appointment.__table__
+    db.execute(
+        update(appointments_table).where(appointments_table.c.id == bindparam("moved_id")).values(
+            appointment_datetime=bindparam("new_datetime"),
+            doctor_id=target_doctor_id,
+            clinic_id=target_clinic_id,
+            version=appointments_table.c.version + 1
+        ),
+        [{"moved_id": appointment_id, "new_datetime": start} for appointment_id, start, _ in moves]
+    )
+    mark_schedule_days_changed(db, {payload.date, target_date})
+    mark_metrics_changed(db, {(payload.doctor_id, payload.date), (target_doctor_id, target_date)})
+    if target_doctor_id != payload.doctor_id:
+        mark_doctor_patients_changed(db, {
+            (doctor_id, appointment.patient_id)
+            for appointment in appointments
+            for doctor_id in (payload.doctor_id, target_doctor_id)
+        })
+    mark_patient_summary_changed(db, {appointment.patient_id for appointment in appointments})
+
+    event_payload = {
+        "action": "rescheduled",
+        "appointment_ids": sorted(moved_ids),
+        "from": {"doctor_id": payload.doctor_id, "date": payload.date.isoformat()},
+        "to": {"doctor_id": target_doctor_id, "date": target_date.isoformat()},
+    }
+    for doctor in {payload.doctor_id, target_doctor_id}:
+        enqueue_event(
+            db,
+            "appointments_batch",
+            "appointment_batch",
+            moves[0][0],
+            doctor_id=doctor,
+            user_id=current_user.id if doctor == payload.doctor_id else None,
+            payload=event_payload
+        )
+
+    commit_appointment(db)
+    return {
+        "moved": [{"id": appointment_id, "appointment_datetime": start} for appointment_id, start, _ in moves],
+        "count": len(moves),
+    }
 
 
 @router.get("/{appointment_id}", response_model=AppointmentResponse)
 async def get_appointment(
     appointment_id: int,
+    response: Response,
     db: Session = Depends(get_db),
     current_user: User = Depends(require_registrar_or_above)
 ):
     appointment = db.query(Appointment).filter(Appointment.id == appointment_id).first()
+    if appointment is None:
+        # Отмененные и старые записи могли быть перенесены в архив
+        appointment = db.query(ArchivedAppointment).filter(ArchivedAppointment.id == appointment_id).first()
     if appointment is None:
         raise HTTPException(status_code=404, detail="Appointment not found")
+    set_etag(response, getattr(appointment, "version", None))
     return appointment
 
 
@@ -189,68 +561,63 @@ async def get_appointment(
 async def update_appointment(
     appointment_id: int,
     appointment: AppointmentUpdate,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_registrar_or_above)
+    current_user: User = Depends(require_registrar_or_above),
+    expected_version: Optional[int] = Depends(if_match_version)
 ):
-    from ..models.clinic_patient import ClinicPatient
     from datetime import datetime
-    from ..routers.websocket import notify_appointment_updated
     
     db_appointment = db.query(Appointment).filter(Appointment.id == appointment_id).first()
     if db_appointment is None:
         raise HTTPException(status_code=404, detail="Appointment not found")
+    check_version(db_appointment, expected_version)
     
     # Сохраняем старый статус для проверки изменений
     old_status = db_appointment.status
     
-    for field, value in appointment.dict(exclude_unset=True).items():
+    changes = appointment.dict(exclude_unset=True)
+    if "appointment_datetime" in changes:
+        changes["appointment_datetime"] = naive_datetime(changes["appointment_datetime"])
+    for field, value in changes.items():
         setattr(db_appointment, field, value)
     
-    # Если статус изменился на "completed", обновляем last_visit_date
-    if old_status != "completed" and db_appointment.status == "completed":
-        if db_appointment.doctor_id:
-            doctor = db.query(User).filter(User.id == db_appointment.doctor_id).first()
-            if doctor and doctor.clinic_id:
-                # Обновляем last_visit_date для связи пациент-клиника
-                clinic_patient = db.query(ClinicPatient).filter(
-                    ClinicPatient.clinic_id == doctor.clinic_id,
-                    ClinicPatient.patient_id == db_appointment.patient_id,
-                    ClinicPatient.is_active == True
-                ).first()
-                
-                if clinic_patient:
-                    clinic_patient.last_visit_date = datetime.now()
-                    print(f"✅ Обновлена дата последнего посещения для пациента {db_appointment.patient_id} в клинике {doctor.clinic_id}")
-    
-    db.commit()
-    db.refresh(db_appointment)
+    # Перенос, смена врача, длительности или восстановление отмененной записи — проверяем пересечения
+    reschedules = {"doctor_id", "appointment_datetime", "duration_minutes"} & changes.keys() or (
+        old_status == "cancelled" and "status" in changes
+    )
+    if reschedules and db_appointment.doctor_id and db_appointment.status != "cancelled":
+        ensure_slot_available(
+            db,
+            db_appointment.doctor_id,
+            db_appointment.appointment_datetime,
+            db_appointment.duration_minutes,
+            exclude_id=db_appointment.id
+        )
     
-    # Отправляем WebSocket уведомление об обновлении записи
-    try:
-        # Получаем данные пациента для уведомления
-        patient = db.query(Patient).filter(Patient.id == db_appointment.patient_id).first()
-        appointment_data = {
-            "id": db_appointment.id,
-            "patient_id": db_appointment.patient_id,
-            "doctor_id": db_appointment.doctor_id,
-            "appointment_datetime": db_appointment.appointment_datetime.isoformat() if db_appointment.appointment_datetime else None,
-            "status": db_appointment.status,
-            "service_type": db_appointment.service_type,
-            "notes": db_appointment.notes,
-            "patient_name": patient.full_name if patient else None,
-            "patient_phone": patient.phone if patient else None,
-            "updated_at": db_appointment.updated_at.isoformat() if db_appointment.updated_at else None
-        }
-        
-        # Уведомляем врача и текущего пользователя
-        await notify_appointment_updated(
-            appointment_data, 
+    # Если статус изменился на "completed", обновляем last_visit_date (в фоне после коммита)
+    if old_status != "completed" and db_appointment.status == "completed" and db_appointment.doctor_id:
+        enqueue_task(
+            db,
+            "update_clinic_patient_last_visit",
             doctor_id=db_appointment.doctor_id,
-            user_id=current_user.id
+            patient_id=db_appointment.patient_id,
+            visited_at=datetime.now().isoformat()
         )
-        print(f"📡 WebSocket уведомление об обновлении отправлено для записи {db_appointment.id}")
-    except Exception as e:
-        print(f"❌ Ошибка отправки WebSocket уведомления об обновлении: {e}")
+    
+    # Уведомление записываем в outbox в той же транзакции — отправит фоновый диспетчер
+    enqueue_event(
+        db,
+        "appointment_updated",
+        "appointment",
+        db_appointment.id,
+        doctor_id=db_appointment.doctor_id,
+        user_id=current_user.id
+    )
+    
+    commit_appointment(db)
+    db.refresh(db_appointment)
+    set_etag(response, db_appointment.version)
     
     return db_appointment
 
@@ -259,12 +626,71 @@ async def update_appointment(
 async def cancel_appointment(
     appointment_id: int,
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_registrar_or_above)
+    current_user: User = Depends(require_registrar_or_above),
+    expected_version: Optional[int] = Depends(if_match_version)
 ):
     appointment = db.query(Appointment).filter(Appointment.id == appointment_id).first()
     if appointment is None:
         raise HTTPException(status_code=404, detail="Appointment not found")
+    check_version(appointment, expected_version)
     
     appointment.status = "cancelled"
-    db.commit()
+    enqueue_event(
+        db,
+        "appointment_updated",
+        "appointment",
+        appointment.id,
+        doctor_id=appointment.doctor_id,
+        user_id=current_user.id
+    )
+    commit_versioned(db)
     return {"message": "Appointment cancelled"}
+
+
+@background_task("bind_patient_to_doctor_clinic")
+def bind_patient_to_doctor_clinic(db: Session, doctor_id: int, patient_id: int):
+    """Автоматически привязать пациента к клинике врача"""
+    from ..models.clinic_patient import ClinicPatient
+    from datetime import datetime
+    
+    doctor = db.query(User).filter(User.id == doctor_id).first()
+    if not doctor or not doctor.clinic_id:
+        return
+    
+    # Проверяем, не привязан ли уже пациент к этой клинике
+    existing_clinic_patient = db.query(ClinicPatient).filter(
+        ClinicPatient.clinic_id == doctor.clinic_id,
+        ClinicPatient.patient_id == patient_id,
+        ClinicPatient.is_active == True
+    ).first()
+    
+    if not existing_clinic_patient:
+        # Создаем новую связь пациент-клиника
+        db.add(ClinicPatient(
+            clinic_id=doctor.clinic_id,
+            patient_id=patient_id,
+            first_visit_date=datetime.now(),
+            is_active=True
+        ))
+        print(f"✅ Пациент {patient_id} автоматически привязан к клинике {doctor.clinic_id}")
+
+
+@background_task("update_clinic_patient_last_visit")
+def update_clinic_patient_last_visit(db: Session, doctor_id: int, patient_id: int, visited_at: str):
+    """Обновить дату последнего посещения пациента в клинике врача"""
+    from ..models.clinic_patient import ClinicPatient
+    from datetime import datetime
+    
+    doctor = db.query(User).filter(User.id == doctor_id).first()
+    if not doctor or not doctor.clinic_id:
+        return
+    
+    clinic_patient = db.query(ClinicPatient).filter(
+        ClinicPatient.clinic_id == doctor.clinic_id,
+        ClinicPatient.patient_id == patient_id,
+        ClinicPatient.is_active == True
+    ).first()
+    
+    if clinic_patient:
+        clinic_patient.last_visit_date = datetime.fromisoformat(visited_at)
+        print(f"✅ Обновлена дата последнего посещения для пациента {patient_id} в клинике {doctor.clinic_id}")
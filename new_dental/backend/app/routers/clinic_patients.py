@@ -1,14 +1,19 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import desc, and_, func
+from sqlalchemy import and_, case, func, or_, select, union
 from typing import List, Optional
+from datetime import date, datetime, time, timedelta
+from ..core.archive import archive_reaches
 from ..core.database import get_db
 from ..core.dependencies import get_current_user, require_medical_staff
+from ..core.search_key import search_key_condition, search_terms
 from ..models.clinic_patient import ClinicPatient
 from ..models.patient import Patient
 from ..models.clinic import Clinic
 from ..models.user import User
 from ..models.appointment import Appointment
+from ..models.archive import ArchivedAppointment
+from ..models.clinic_metrics import ClinicDailyMetrics, ClinicDoctorPatient
 from ..schemas.clinic_patient import ClinicPatientCreate, ClinicPatientUpdate, ClinicPatientResponse
 
 router = APIRouter()
@@ -42,24 +47,16 @@ async def get_clinic_patients(
             Appointment.doctor_id == doctor_id
         ).distinct()
     
-    # Поиск по данным пациента (гибкий поиск без учета регистра)
-    if search:
-        # Очищаем поисковый запрос от лишних символов
-        search_clean = search.strip()
-        if search_clean:
-            # Используем ilike с русской collation для корректной работы с кириллицей
-            from sqlalchemy import text, or_
-            search_pattern = f"%{search_clean}%"
-            query = query.join(Patient, Patient.id == ClinicPatient.patient_id).filter(
-                or_(
-                    text("patients.full_name ILIKE :search COLLATE \"ru-RU-x-icu\"").params(search=search_pattern),
-                    text("patients.phone ILIKE :search COLLATE \"ru-RU-x-icu\"").params(search=search_pattern),
-                    text("patients.iin ILIKE :search COLLATE \"ru-RU-x-icu\"").params(search=search_pattern)
-                )
-            )
+    # Поиск по ключу patients.search_key (ФИО в транслите, цифры телефона, ИИН)
+    condition = search_key_condition(Patient.search_key, search)
+    if condition is not None:
+        query = query.join(Patient, Patient.id == ClinicPatient.patient_id).filter(condition)
     
-    # Получаем пациентов с пагинацией
-    clinic_patients = query.order_by(desc(ClinicPatient.last_visit_date)).offset((page - 1) * size).limit(size).all()
+    # Получаем пациентов с пагинацией (порядок совпадает с индексом ix_clinic_patients_clinic_active_last_visit)
+    clinic_patients = query.order_by(
+        ClinicPatient.last_visit_date.desc().nullslast(),
+        ClinicPatient.id.desc()
+    ).offset((page - 1) * size).limit(size).all()
     
     # Формируем ответ с дополнительными полями
     result = []
@@ -83,46 +80,185 @@ async def get_clinic_patients(
     return result
 
 
+# Самый длинный период дашборда за один запрос
+DASHBOARD_MAX_DAYS = 366
+
+
+def metrics_period(query, date_from: Optional[date], date_to: Optional[date]):
+    """Ограничить выборку clinic_daily_metrics периодом"""
+    if date_from and date_to and date_from > date_to:
+        raise HTTPException(status_code=400, detail="date_from не может быть позже date_to")
+    if date_from:
+        query = query.filter(ClinicDailyMetrics.day >= date_from)
+    if date_to:
+        query = query.filter(ClinicDailyMetrics.day <= date_to)
+    return query
+
+
+def doctor_patient_counts(db: Session, clinic_id: int, date_from: Optional[date], date_to: Optional[date]):
+    """Подзапрос (doctor_id, patient_count): разные активные пациенты клиники у каждого врача.
+
+    Без периода — по множеству clinic_doctor_patients; за период — по записям периода
+    (индекс по клинике и дате, архив — только если период до него доходит).
+    """
+    if date_from is None and date_to is None:
+        pairs = select(ClinicDoctorPatient.doctor_id, ClinicDoctorPatient.patient_id).where(
+            ClinicDoctorPatient.clinic_id == clinic_id
+        ).subquery()
+    else:
+        range_start = datetime.combine(date_from, time.min) if date_from else None
+        range_end = datetime.combine(date_to + timedelta(days=1), time.min) if date_to else None
+        models = [Appointment]
+        if archive_reaches(db, ArchivedAppointment.appointment_datetime, range_start):
+            models.append(ArchivedAppointment)
+        sources = []
+        for model in models:
+            source = select(model.doctor_id, model.patient_id).where(
+                model.clinic_id == clinic_id,
+                model.doctor_id.isnot(None)
+            )
+            if range_start:
+                source = source.where(model.appointment_datetime >= range_start)
+            if range_end:
+                source = source.where(model.appointment_datetime < range_end)
+            sources.append(source)
+        pairs = union(*sources).subquery()
+
+    return select(
+        pairs.c.doctor_id,
+        func.count(func.distinct(pairs.c.patient_id)).label("patient_count")
+    ).join(
+        ClinicPatient, and_(
+            ClinicPatient.patient_id == pairs.c.patient_id,
+            ClinicPatient.clinic_id == clinic_id,
+            ClinicPatient.is_active == True
+        )
+    ).group_by(pairs.c.doctor_id).subquery()
+
+
 @router.get("/doctors-stats")
 async def get_doctors_stats(
+    date_from: Optional[date] = Query(None, description="Начало периода (по умолчанию — вся история)"),
+    date_to: Optional[date] = Query(None, description="Конец периода включительно"),
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    """Получить статистику по врачам клиники"""
+    """Получить статистику по врачам клиники.
+
+    Счетчики записей и выручка — из предрасчитанных показателей по дням (core/metrics.py),
+    patient_count — число разных активных пациентов клиники, записанных к врачу.
+    """
     require_medical_staff(current_user)
-    
-    
-    # Получаем врачей клиники с количеством пациентов
+
+    totals = metrics_period(
+        db.query(
+            ClinicDailyMetrics.doctor_id,
+            func.sum(ClinicDailyMetrics.appointments).label('appointments'),
+            func.sum(ClinicDailyMetrics.completed).label('completed'),
+            func.sum(ClinicDailyMetrics.cancelled).label('cancelled'),
+            func.sum(ClinicDailyMetrics.revenue).label('revenue')
+        ).filter(
+            ClinicDailyMetrics.clinic_id == current_user.clinic_id
+        ),
+        date_from,
+        date_to
+    ).group_by(ClinicDailyMetrics.doctor_id).subquery()
+    patient_counts = doctor_patient_counts(db, current_user.clinic_id, date_from, date_to)
+
     doctors_stats = db.query(
         User.id,
         User.full_name,
         User.role,
-        func.count(func.distinct(ClinicPatient.patient_id)).label('patient_count')
-    ).join(
-        Appointment, Appointment.doctor_id == User.id
-    ).join(
-        ClinicPatient, ClinicPatient.patient_id == Appointment.patient_id
+        patient_counts.c.patient_count,
+        totals.c.appointments,
+        totals.c.completed,
+        totals.c.cancelled,
+        totals.c.revenue
+    ).outerjoin(
+        totals, totals.c.doctor_id == User.id
+    ).outerjoin(
+        patient_counts, patient_counts.c.doctor_id == User.id
     ).filter(
         User.clinic_id == current_user.clinic_id,
         User.role.in_(['doctor', 'nurse']),
         User.is_active == True,
-        ClinicPatient.is_active == True
-    ).group_by(
-        User.id, User.full_name, User.role
+        # Как и раньше, в статистику попадают врачи, у которых были записи
+        or_(totals.c.doctor_id.isnot(None), patient_counts.c.doctor_id.isnot(None))
     ).all()
-    
+
     result = []
     for doctor in doctors_stats:
         result.append({
             "id": doctor.id,
             "full_name": doctor.full_name,
             "role": doctor.role,
-            "patient_count": doctor.patient_count
+            "patient_count": doctor.patient_count or 0,
+            "appointments": doctor.appointments or 0,
+            "completed": doctor.completed or 0,
+            "cancelled": doctor.cancelled or 0,
+            "revenue": float(doctor.revenue or 0)
         })
-    
+
     return result
 
 
+@router.get("/dashboard")
+async def get_clinic_dashboard(
+    date_from: Optional[date] = Query(None, description="Начало периода (по умолчанию — 30 дней до date_to)"),
+    date_to: Optional[date] = Query(None, description="Конец периода включительно (по умолчанию — сегодня)"),
+    doctor_id: Optional[int] = Query(None, description="ID врача для фильтрации"),
+    db: Session = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Показатели клиники по дням за период и итоги"""
+    require_medical_staff(current_user)
+
+    date_to = date_to or date.today()
+    date_from = date_from or date_to - timedelta(days=29)
+    if (date_to - date_from).days >= DASHBOARD_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Период не может быть длиннее {DASHBOARD_MAX_DAYS} дней")
+
+    query = db.query(
+        ClinicDailyMetrics.day,
+        func.sum(ClinicDailyMetrics.appointments).label('appointments'),
+        func.sum(ClinicDailyMetrics.completed).label('completed'),
+        func.sum(ClinicDailyMetrics.cancelled).label('cancelled'),
+        func.sum(ClinicDailyMetrics.patients).label('patients'),
+        func.sum(ClinicDailyMetrics.revenue).label('revenue')
+    ).filter(
+        ClinicDailyMetrics.clinic_id == current_user.clinic_id
+    )
+    if doctor_id:
+        query = query.filter(ClinicDailyMetrics.doctor_id == doctor_id)
+    rows = metrics_period(query, date_from, date_to).group_by(
+        ClinicDailyMetrics.day
+    ).order_by(ClinicDailyMetrics.day).all()
+
+    days = [
+        {
+            "day": row.day,
+            "appointments": row.appointments or 0,
+            "completed": row.completed or 0,
+            "cancelled": row.cancelled or 0,
+            "patients": row.patients or 0,
+            "revenue": float(row.revenue or 0)
+        }
+        for row in rows
+    ]
+    totals = {
+        field: sum(day[field] for day in days)
+        for field in ("appointments", "completed", "cancelled", "patients", "revenue")
+    }
+
+    return {
+        "clinic_id": current_user.clinic_id,
+        "date_from": date_from,
+        "date_to": date_to,
+        "days": days,
+        "totals": totals
+    }
+
+
 @router.post("/", response_model=ClinicPatientResponse)
 async def add_patient_to_clinic(
     patient_id: int,
@@ -295,28 +431,43 @@ async def search_patients(
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
-    """Поиск пациентов по общей базе"""
+    """Поиск пациентов по общей базе; пациенты своей клиники — первыми"""
     require_medical_staff(current_user)
     
-    # Поиск по общей таблице пациентов
-    patients = db.query(Patient).filter(
-        Patient.full_name.ilike(f"%{query}%") |
-        Patient.phone.ilike(f"%{query}%") |
-        Patient.iin.ilike(f"%{query}%")
+    condition = search_key_condition(Patient.search_key, query)
+    if condition is None:
+        return []
+    
+    # Активная связь с текущей клиникой — одним внешним соединением вместо запроса на пациента
+    clinic_link = db.query(
+        ClinicPatient.patient_id,
+        func.min(ClinicPatient.first_visit_date).label("first_visit_date")
+    ).filter(
+        ClinicPatient.clinic_id == current_user.clinic_id,
+        ClinicPatient.is_active == True
+    ).group_by(ClinicPatient.patient_id).subquery()
+    
+    is_in_clinic = clinic_link.c.patient_id.isnot(None)
+    # Ранжирование: своя клиника, затем совпадение с начала ФИО или ИИН, затем по имени
+    first_term = search_terms(query)[0]
+    starts_with_query = or_(
+        Patient.search_key.startswith(first_term, autoescape=True),
+        Patient.iin.startswith(first_term, autoescape=True)
+    )
+    rows = db.query(
+        Patient,
+        clinic_link.c.first_visit_date
+    ).outerjoin(
+        clinic_link, clinic_link.c.patient_id == Patient.id
+    ).filter(condition).order_by(
+        case((is_in_clinic, 0), else_=1),
+        case((starts_with_query, 0), else_=1),
+        Patient.full_name,
+        Patient.id
     ).limit(20).all()
     
-    # Формируем результат с информацией о том, добавлен ли пациент в клинику
     result = []
-    for patient in patients:
-        # Проверяем, добавлен ли пациент в текущую клинику
-        clinic_patient = db.query(ClinicPatient).filter(
-            and_(
-                ClinicPatient.clinic_id == current_user.clinic_id,
-                ClinicPatient.patient_id == patient.id,
-                ClinicPatient.is_active == True
-            )
-        ).first()
-        
+    for patient, first_visit_date in rows:
         result.append({
             "id": patient.id,
             "full_name": patient.full_name,
@@ -327,8 +478,8 @@ async def search_patients(
             "chronic_diseases": patient.chronic_diseases,
             "contraindications": patient.contraindications,
             "special_notes": patient.special_notes,
-            "is_in_clinic": clinic_patient is not None,
-            "first_visit_date": clinic_patient.first_visit_date.isoformat() if clinic_patient and clinic_patient.first_visit_date else None
+            "is_in_clinic": first_visit_date is not None,
+            "first_visit_date": first_visit_date.isoformat() if first_visit_date else None
         })
     
     return result
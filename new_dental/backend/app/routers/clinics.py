@@ -1,10 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
 from typing import List
+from datetime import date
 from ..core.database import get_db
 from ..core.auth import get_current_user, require_role
 from ..models.user import User, UserRole
 from ..models.clinic import Clinic
+from ..core.scheduling import build_clinic_schedule
 from ..schemas.clinic import ClinicCreate, ClinicUpdate, ClinicResponse
 
 router = APIRouter()
@@ -65,6 +67,22 @@ async def get_clinic(
     
     return clinic
 
+@router.get("/{clinic_id}/schedule")
+async def get_clinic_schedule(
+    clinic_id: int,
+    day: date = Query(..., alias="date", description="День расписания (YYYY-MM-DD)"),
+    include_cancelled: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Расписание всех врачей клиники на день, сгруппированное по врачам"""
+    require_role(current_user, [UserRole.ADMIN, UserRole.DOCTOR, UserRole.NURSE, UserRole.REGISTRAR])
+    
+    if current_user.role != UserRole.ADMIN and current_user.clinic_id != clinic_id:
+        raise HTTPException(status_code=403, detail="Нет доступа к расписанию другой клиники")
+    
+    return build_clinic_schedule(db, clinic_id, day, include_cancelled)
+
 @router.put("/{clinic_id}", response_model=ClinicResponse)
 async def update_clinic(
     clinic_id: int,
@@ -1,8 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from ..core.database import get_db
+from ..core.dependencies import require_registrar_or_above
+from ..core.idempotency import IdempotentRequest, idempotency
+from ..core.patient_summary import load_patient_summary
+from ..core.patient_import import IMPORT_FORMATS, ImportFileError, PatientImport, import_format, read_rows
 from ..models.patient import Patient
+from ..models.role import UserRole
+from ..models.user import User
 from ..schemas.patient import (
     PatientCreate, 
     PatientUpdate, 
@@ -15,8 +22,15 @@ router = APIRouter(prefix="/patients", tags=["patients"])
 
 
 @router.post("/", response_model=PatientResponse)
-def create_patient(patient: PatientCreate, db: Session = Depends(get_db)):
+def create_patient(
+    patient: PatientCreate,
+    db: Session = Depends(get_db),
+    idempotent: IdempotentRequest = Depends(idempotency)
+):
     """Создать нового пациента"""
+    replay = idempotent.replay()
+    if replay is not None:
+        return replay
     
     # Проверяем, что ИИН уникален
     existing_iin = db.query(Patient).filter(Patient.iin == patient.iin).first()
@@ -33,7 +47,44 @@ def create_patient(patient: PatientCreate, db: Session = Depends(get_db)):
     db.commit()
     db.refresh(db_patient)
     
-    return db_patient
+    return idempotent.remember(PatientResponse, db_patient)
+
+
+@router.post("/import")
+def import_patients(
+    file: UploadFile = File(..., description="CSV (с заголовком) или NDJSON с полями PatientCreate"),
+    format: Optional[str] = Query(None, description="csv или ndjson (по умолчанию — по расширению файла)"),
+    clinic_id: Optional[int] = Query(None, description="Клиника для привязки (только для администратора)"),
+    dry_run: bool = Query(False, description="Только проверить файл, ничего не записывая"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_registrar_or_above)
+):
+    """Массовый импорт пациентов с привязкой к клинике и отчетом об ошибках по строкам"""
+    if current_user.role != UserRole.ADMIN or clinic_id is None:
+        clinic_id = current_user.clinic_id
+    if clinic_id is None:
+        raise HTTPException(status_code=400, detail="Не указана клиника для привязки пациентов")
+
+    format = format or import_format(file.filename, file.content_type)
+    if format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="Поддерживаются форматы csv и ndjson")
+
+    patient_import = PatientImport(db, clinic_id, dry_run=dry_run)
+    try:
+        for line, row in read_rows(file.file, format):
+            patient_import.add(line, row)
+        patient_import.flush()
+        db.commit()
+    except ImportFileError as e:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+    except IntegrityError:
+        # Параллельно созданы пациенты с теми же ИИН/телефонами — безопаснее повторить импорт целиком
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Пациенты из файла были изменены параллельно, повторите импорт")
+
+    print(f"✅ Импорт пациентов в клинику {clinic_id}: создано {patient_import.created}, привязано {patient_import.linked}, ошибок {len(patient_import.errors)}")
+    return patient_import.report()
 
 
 @router.get("/", response_model=PatientListResponse)
@@ -82,6 +133,19 @@ def get_patient(patient_id: int, db: Session = Depends(get_db)):
     return patient
 
 
+@router.get("/{patient_id}/summary")
+def get_patient_summary(
+    patient_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_registrar_or_above)
+):
+    """Сводка пациента для карточки: данные, записи, приемы, планы и наряды одним ответом"""
+    summary = load_patient_summary(db, patient_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Пациент не найден")
+    return summary
+
+
 @router.get("/iin/{iin}", response_model=PatientResponse)
 def get_patient_by_iin(iin: str, db: Session = Depends(get_db)):
     """Получить пациента по ИИН"""
@@ -0,0 +1,278 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from typing import Optional
+from datetime import date, datetime, time, timedelta
+from itertools import chain
+from ..core.archive import archive_reaches
+from ..core.cache import TTLCache
+from ..core.database import get_db
+from ..core.dependencies import require_admin
+from ..core.export import export_query, export_response, stream_rows
+from ..core.metrics import order_day, order_day_start
+from ..models.archive import ArchivedVisit
+from ..models.clinic_patient import ClinicPatient
+from ..models.patient import Patient
+from ..models.treatment_order import TreatmentOrder, TreatmentOrderService
+from ..models.user import User
+from ..models.visit import Visit
+
+router = APIRouter()
+
+# Самый длинный период отчета за один запрос
+REPORT_MAX_DAYS = 366
+
+# Отчеты не сбрасываются при записи: короткий TTL гасит повторные загрузки одного отчета
+revenue_report_cache = TTLCache(ttl_seconds=60, max_entries=256)
+
+# Колонки CSV для каждой группировки
+REVENUE_COLUMNS = {
+    "day": ["day", "orders", "patients", "revenue"],
+    "doctor": ["doctor_id", "doctor_name", "orders", "patients", "revenue"],
+    "service": ["service_id", "service_name", "quantity", "orders", "revenue"],
+}
+
+
+def naive_day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+def period_conditions(column, date_from: Optional[date], date_to: Optional[date], day_start=naive_day_start) -> list:
+    """Условия периода по столбцу даты.
+
+    По умолчанию границы — наивные datetime, как в filter_visit_dates; для visit_date нарядов
+    передается order_day_start — дни в поясе показателей, как на дашборде.
+    """
+    conditions = []
+    if date_from:
+        conditions.append(column >= day_start(date_from))
+    if date_to:
+        conditions.append(column < day_start(date_to + timedelta(days=1)))
+    return conditions
+
+
+def order_filters(clinic_id: Optional[int], date_from: date, date_to: date):
+    """Условия отбора нарядов: клиника, период по visit_date, без отмененных"""
+    conditions = period_conditions(TreatmentOrder.visit_date, date_from, date_to, order_day_start) + [
+        func.coalesce(TreatmentOrder.status, "") != "cancelled",
+    ]
+    if clinic_id is not None:
+        conditions.append(TreatmentOrder.clinic_id == clinic_id)
+    return conditions
+
+
+def revenue_rows(db: Session, group_by: str, conditions) -> list:
+    """Агрегаты выручки одной выборкой GROUP BY"""
+    if group_by == "day":
+        # День — как у clinic_daily_metrics, а не по TimeZone сессии БД
+        day = order_day(db, TreatmentOrder.visit_date)
+        query = select(
+            day.label("day"),
+            func.count(TreatmentOrder.id).label("orders"),
+            func.count(func.distinct(TreatmentOrder.patient_id)).label("patients"),
+            func.sum(TreatmentOrder.total_amount).label("revenue")
+        ).where(*conditions).group_by(day).order_by(day)
+    elif group_by == "doctor":
+        query = select(
+            TreatmentOrder.created_by_id.label("doctor_id"),
+            User.full_name.label("doctor_name"),
+            func.count(TreatmentOrder.id).label("orders"),
+            func.count(func.distinct(TreatmentOrder.patient_id)).label("patients"),
+            func.sum(TreatmentOrder.total_amount).label("revenue")
+        ).outerjoin(
+            # Наряды удаленного врача остаются в строках, как и в totals
+            User, User.id == TreatmentOrder.created_by_id
+        ).where(*conditions).group_by(
+            TreatmentOrder.created_by_id, User.full_name
+        ).order_by(func.sum(TreatmentOrder.total_amount).desc())
+    else:
+        # Выручка услуги — по ценам строк наряда на момент оказания
+        line_revenue = func.sum(TreatmentOrderService.service_price * func.coalesce(TreatmentOrderService.quantity, 1))
+        query = select(
+            TreatmentOrderService.service_id,
+            func.max(TreatmentOrderService.service_name).label("service_name"),
+            func.sum(func.coalesce(TreatmentOrderService.quantity, 1)).label("quantity"),
+            func.count(func.distinct(TreatmentOrder.id)).label("orders"),
+            line_revenue.label("revenue")
+        ).join(
+            TreatmentOrder, TreatmentOrder.id == TreatmentOrderService.treatment_order_id
+        ).where(*conditions).group_by(
+            TreatmentOrderService.service_id
+        ).order_by(line_revenue.desc())
+
+    rows = []
+    for row in db.execute(query).mappings():
+        row = dict(row)
+        row["revenue"] = float(row["revenue"] or 0)
+        rows.append(row)
+    return rows
+
+
+@router.get("/revenue")
+async def get_revenue_report(
+    clinic_id: Optional[int] = Query(None, description="ID клиники (по умолчанию — все клиники)"),
+    date_from: Optional[date] = Query(None, alias="from", description="Начало периода (по умолчанию — 30 дней до конца)"),
+    date_to: Optional[date] = Query(None, alias="to", description="Конец периода включительно (по умолчанию — сегодня)"),
+    group_by: str = Query("day", pattern="^(day|doctor|service)$", description="Группировка: day, doctor или service"),
+    format: str = Query("json", pattern="^(json|csv)$", description="Формат ответа: json или csv"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin)
+):
+    """Выручка по нарядам за период с группировкой по дням, врачам или услугам"""
+    date_to = date_to or date.today()
+    date_from = date_from or date_to - timedelta(days=29)
+    if date_from > date_to:
+        raise HTTPException(status_code=400, detail="Начало периода не может быть позже конца")
+    if (date_to - date_from).days >= REPORT_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Период не может быть длиннее {REPORT_MAX_DAYS} дней")
+
+    cache_key = (clinic_id, date_from, date_to, group_by)
+    report = revenue_report_cache.get(cache_key)
+    if report is None:
+        conditions = order_filters(clinic_id, date_from, date_to)
+        totals = db.execute(
+            select(
+                func.count(TreatmentOrder.id).label("orders"),
+                func.count(func.distinct(TreatmentOrder.patient_id)).label("patients"),
+                func.sum(TreatmentOrder.total_amount).label("revenue")
+            ).where(*conditions)
+        ).one()
+        report = {
+            "clinic_id": clinic_id,
+            "date_from": date_from,
+            "date_to": date_to,
+            "group_by": group_by,
+            "rows": revenue_rows(db, group_by, conditions),
+            "totals": {
+                "orders": totals.orders,
+                "patients": totals.patients,
+                "revenue": float(totals.revenue or 0)
+            }
+        }
+        revenue_report_cache.set(cache_key, report)
+
+    if format == "csv":
+        return export_response("csv", f"revenue_{group_by}_{date_from}_{date_to}", REVENUE_COLUMNS[group_by], report["rows"])
+    return report
+
+
+EXPORT_FORMAT_PATTERN = "^(csv|ndjson)$"
+
+
+@router.get("/export/patients")
+async def export_patients(
+    clinic_id: Optional[int] = Query(None, description="ID клиники (по умолчанию — все пациенты)"),
+    format: str = Query("csv", pattern=EXPORT_FORMAT_PATTERN, description="Формат: csv или ndjson"),
+    current_user: User = Depends(require_admin)
+):
+    """Потоковая выгрузка пациентов (для клиники — с датами первого и последнего визита)"""
+    columns = [
+        Patient.id,
+        Patient.full_name,
+        Patient.phone,
+        Patient.iin,
+        Patient.birth_date,
+        Patient.allergies,
+        Patient.chronic_diseases,
+        Patient.contraindications,
+        Patient.special_notes,
+        Patient.created_at,
+    ]
+    if clinic_id is None:
+        statement = select(*columns).order_by(Patient.id)
+    else:
+        statement = select(
+            *columns,
+            ClinicPatient.first_visit_date,
+            ClinicPatient.last_visit_date
+        ).join(
+            ClinicPatient, ClinicPatient.patient_id == Patient.id
+        ).where(
+            ClinicPatient.clinic_id == clinic_id,
+            ClinicPatient.is_active == True
+        ).order_by(Patient.id)
+
+    filename = f"patients_clinic_{clinic_id}" if clinic_id else "patients"
+    return export_query(format, filename, statement)
+
+
+def visit_export_statement(model, clinic_id: Optional[int], date_from: Optional[date], date_to: Optional[date]):
+    # Внешние соединения: у архива нет внешних ключей, пациент или врач могли быть удалены
+    statement = select(
+        model.id,
+        model.patient_id,
+        Patient.full_name.label("patient_name"),
+        model.doctor_id,
+        User.full_name.label("doctor_name"),
+        model.clinic_id,
+        model.appointment_id,
+        model.visit_date,
+        model.service_id,
+        model.service_name,
+        model.service_price,
+        model.diagnosis,
+        model.treatment_notes,
+        model.status
+    ).outerjoin(
+        Patient, Patient.id == model.patient_id
+    ).outerjoin(
+        User, User.id == model.doctor_id
+    ).where(*period_conditions(model.visit_date, date_from, date_to))
+    if clinic_id is not None:
+        statement = statement.where(model.clinic_id == clinic_id)
+    return statement.order_by(model.visit_date, model.id)
+
+
+@router.get("/export/visits")
+async def export_visits(
+    clinic_id: Optional[int] = Query(None, description="ID клиники (по умолчанию — все клиники)"),
+    date_from: Optional[date] = Query(None, alias="from", description="Приемы с этой даты (включительно)"),
+    date_to: Optional[date] = Query(None, alias="to", description="Приемы по эту дату (включительно)"),
+    format: str = Query("csv", pattern=EXPORT_FORMAT_PATTERN, description="Формат: csv или ndjson"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin)
+):
+    """Потоковая выгрузка приемов; архивные приемы идут первыми, если период их захватывает"""
+    statement = visit_export_statement(Visit, clinic_id, date_from, date_to)
+    rows = stream_rows(statement)
+    range_start = datetime.combine(date_from, time.min) if date_from else None
+    if archive_reaches(db, ArchivedVisit.visit_date, range_start):
+        rows = chain(stream_rows(visit_export_statement(ArchivedVisit, clinic_id, date_from, date_to)), rows)
+
+    filename = f"visits_clinic_{clinic_id}" if clinic_id else "visits"
+    return export_response(format, filename, list(statement.selected_columns.keys()), rows)
+
+
+@router.get("/export/treatment-orders")
+async def export_treatment_orders(
+    clinic_id: Optional[int] = Query(None, description="ID клиники (по умолчанию — все клиники)"),
+    date_from: Optional[date] = Query(None, alias="from", description="Наряды с этой даты (включительно)"),
+    date_to: Optional[date] = Query(None, alias="to", description="Наряды по эту дату (включительно)"),
+    format: str = Query("csv", pattern=EXPORT_FORMAT_PATTERN, description="Формат: csv или ndjson"),
+    current_user: User = Depends(require_admin)
+):
+    """Потоковая выгрузка нарядов с именами пациента и врача"""
+    statement = select(
+        TreatmentOrder.id,
+        TreatmentOrder.patient_id,
+        Patient.full_name.label("patient_name"),
+        TreatmentOrder.created_by_id.label("doctor_id"),
+        User.full_name.label("doctor_name"),
+        TreatmentOrder.clinic_id,
+        TreatmentOrder.appointment_id,
+        TreatmentOrder.visit_date,
+        TreatmentOrder.total_amount,
+        TreatmentOrder.status,
+        TreatmentOrder.created_at
+    ).outerjoin(
+        Patient, Patient.id == TreatmentOrder.patient_id
+    ).outerjoin(
+        User, User.id == TreatmentOrder.created_by_id
+    ).where(
+        *period_conditions(TreatmentOrder.visit_date, date_from, date_to, order_day_start)
+    ).order_by(TreatmentOrder.visit_date, TreatmentOrder.id)
+    if clinic_id is not None:
+        statement = statement.where(TreatmentOrder.clinic_id == clinic_id)
+
+    filename = f"treatment_orders_clinic_{clinic_id}" if clinic_id else "treatment_orders"
+    return export_query(format, filename, statement)
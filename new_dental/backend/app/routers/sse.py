@@ -0,0 +1,218 @@
+from fastapi import APIRouter, Request, Query, Header, HTTPException, status
+from fastapi.responses import StreamingResponse
+from typing import Dict, Optional, Set
+import asyncio
+import json
+from ..core.database import SessionLocal
+from ..core.outbox import build_appointment_messages
+from ..models.outbox import OutboxEvent
+from ..models.role import UserRole
+from .websocket import WebSocketPrincipal, manager, resolve_principal, get_user_clinic_id
+
+router = APIRouter()
+
+# Размер буфера одного клиента; при переполнении поток закрывается,
+# и клиент переподключается с Last-Event-ID
+SSE_BUFFER_SIZE = 100
+# Сколько событий максимум досылать при возобновлении потока
+SSE_REPLAY_LIMIT = 500
+# Комментарий-пинг, чтобы прокси не закрывали "молчащее" соединение
+SSE_HEARTBEAT_SECONDS = 15
+SSE_RETRY_MS = 3000
+
+
+class SSEClient:
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SSE_BUFFER_SIZE)
+        self.overflowed = False
+
+    def offer(self, item: tuple):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Клиент не успевает читать — не копим события бесконечно
+            self.overflowed = True
+
+
+class SSEBroker:
+    """Раздает SSE-клиентам те же события о записях, что и ConnectionManager"""
+
+    def __init__(self):
+        self.doctor_clients: Dict[int, Set[SSEClient]] = {}
+        self.user_clients: Dict[int, Set[SSEClient]] = {}
+
+    def register(self, client: SSEClient, doctor_id: int = None, user_id: int = None):
+        if doctor_id:
+            self.doctor_clients.setdefault(doctor_id, set()).add(client)
+        if user_id:
+            self.user_clients.setdefault(user_id, set()).add(client)
+
+    def unregister(self, client: SSEClient, doctor_id: int = None, user_id: int = None):
+        for registry, key in ((self.doctor_clients, doctor_id), (self.user_clients, user_id)):
+            if key and key in registry:
+                registry[key].discard(client)
+                if not registry[key]:
+                    del registry[key]
+
+    def publish(self, event_type: str, data: dict, doctor_id: int = None, user_id: int = None, event_id: int = None):
+        item = (event_id, event_type, data)
+        for client in self.doctor_clients.get(doctor_id, ()) if doctor_id else ():
+            client.offer(item)
+        for client in self.user_clients.get(user_id, ()) if user_id else ():
+            client.offer(item)
+
+
+broker = SSEBroker()
+manager.add_listener(broker.publish)
+
+
+def format_sse(event_type: str, data: dict, event_id: Optional[int] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {json.dumps(data, default=str)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def load_missed_events(last_event_id: int, doctor_id: int = None, user_id: int = None):
+    """Загрузить уже отправленные события после last_event_id (из outbox)"""
+    db = SessionLocal()
+    try:
+        query = db.query(OutboxEvent).filter(
+            OutboxEvent.id > last_event_id,
+            OutboxEvent.dispatched_at.isnot(None)
+        )
+        if doctor_id:
+            query = query.filter(OutboxEvent.doctor_id == doctor_id)
+        if user_id:
+            query = query.filter(OutboxEvent.user_id == user_id)
+
+        events = query.order_by(OutboxEvent.id).limit(SSE_REPLAY_LIMIT + 1).all()
+        truncated = len(events) > SSE_REPLAY_LIMIT
+        events = events[:SSE_REPLAY_LIMIT]
+
+        appointments = build_appointment_messages(db, events)
+        replay = []
+        for e in events:
+            data = appointments.get(e.aggregate_id) if e.aggregate_type == "appointment" else e.payload
+            if data is not None:
+                replay.append((e.id, e.event_type, data))
+        return replay, truncated
+    finally:
+        db.close()
+
+
+async def authorize_stream(token: Optional[str], doctor_id: int = None, user_id: int = None):
+    principal = await asyncio.to_thread(resolve_principal, token)
+    if principal is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Недействительный токен аутентификации")
+
+    if doctor_id:
+        doctor_clinic_id = None
+        if principal.user_id != doctor_id and principal.role != UserRole.ADMIN:
+            doctor_clinic_id = await asyncio.to_thread(get_user_clinic_id, doctor_id)
+        if not principal.can_subscribe_to_doctor(doctor_id, doctor_clinic_id):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Недостаточно прав для подписки")
+    if user_id and not principal.can_subscribe_to_user(user_id):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Недостаточно прав для подписки")
+
+    return principal
+
+
+async def event_stream(request: Request, principal: WebSocketPrincipal, last_event_id: Optional[int], doctor_id: int = None, user_id: int = None):
+    client = SSEClient()
+    # Регистрируемся до чтения пропущенных событий, чтобы не потерять события между ними
+    broker.register(client, doctor_id=doctor_id, user_id=user_id)
+    try:
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+
+        replayed_up_to = last_event_id or 0
+        if last_event_id is not None:
+            replay, truncated = await asyncio.to_thread(load_missed_events, last_event_id, doctor_id, user_id)
+            if truncated:
+                # Пропущено слишком много — клиенту проще перезагрузить календарь целиком
+                yield format_sse("resync", {"reason": "too_many_missed_events"})
+            for event_id, event_type, data in replay:
+                yield format_sse(event_type, data, event_id)
+                replayed_up_to = max(replayed_up_to, event_id)
+
+        while True:
+            if client.overflowed:
+                # Закрываем поток; клиент переподключится с Last-Event-ID и дочитает из outbox
+                break
+
+            # Токен проверен при подключении; по истечении срока поток закрывается
+            timeout = SSE_HEARTBEAT_SECONDS
+            until_expiry = principal.seconds_until_expiry()
+            if until_expiry is not None:
+                if until_expiry <= 0:
+                    break
+                timeout = min(timeout, until_expiry)
+
+            try:
+                event_id, event_type, data = await asyncio.wait_for(client.queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                yield ": ping\n\n"
+                continue
+
+            if event_id is not None and event_id <= replayed_up_to:
+                # Уже отправлено при досылке пропущенных событий
+                continue
+            yield format_sse(event_type, data, event_id)
+    finally:
+        broker.unregister(client, doctor_id=doctor_id, user_id=user_id)
+
+
+def parse_last_event_id(header_value: Optional[str], query_value: Optional[int]) -> Optional[int]:
+    if header_value and header_value.isdigit():
+        return int(header_value)
+    return query_value
+
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    # Отключаем буферизацию ответа в nginx
+    "X-Accel-Buffering": "no",
+}
+
+
+@router.get("/appointments/{doctor_id}")
+async def appointments_stream(
+    doctor_id: int,
+    request: Request,
+    token: Optional[str] = Query(None, description="JWT токен (EventSource не умеет передавать заголовки)"),
+    last_event_id: Optional[int] = Query(None, description="ID последнего полученного события"),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """SSE-поток событий о записях врача (альтернатива WebSocket за прокси)"""
+    principal = await authorize_stream(token, doctor_id=doctor_id)
+    resume_from = parse_last_event_id(last_event_id_header, last_event_id)
+    return StreamingResponse(
+        event_stream(request, principal, resume_from, doctor_id=doctor_id),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
+@router.get("/user/{user_id}")
+async def user_stream(
+    user_id: int,
+    request: Request,
+    token: Optional[str] = Query(None, description="JWT токен (EventSource не умеет передавать заголовки)"),
+    last_event_id: Optional[int] = Query(None, description="ID последнего полученного события"),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """SSE-поток уведомлений пользователя"""
+    principal = await authorize_stream(token, user_id=user_id)
+    resume_from = parse_last_event_id(last_event_id_header, last_event_id)
+    return StreamingResponse(
+        event_stream(request, principal, resume_from, user_id=user_id),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
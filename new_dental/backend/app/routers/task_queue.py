@@ -0,0 +1,12 @@
+from fastapi import APIRouter, Depends
+from ..core.dependencies import require_admin
+from ..core.tasks import task_queue
+from ..models.user import User
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def get_task_queue_metrics(current_user: User = Depends(require_admin)):
+    """Метрики очереди фоновых задач: очередь, выполнение, повторы, длительность"""
+    return task_queue.metrics()
@@ -1,30 +1,50 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy import delete, insert, select, update
 from sqlalchemy.orm import Session
-from typing import List
+from sqlalchemy.sql import func
+from typing import Dict, List, Optional
 from ..core.database import get_db
-from ..models.tooth_service import ToothService
-from ..schemas.tooth_service import ToothServiceCreate, ToothServiceResponse, ToothServiceUpdate
+from ..core.dependencies import require_medical_staff
+from ..core.events import record_change
+from ..core.odontogram import mark_plan_chart_changed
+from ..core.service_lines import apply_line_diff
+from ..core.versioning import check_version, commit_versioned, if_match_version, set_etag
+from ..models.role import UserRole
+from ..models.tooth_service import ServiceStatus, ToothService, ToothServiceStatus
+from ..models.treatment_plan import TreatmentPlan
+from ..models.user import User
+from ..schemas.tooth_service import (
+    ToothServiceCreate,
+    ToothServiceResponse,
+    ToothServiceUpdate,
+    ToothServiceStatusResponse,
+    ToothChartUpdate,
+    ToothChartResponse
+)
 
 router = APIRouter(prefix="/tooth-services", tags=["tooth-services"])
 
 
+def validate_statuses(service_statuses: Optional[Dict[int, str]]):
+    for status in (service_statuses or {}).values():
+        if status not in [service_status.value for service_status in ServiceStatus]:
+            raise HTTPException(status_code=400, detail="Статус должен быть 'pending' или 'completed'")
+
+
 @router.post("/", response_model=ToothServiceResponse)
 def create_tooth_service(
     tooth_service: ToothServiceCreate,
     db: Session = Depends(get_db)
 ):
     """Создать новую запись о зубе и услугах"""
-    # Инициализируем статусы услуг как "pending" по умолчанию
-    service_statuses = {}
-    for service_id in tooth_service.service_ids:
-        service_statuses[service_id] = "pending"
+    validate_statuses(tooth_service.service_statuses)
     
     db_tooth_service = ToothService(
         treatment_plan_id=tooth_service.treatment_plan_id,
-        tooth_id=tooth_service.tooth_id,
-        service_ids=tooth_service.service_ids,
-        service_statuses=service_statuses
+        tooth_id=tooth_service.tooth_id
     )
+    # Статусы услуг по умолчанию — "pending"
+    db_tooth_service.set_services(tooth_service.service_ids, tooth_service.service_statuses)
     db.add(db_tooth_service)
     db.commit()
     db.refresh(db_tooth_service)
@@ -43,6 +63,145 @@ def get_tooth_services_by_treatment_plan(
     return tooth_services
 
 
+@router.put("/treatment-plan/{treatment_plan_id}", response_model=ToothChartResponse)
+def save_tooth_chart(
+    treatment_plan_id: int,
+    chart: ToothChartUpdate,
+    response: Response,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_medical_staff),
+    expected_version: Optional[int] = Depends(if_match_version)
+):
+    """Сохранить всю зубную карту плана одной транзакцией.
+
+    Карта сравнивается с сохраненной: удаляются зубы и услуги, которых больше нет,
+    добавляются новые, статусы меняются только у изменившихся услуг. Статус услуги,
+    не переданный в service_statuses, сохраняется (у новой — "pending").
+    """
+    plan = db.query(TreatmentPlan).filter(TreatmentPlan.id == treatment_plan_id).first()
+    if plan is None:
+        raise HTTPException(status_code=404, detail="Treatment plan not found")
+    check_version(plan, expected_version)
+    
+    statuses = chart.service_statuses or {}
+    for tooth_statuses in statuses.values():
+        validate_statuses(tooth_statuses)
+    teeth = {tooth_id: list(dict.fromkeys(service_ids)) for tooth_id, service_ids in chart.teeth.items() if service_ids}
+    
+    # Одна запись на зуб; лишние дубли и зубы без услуг удаляются
+    existing = {}
+    removed_ids = []
+    for tooth_service in db.query(ToothService).filter(
+        ToothService.treatment_plan_id == treatment_plan_id
+    ).order_by(ToothService.id).all():
+        if tooth_service.tooth_id in teeth and tooth_service.tooth_id not in existing:
+            existing[tooth_service.tooth_id] = tooth_service
+        else:
+            removed_ids.append(tooth_service.id)
+    
+    if removed_ids:
+        db.execute(delete(ToothServiceStatus).where(ToothServiceStatus.tooth_service_id.in_(removed_ids)))
+        db.execute(delete(ToothService).where(ToothService.id.in_(removed_ids)))
+    
+    tooth_service_ids = {tooth_id: tooth_service.id for tooth_id, tooth_service in existing.items()}
+    new_teeth = [tooth_id for tooth_id in teeth if tooth_id not in existing]
+    if new_teeth:
+        # clinic_id задаем явно: Core INSERT не проходит через before_flush
+        inserted = db.execute(
+            insert(ToothService.__table__).values([
+                {"treatment_plan_id": treatment_plan_id, "clinic_id": plan.clinic_id, "tooth_id": tooth_id}
+                for tooth_id in new_teeth
+            ]).returning(ToothService.__table__.c.id, ToothService.__table__.c.tooth_id)
+        ).all()
+        tooth_service_ids.update({tooth_id: tooth_service_id for tooth_service_id, tooth_id in inserted})
+    
+    incoming = []
+    for tooth_id, service_ids in teeth.items():
+        current = existing[tooth_id].service_statuses if tooth_id in existing else {}
+        for service_id in service_ids:
+            incoming.append({
+                "tooth_service_id": tooth_service_ids[tooth_id],
+                "service_id": service_id,
+                "status": statuses.get(tooth_id, {}).get(service_id) or current.get(service_id, ServiceStatus.PENDING)
+            })
+    service_changes = apply_line_diff(
+        db,
+        ToothServiceStatus,
+        [status for tooth_service in existing.values() for status in tooth_service.statuses],
+        incoming,
+        key_fields=("tooth_service_id", "service_id"),
+        value_fields=("status",)
+    )
+    
+    # Если карта изменилась, UPDATE плана увеличивает его версию; карта меняется
+    # bulk-инструкциями, поэтому событие добавляем вручную
+    if removed_ids or new_teeth or any(service_changes.values()):
+        plan.updated_at = func.now()
+        record_change(db, "tooth_service", None, "updated", [f"treatment_plan:{treatment_plan_id}"])
+    commit_versioned(db)
+    set_etag(response, plan.version)
+    
+    tooth_services = db.query(ToothService).filter(
+        ToothService.treatment_plan_id == treatment_plan_id
+    ).order_by(ToothService.tooth_id).all()
+    return {
+        "treatment_plan_id": treatment_plan_id,
+        "version": plan.version,
+        "tooth_services": tooth_services,
+        "changes": {
+            "teeth_inserted": len(new_teeth),
+            "teeth_deleted": len(removed_ids),
+            "services_inserted": service_changes["inserted"],
+            "services_updated": service_changes["updated"],
+            "services_deleted": service_changes["deleted"]
+        }
+    }
+
+
+@router.get("/statuses", response_model=List[ToothServiceStatusResponse])
+def get_service_statuses(
+    status: Optional[str] = Query(None, description="pending или completed"),
+    clinic_id: Optional[int] = None,
+    patient_id: Optional[int] = None,
+    service_id: Optional[int] = None,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_medical_staff)
+):
+    """Услуги на зубах по всем пациентам, например все невыполненные (status=pending)"""
+    # Не администратор видит только свою клинику
+    if current_user.role != UserRole.ADMIN:
+        clinic_id = current_user.clinic_id
+    
+    query = db.query(
+        ToothServiceStatus.id,
+        ToothServiceStatus.tooth_service_id,
+        ToothService.treatment_plan_id,
+        TreatmentPlan.patient_id,
+        ToothService.clinic_id,
+        ToothService.tooth_id,
+        ToothServiceStatus.service_id,
+        ToothServiceStatus.status,
+        ToothServiceStatus.updated_at
+    ).join(
+        ToothService, ToothService.id == ToothServiceStatus.tooth_service_id
+    ).join(
+        TreatmentPlan, TreatmentPlan.id == ToothService.treatment_plan_id
+    )
+    if status:
+        query = query.filter(ToothServiceStatus.status == status)
+    if clinic_id:
+        query = query.filter(ToothService.clinic_id == clinic_id)
+    if patient_id:
+        query = query.filter(TreatmentPlan.patient_id == patient_id)
+    if service_id:
+        query = query.filter(ToothServiceStatus.service_id == service_id)
+    
+    rows = query.order_by(ToothServiceStatus.id).offset(skip).limit(limit).all()
+    return [dict(row._mapping) for row in rows]
+
+
 @router.put("/{tooth_service_id}", response_model=ToothServiceResponse)
 def update_tooth_service(
     tooth_service_id: int,
@@ -56,19 +215,11 @@ def update_tooth_service(
     
     if not db_tooth_service:
         raise HTTPException(status_code=404, detail="Запись о зубе и услугах не найдена")
+    validate_statuses(tooth_service.service_statuses)
     
-    if tooth_service.service_ids is not None:
-        db_tooth_service.service_ids = tooth_service.service_ids
-        # Обновляем статусы для новых услуг
-        if tooth_service.service_statuses is None:
-            service_statuses = {}
-            for service_id in tooth_service.service_ids:
-                # Сохраняем существующий статус или устанавливаем "pending"
-                service_statuses[service_id] = db_tooth_service.service_statuses.get(service_id, "pending")
-            db_tooth_service.service_statuses = service_statuses
-    
-    if tooth_service.service_statuses is not None:
-        db_tooth_service.service_statuses = tooth_service.service_statuses
+    # Существующие статусы сохраняются, новые услуги получают "pending"
+    service_ids = tooth_service.service_ids if tooth_service.service_ids is not None else db_tooth_service.service_ids
+    db_tooth_service.set_services(service_ids, tooth_service.service_statuses)
     
     db.commit()
     db.refresh(db_tooth_service)
@@ -83,25 +234,32 @@ def update_service_status(
     db: Session = Depends(get_db)
 ):
     """Обновить статус конкретной услуги на зубе"""
-    if status not in ["pending", "completed"]:
+    if status not in [service_status.value for service_status in ServiceStatus]:
         raise HTTPException(status_code=400, detail="Статус должен быть 'pending' или 'completed'")
     
-    db_tooth_service = db.query(ToothService).filter(
-        ToothService.id == tooth_service_id
-    ).first()
-    
-    if not db_tooth_service:
-        raise HTTPException(status_code=404, detail="Запись о зубе и услугах не найдена")
+    # Одно UPDATE одной строки; план для события возвращается тем же запросом
+    treatment_plan_id = db.execute(
+        update(ToothServiceStatus)
+        .where(
+            ToothServiceStatus.tooth_service_id == tooth_service_id,
+            ToothServiceStatus.service_id == service_id
+        )
+        .values(status=status)
+        .returning(
+            select(ToothService.treatment_plan_id)
+            .where(ToothService.id == ToothServiceStatus.tooth_service_id)
+            .scalar_subquery()
+        )
+    ).scalar()
     
-    if service_id not in db_tooth_service.service_ids:
+    if treatment_plan_id is None:
+        if db.query(ToothService.id).filter(ToothService.id == tooth_service_id).first() is None:
+            raise HTTPException(status_code=404, detail="Запись о зубе и услугах не найдена")
         raise HTTPException(status_code=400, detail="Услуга не назначена на этот зуб")
     
-    # Обновляем статус услуги
-    if db_tooth_service.service_statuses is None:
-        db_tooth_service.service_statuses = {}
-    
-    db_tooth_service.service_statuses[service_id] = status
-    
+    # UPDATE не проходит через flush, поэтому событие и сброс карты плана добавляем вручную
+    record_change(db, "tooth_service", tooth_service_id, "updated", [f"treatment_plan:{treatment_plan_id}"])
+    mark_plan_chart_changed(db, {treatment_plan_id})
     db.commit()
     return {"message": f"Статус услуги {service_id} обновлен на {status}"}
 
@@ -133,5 +291,8 @@ def delete_tooth_services_by_treatment_plan(
     db.query(ToothService).filter(
         ToothService.treatment_plan_id == treatment_plan_id
     ).delete()
+    # Bulk delete не проходит через flush, поэтому событие и сброс карты плана добавляем вручную
+    record_change(db, "tooth_service", None, "deleted", [f"treatment_plan:{treatment_plan_id}"])
+    mark_plan_chart_changed(db, {treatment_plan_id})
     db.commit()
     return {"message": "Все записи о зубах и услугах для плана лечения удалены"}
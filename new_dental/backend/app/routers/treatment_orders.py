@@ -1,5 +1,6 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, Response, status, Query
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import flag_modified
 from sqlalchemy import desc
 from typing import List, Optional
 from datetime import datetime
@@ -17,6 +18,10 @@ from app.schemas.treatment_order import (
     TreatmentOrderServiceResponse
 )
 from app.core.auth import get_current_user
+from app.core.idempotency import IdempotentRequest, idempotency
+from app.core.service_lines import apply_line_diff
+from app.core.tasks import background_task, enqueue_task
+from app.core.versioning import check_version, commit_versioned, if_match_version, set_etag
 
 router = APIRouter()
 
@@ -91,7 +96,8 @@ async def get_treatment_orders(
             services=services,
             total_amount=order.total_amount,
             status=order.status,
-            created_at=order.created_at
+            created_at=order.created_at,
+            version=order.version
         ))
     
     return result
@@ -100,9 +106,13 @@ async def get_treatment_orders(
 async def create_treatment_order(
     treatment_order: TreatmentOrderCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    idempotent: IdempotentRequest = Depends(idempotency)
 ):
     """Создать новый наряд"""
+    replay = idempotent.replay()
+    if replay is not None:
+        return replay
     
     # Проверяем, что пациент существует
     patient = db.query(Patient).filter(Patient.id == treatment_order.patient_id).first()
@@ -148,12 +158,19 @@ async def create_treatment_order(
         )
         db.add(db_service)
     
+    # Сохранение услуг в план лечения не влияет на ответ — выполняется в фоне после коммита
+    enqueue_task(
+        db,
+        "save_services_to_treatment_plan",
+        patient_id=treatment_order.patient_id,
+        services=[service.dict() for service in treatment_order.services],
+        clinic_id=current_user.clinic_id,
+        doctor_id=treatment_order.doctor_id
+    )
+    
     db.commit()
     db.refresh(db_treatment_order)
     
-    # Сохраняем услуги из наряда в план лечения
-    await save_services_to_treatment_plan(db, treatment_order.patient_id, treatment_order.services, current_user.clinic_id)
-    
     # Возвращаем созданный наряд с полными данными
     order_services = db.query(TreatmentOrderService).filter(
         TreatmentOrderService.treatment_order_id == db_treatment_order.id
@@ -172,7 +189,7 @@ async def create_treatment_order(
                 is_completed=service.is_completed
             ))
     
-    return TreatmentOrderResponse(
+    return idempotent.remember(TreatmentOrderResponse, TreatmentOrderResponse(
         id=db_treatment_order.id,
         patient_id=db_treatment_order.patient_id,
         patient_name=patient.full_name,
@@ -185,8 +202,9 @@ async def create_treatment_order(
         services=services,
         total_amount=db_treatment_order.total_amount,
         status=db_treatment_order.status,
-        created_at=db_treatment_order.created_at
-    )
+        created_at=db_treatment_order.created_at,
+        version=db_treatment_order.version
+    ))
 
 @router.get("/{treatment_order_id}", response_model=TreatmentOrderResponse)
 async def get_treatment_order(
@@ -244,15 +262,18 @@ async def get_treatment_order(
         services=services,
         total_amount=treatment_order.total_amount,
         status=treatment_order.status,
-        created_at=treatment_order.created_at
+        created_at=treatment_order.created_at,
+        version=treatment_order.version
     )
 
 @router.put("/{treatment_order_id}", response_model=TreatmentOrderResponse)
 async def update_treatment_order(
     treatment_order_id: int,
     treatment_order: TreatmentOrderCreate,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user),
+    expected_version: Optional[int] = Depends(if_match_version)
 ):
     """Обновить наряд"""
     
@@ -266,6 +287,7 @@ async def update_treatment_order(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Наряд не найден"
         )
+    check_version(db_treatment_order, expected_version)
     
     # Обновляем основные поля наряда
     db_treatment_order.patient_id = treatment_order.patient_id
@@ -275,29 +297,43 @@ async def update_treatment_order(
     db_treatment_order.total_amount = treatment_order.total_amount
     db_treatment_order.status = treatment_order.status
     
-    # Удаляем старые услуги
-    db.query(TreatmentOrderService).filter(
+    # Применяем только разницу со строками услуг, которые уже сохранены
+    existing = db.query(TreatmentOrderService).filter(
         TreatmentOrderService.treatment_order_id == treatment_order_id
-    ).delete()
-    
-    # Добавляем новые услуги
-    for service_data in treatment_order.services:
-        db_service = TreatmentOrderService(
-            treatment_order_id=treatment_order_id,
-            service_id=service_data.service_id,
-            service_name=service_data.service_name,
-            service_price=service_data.service_price,
-            quantity=service_data.quantity,
-            tooth_number=service_data.tooth_number,
-            is_completed=service_data.is_completed
-        )
-        db.add(db_service)
+    ).all()
+    service_changes = apply_line_diff(
+        db,
+        TreatmentOrderService,
+        existing,
+        [
+            {
+                "treatment_order_id": treatment_order_id,
+                "service_id": service_data.service_id,
+                "service_name": service_data.service_name,
+                "service_price": service_data.service_price,
+                "quantity": service_data.quantity,
+                "tooth_number": service_data.tooth_number,
+                "notes": service_data.notes,
+                "is_completed": service_data.is_completed
+            }
+            for service_data in treatment_order.services
+        ],
+        key_fields=("tooth_number", "service_id"),
+        value_fields=("service_name", "service_price", "quantity", "notes", "is_completed")
+    )
+    print(f"📝 Наряд {treatment_order_id}: услуг добавлено {service_changes['inserted']}, "
+          f"изменено {service_changes['updated']}, удалено {service_changes['deleted']}")
     
-    db.commit()
+    # UPDATE наряда (и рост версии) нужен, даже если изменились только услуги
+    flag_modified(db_treatment_order, "status")
+    commit_versioned(db)
     db.refresh(db_treatment_order)
+    set_etag(response, db_treatment_order.version)
     
     # Возвращаем обновленный наряд
-    return await get_treatment_order(treatment_order_id, db, current_user)
+    result = await get_treatment_order(treatment_order_id, db, current_user)
+    result.service_changes = service_changes
+    return result
 
 @router.delete("/{treatment_order_id}")
 async def delete_treatment_order(
@@ -330,8 +366,9 @@ async def delete_treatment_order(
     return {"message": "Наряд успешно удален"}
 
 
-async def save_services_to_treatment_plan(db: Session, patient_id: int, services: List[TreatmentOrderServiceCreate], clinic_id: int):
-    """Сохранить услуги из наряда в план лечения"""
+@background_task("save_services_to_treatment_plan")
+def save_services_to_treatment_plan(db: Session, patient_id: int, services: List[dict], clinic_id: int, doctor_id: int):
+    """Сохранить услуги из наряда в план лечения (фоновая задача, коммит делает очередь)"""
     
     # Находим или создаем план лечения для пациента
     treatment_plan = db.query(TreatmentPlan).filter(
@@ -340,39 +377,38 @@ async def save_services_to_treatment_plan(db: Session, patient_id: int, services
     ).first()
     
     if not treatment_plan:
-        # Создаем новый план лечения
+        # Создаем новый план лечения от имени врача, оформившего наряд
         treatment_plan = TreatmentPlan(
             patient_id=patient_id,
             clinic_id=clinic_id,
-            doctor_id=None,  # Будет установлен позже
-            status="active",
-            total_cost=0.0
+            doctor_id=doctor_id
         )
         db.add(treatment_plan)
         db.flush()
     
+    # Существующие комбинации зуб-услуга загружаем одним запросом
+    existing_combinations = set(db.query(
+        TreatmentPlanService.tooth_id,
+        TreatmentPlanService.service_id
+    ).filter(
+        TreatmentPlanService.treatment_plan_id == treatment_plan.id
+    ).all())
+    
     # Добавляем услуги в план лечения
+    added = 0
     for service_data in services:
-        if service_data.tooth_number > 0:  # Только услуги с указанным зубом
-            # Проверяем, не существует ли уже такая услуга для этого зуба
-            existing_service = db.query(TreatmentPlanService).filter(
-                TreatmentPlanService.treatment_plan_id == treatment_plan.id,
-                TreatmentPlanService.tooth_id == service_data.tooth_number,
-                TreatmentPlanService.service_id == service_data.service_id
-            ).first()
-            
-            if not existing_service:
-                # Создаем новую услугу в плане лечения
-                plan_service = TreatmentPlanService(
-                    treatment_plan_id=treatment_plan.id,
-                    service_id=service_data.service_id,
-                    service_name=service_data.service_name,
-                    service_price=service_data.service_price,
-                    tooth_id=service_data.tooth_number,
-                    quantity=service_data.quantity,
-                    is_completed=0  # По умолчанию не выполнена
-                )
-                db.add(plan_service)
+        key = (service_data["tooth_number"], service_data["service_id"])
+        if service_data["tooth_number"] > 0 and key not in existing_combinations:  # Только услуги с указанным зубом
+            db.add(TreatmentPlanService(
+                treatment_plan_id=treatment_plan.id,
+                service_id=service_data["service_id"],
+                service_name=service_data["service_name"],
+                service_price=service_data["service_price"],
+                tooth_id=service_data["tooth_number"],
+                quantity=service_data["quantity"],
+                is_completed=0  # По умолчанию не выполнена
+            ))
+            existing_combinations.add(key)
+            added += 1
     
-    db.commit()
-    print(f"✅ Сохранено {len([s for s in services if s.tooth_number > 0])} услуг в план лечения для пациента {patient_id}")
\ No newline at end of file
+    print(f"✅ Сохранено {added} услуг в план лечения для пациента {patient_id}")
@@ -1,8 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, Response, status, Query
 from sqlalchemy.orm import Session
 from typing import List, Optional
 from ..core.database import get_db
 from ..core.dependencies import require_medical_staff
+from ..core.odontogram import build_plan_chart
+from ..core.service_lines import apply_line_diff
+from ..core.versioning import check_version, commit_versioned, if_match_version, set_etag
 from ..models.user import User
 from ..models.treatment_plan import TreatmentPlan, TreatmentPlanService
 from ..schemas.treatment_plan import TreatmentPlanCreate, TreatmentPlanUpdate, TreatmentPlanResponse, TreatmentPlanServiceResponse
@@ -33,8 +36,7 @@ async def get_treatment_plans(
     
     # Фильтрация по клинике
     if clinic_id:
-        from ..models.user import User
-        query = query.join(User, TreatmentPlan.doctor_id == User.id).filter(User.clinic_id == clinic_id)
+        query = query.filter(TreatmentPlan.clinic_id == clinic_id)
     
     # Поиск по данным пациента
     if search:
@@ -94,6 +96,7 @@ async def get_treatment_plans(
             "notes": plan.notes,
             "created_at": plan.created_at,
             "updated_at": plan.updated_at,
+            "version": plan.version,
             "services": services_list,  # Список ID услуг
             "teeth_services": teeth_services_dict,  # Словарь зуб -> [услуги]
             "patient_name": patient.full_name if patient else None,
@@ -198,6 +201,7 @@ async def create_treatment_plan(
         "notes": db_treatment_plan.notes,
         "created_at": db_treatment_plan.created_at,
         "updated_at": db_treatment_plan.updated_at,
+        "version": db_treatment_plan.version,
         "services": services_list,
         "teeth_services": teeth_services_dict,
         "patient_name": patient.full_name if patient else None,
@@ -280,6 +284,7 @@ async def get_treatment_plans_by_patient(
             "notes": plan.notes,
             "created_at": plan.created_at,
             "updated_at": plan.updated_at,
+            "version": plan.version,
             "services": services_list,  # Список ID услуг
             "teeth_services": teeth_services_dict,  # Словарь зуб -> [услуги]
             "patient_name": patient.full_name if patient else None,
@@ -334,7 +339,8 @@ async def get_treatment_plan(
             "notes": service.notes
         })
     
-    # Получаем данные о зубах и услугах
+    # Получаем данные о зубах и услугах (битовая карта — в /{id}/chart: в ней нет
+    # зубов вне FDI, например tooth_id 0, и записей без услуг)
     from ..models.tooth_service import ToothService
     tooth_services = db.query(ToothService).filter(
         ToothService.treatment_plan_id == treatment_plan_id
@@ -360,6 +366,7 @@ async def get_treatment_plan(
         "notes": treatment_plan.notes,
         "created_at": treatment_plan.created_at,
         "updated_at": treatment_plan.updated_at,
+        "version": treatment_plan.version,
         "services": services_list,
         "teeth_services": teeth_services_dict,
         "patient_name": patient.full_name if patient else None,
@@ -380,22 +387,39 @@ async def get_treatment_plan(
     return plan_dict
 
 
+@router.get("/{treatment_plan_id}/chart")
+async def get_treatment_plan_chart(
+    treatment_plan_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_medical_staff)
+):
+    """Компактная зубная карта плана: битовые маски зубов и матрица «зуб × услуга»"""
+    chart = build_plan_chart(db, treatment_plan_id)
+    if chart is None:
+        raise HTTPException(status_code=404, detail="Treatment plan not found")
+    return chart
+
+
 @router.put("/{treatment_plan_id}", response_model=TreatmentPlanResponse)
 async def update_treatment_plan(
     treatment_plan_id: int,
     treatment_plan: TreatmentPlanUpdate,
+    response: Response,
     db: Session = Depends(get_db),
-    current_user: User = Depends(require_medical_staff)
+    current_user: User = Depends(require_medical_staff),
+    expected_version: Optional[int] = Depends(if_match_version)
 ):
     db_treatment_plan = db.query(TreatmentPlan).filter(TreatmentPlan.id == treatment_plan_id).first()
     if db_treatment_plan is None:
         raise HTTPException(status_code=404, detail="Treatment plan not found")
+    check_version(db_treatment_plan, expected_version)
     
     # Обновляем основные поля плана
     for field, value in treatment_plan.dict(exclude_unset=True, exclude={'services', 'patient_allergies', 'patient_chronic_diseases', 'patient_contraindications', 'patient_special_notes', 'treated_teeth'}).items():
         setattr(db_treatment_plan, field, value)
     
-    # Явно обновляем поле updated_at
+    # Явно обновляем поле updated_at — UPDATE плана выполнится (и увеличит версию),
+    # даже если изменились только услуги
     from sqlalchemy.sql import func
     db_treatment_plan.updated_at = func.now()
     
@@ -420,35 +444,56 @@ async def update_treatment_plan(
             if treatment_plan.patient_special_notes is not None:
                 patient.special_notes = treatment_plan.patient_special_notes
     
-    # Если переданы услуги, обновляем их
+    # Если переданы услуги, применяем только разницу с сохраненными строками
+    service_changes = None
     if treatment_plan.services is not None:
-        # Удаляем старые услуги
-        db.query(TreatmentPlanService).filter(
-            TreatmentPlanService.treatment_plan_id == treatment_plan_id
-        ).delete()
+        # Название и цену из справочника подставляем одним запросом для всех строк без них
+        from ..models.service import Service
+        missing_ids = {
+            service_data.service_id for service_data in treatment_plan.services
+            if not service_data.service_name or not service_data.service_price
+        }
+        catalog = {
+            service.id: service
+            for service in db.query(Service).filter(Service.id.in_(missing_ids)).all()
+        } if missing_ids else {}
         
-        # Добавляем новые услуги
+        incoming = []
         for service_data in treatment_plan.services:
-            # Получаем информацию об услуге из базы данных
-            from ..models.service import Service
-            service = db.query(Service).filter(Service.id == service_data.service_id).first()
-            
-            db_service = TreatmentPlanService(
-                treatment_plan_id=treatment_plan_id,
-                service_id=service_data.service_id,
-                tooth_id=service_data.tooth_id or 0,
-                service_name=service_data.service_name or (service.name if service else ""),
-                service_price=service_data.service_price or (service.price if service else 0.0),
-                quantity=service_data.quantity,
-                notes=service_data.notes
-            )
-            db.add(db_service)
+            service = catalog.get(service_data.service_id)
+            incoming.append({
+                "treatment_plan_id": treatment_plan_id,
+                "clinic_id": db_treatment_plan.clinic_id,
+                "service_id": service_data.service_id,
+                "tooth_id": service_data.tooth_id or 0,
+                "service_name": service_data.service_name or (service.name if service else ""),
+                "service_price": service_data.service_price or (service.price if service else 0.0),
+                "quantity": service_data.quantity,
+                "notes": service_data.notes
+            })
+        
+        existing = db.query(TreatmentPlanService).filter(
+            TreatmentPlanService.treatment_plan_id == treatment_plan_id
+        ).all()
+        service_changes = apply_line_diff(
+            db,
+            TreatmentPlanService,
+            existing,
+            incoming,
+            key_fields=("tooth_id", "service_id"),
+            value_fields=("service_name", "service_price", "quantity", "notes")
+        )
+        print(f"📝 План {treatment_plan_id}: услуг добавлено {service_changes['inserted']}, "
+              f"изменено {service_changes['updated']}, удалено {service_changes['deleted']}")
     
-    db.commit()
+    commit_versioned(db)
     db.refresh(db_treatment_plan)
+    set_etag(response, db_treatment_plan.version)
     
     # Возвращаем обновленный план с данными пациента
-    return await get_treatment_plan(treatment_plan_id, db, current_user)
+    plan = await get_treatment_plan(treatment_plan_id, db, current_user)
+    plan["service_changes"] = service_changes
+    return plan
 
 
 @router.delete("/{treatment_plan_id}")
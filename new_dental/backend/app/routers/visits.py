@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import desc, func
 from typing import List, Optional
+from datetime import date, datetime, time, timedelta
 from ..core.database import get_db
 from ..core.dependencies import get_current_user, require_medical_staff
 from ..models.visit import Visit
@@ -9,15 +10,72 @@ from ..models.patient import Patient
 from ..models.user import User
 from ..models.appointment import Appointment
 from ..models.service import Service
+from ..models.archive import ArchivedAppointment, ArchivedVisit
+from ..core.archive import archive_reaches
 from ..schemas.visit import VisitCreate, VisitUpdate, VisitResponse, VisitListResponse
 
 router = APIRouter()
 
 
+def filter_visit_dates(query, date_from: Optional[date], date_to: Optional[date], model=Visit):
+    """Ограничить период приемов; границы — наивные datetime, чтобы работало отсечение секций visits"""
+    if date_from:
+        query = query.filter(model.visit_date >= datetime.combine(date_from, time.min))
+    if date_to:
+        query = query.filter(model.visit_date < datetime.combine(date_to + timedelta(days=1), time.min))
+    return query
+
+
+def load_archived_visits(db: Session, patient_id: int, date_from: Optional[date], date_to: Optional[date]) -> List[VisitResponse]:
+    """Приемы пациента из архива; связанные имена и даты записей — пакетными запросами"""
+    archived = filter_visit_dates(
+        db.query(ArchivedVisit).filter(ArchivedVisit.patient_id == patient_id),
+        date_from, date_to, model=ArchivedVisit
+    ).all()
+    if not archived:
+        return []
+
+    patient_name = db.query(Patient.full_name).filter(Patient.id == patient_id).scalar()
+    doctor_ids = {visit.doctor_id for visit in archived}
+    doctor_names = dict(db.query(User.id, User.full_name).filter(User.id.in_(doctor_ids)).all())
+    appointment_ids = {visit.appointment_id for visit in archived if visit.appointment_id}
+    appointment_datetimes = {}
+    if appointment_ids:
+        for model in (Appointment, ArchivedAppointment):
+            appointment_datetimes.update(
+                db.query(model.id, model.appointment_datetime).filter(model.id.in_(appointment_ids)).all()
+            )
+
+    return [
+        VisitResponse(
+            id=visit.id,
+            patient_id=visit.patient_id,
+            doctor_id=visit.doctor_id,
+            appointment_id=visit.appointment_id,
+            visit_date=visit.visit_date,
+            service_id=visit.service_id,
+            service_name=visit.service_name,
+            service_price=visit.service_price,
+            diagnosis=visit.diagnosis,
+            treatment_notes=visit.treatment_notes,
+            status=visit.status,
+            created_at=visit.created_at,
+            updated_at=visit.updated_at,
+            patient_name=patient_name,
+            doctor_name=doctor_names.get(visit.doctor_id),
+            appointment_datetime=appointment_datetimes.get(visit.appointment_id)
+        )
+        for visit in archived
+    ]
+
+
 @router.get("/", response_model=VisitListResponse)
 async def get_visits(
     patient_id: Optional[int] = Query(None, description="Фильтр по ID пациента"),
     doctor_id: Optional[int] = Query(None, description="Фильтр по ID врача"),
+    clinic_id: Optional[int] = Query(None, description="Фильтр по ID клиники"),
+    date_from: Optional[date] = Query(None, description="Приемы с этой даты (включительно)"),
+    date_to: Optional[date] = Query(None, description="Приемы по эту дату (включительно)"),
     page: int = Query(1, ge=1, description="Номер страницы"),
     size: int = Query(20, ge=1, le=100, description="Размер страницы"),
     db: Session = Depends(get_db),
@@ -38,6 +96,9 @@ async def get_visits(
         query = query.filter(Visit.patient_id == patient_id)
     if doctor_id:
         query = query.filter(Visit.doctor_id == doctor_id)
+    if clinic_id:
+        query = query.filter(Visit.clinic_id == clinic_id)
+    query = filter_visit_dates(query, date_from, date_to)
     
     # Подсчитываем общее количество
     total = query.count()
@@ -280,18 +341,21 @@ async def delete_visit(
 @router.get("/patient/{patient_id}", response_model=List[VisitResponse])
 async def get_patient_visits(
     patient_id: int,
+    date_from: Optional[date] = Query(None, description="Приемы с этой даты (включительно)"),
+    date_to: Optional[date] = Query(None, description="Приемы по эту дату (включительно)"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Получить все приемы конкретного пациента"""
     require_medical_staff(current_user)
     
-    visits = db.query(Visit).options(
+    query = db.query(Visit).options(
         joinedload(Visit.patient),
         joinedload(Visit.doctor),
         joinedload(Visit.appointment),
         joinedload(Visit.service)
-    ).filter(Visit.patient_id == patient_id).order_by(desc(Visit.visit_date)).all()
+    ).filter(Visit.patient_id == patient_id)
+    visits = filter_visit_dates(query, date_from, date_to).order_by(desc(Visit.visit_date)).all()
     
     visit_responses = []
     for visit in visits:
@@ -315,24 +379,33 @@ async def get_patient_visits(
         }
         visit_responses.append(VisitResponse(**visit_dict))
     
+    # Архив подмешиваем, только если запрошенный период доходит до него
+    range_start = datetime.combine(date_from, time.min) if date_from else None
+    if archive_reaches(db, ArchivedVisit.visit_date, range_start):
+        visit_responses.extend(load_archived_visits(db, patient_id, date_from, date_to))
+        visit_responses.sort(key=lambda visit: visit.visit_date, reverse=True)
+    
     return visit_responses
 
 
 @router.get("/doctor/{doctor_id}", response_model=List[VisitResponse])
 async def get_doctor_visits(
     doctor_id: int,
+    date_from: Optional[date] = Query(None, description="Приемы с этой даты (включительно)"),
+    date_to: Optional[date] = Query(None, description="Приемы по эту дату (включительно)"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Получить все приемы конкретного врача"""
     require_medical_staff(current_user)
     
-    visits = db.query(Visit).options(
+    query = db.query(Visit).options(
         joinedload(Visit.patient),
         joinedload(Visit.doctor),
         joinedload(Visit.appointment),
         joinedload(Visit.service)
-    ).filter(Visit.doctor_id == doctor_id).order_by(desc(Visit.visit_date)).all()
+    ).filter(Visit.doctor_id == doctor_id)
+    visits = filter_visit_dates(query, date_from, date_to).order_by(desc(Visit.visit_date)).all()
     
     visit_responses = []
     for visit in visits:
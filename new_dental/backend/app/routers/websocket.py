@@ -1,29 +1,194 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
-from typing import List, Dict
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from typing import Callable, List, Dict, Optional, Set
+from datetime import datetime, timezone
 import json
 import asyncio
+from jose import jwt
+from ..core.database import SessionLocal
 from ..core.dependencies import get_current_user_from_token
 from ..models.user import User
+from ..models.role import UserRole
+from ..models.treatment_order import TreatmentOrder
+from ..models.treatment_plan import TreatmentPlan
 
 router = APIRouter()
 
+# Сколько ждать первого сообщения {"type": "auth", "token": ...}, если токен не передан в query
+AUTH_TIMEOUT_SECONDS = 10
+
+# Коды закрытия соединения (диапазон 4000-4999 зарезервирован для приложений)
+WS_CLOSE_UNAUTHORIZED = 4401
+WS_CLOSE_FORBIDDEN = 4403
+
+# Топики доменных событий вида "<сущность>:<id>" (см. core/events.py)
+TOPIC_ENTITIES = {"patient", "treatment_plan", "treatment_order"}
+# Сущности, принадлежащие одной клинике: подписка только для сотрудников этой клиники
+CLINIC_TOPIC_MODELS = {"treatment_plan": TreatmentPlan, "treatment_order": TreatmentOrder}
+STAFF_ROLES = {UserRole.ADMIN, UserRole.DOCTOR, UserRole.NURSE, UserRole.REGISTRAR}
+
+
+class WebSocketPrincipal:
+    """Пользователь, аутентифицированный при подключении WebSocket.
+
+    Токен проверяется один раз при подключении; дальше соединение работает
+    с закешированными данными и повторно проверяет токен только по истечении exp.
+    """
+
+    def __init__(self, user_id: int, role: str, clinic_id: Optional[int], expires_at: Optional[datetime]):
+        self.user_id = user_id
+        self.role = role
+        self.clinic_id = clinic_id
+        self.expires_at = expires_at
+
+    def seconds_until_expiry(self) -> Optional[float]:
+        if self.expires_at is None:
+            return None
+        return (self.expires_at - datetime.now(timezone.utc)).total_seconds()
+
+    def can_subscribe_to_doctor(self, doctor_id: int, doctor_clinic_id: Optional[int]) -> bool:
+        if self.user_id == doctor_id or self.role == UserRole.ADMIN:
+            return True
+        return doctor_clinic_id is not None and doctor_clinic_id == self.clinic_id
+
+    def can_subscribe_to_user(self, user_id: int) -> bool:
+        return self.user_id == user_id
+
+    def can_subscribe_to_topic(self, topic: str, topic_clinic_ids: Optional[Dict[str, int]] = None) -> bool:
+        """Проверка подписки на топик доменных событий.
+
+        Клиники планов и нарядов передаются в topic_clinic_ids (см. get_topic_clinic_ids);
+        топик несуществующей сущности не разрешается.
+        """
+        parts = topic.split(":")
+        if parts[0] == "clinic" and len(parts) == 3 and parts[1].isdigit():
+            return self.role == UserRole.ADMIN or int(parts[1]) == self.clinic_id
+        if parts[0] in TOPIC_ENTITIES and len(parts) == 2 and parts[1].isdigit():
+            if self.role not in STAFF_ROLES:
+                return False
+            if parts[0] not in CLINIC_TOPIC_MODELS:
+                return True
+            entity_clinic_id = (topic_clinic_ids or {}).get(topic)
+            if entity_clinic_id is None:
+                return False
+            return self.role == UserRole.ADMIN or entity_clinic_id == self.clinic_id
+        return False
+
+
+def resolve_principal(token: Optional[str]) -> Optional[WebSocketPrincipal]:
+    """Проверить JWT и загрузить пользователя (один запрос к БД)"""
+    if not token:
+        return None
+
+    db = SessionLocal()
+    try:
+        user = get_current_user_from_token(token, db)
+        if user is None:
+            return None
+        principal_data = (user.id, user.role, user.clinic_id)
+    finally:
+        db.close()
+
+    # Подпись уже проверена в get_current_user_from_token, здесь только читаем exp
+    exp = jwt.get_unverified_claims(token).get("exp")
+    expires_at = datetime.fromtimestamp(exp, tz=timezone.utc) if exp else None
+    return WebSocketPrincipal(*principal_data, expires_at=expires_at)
+
+
+def get_user_clinic_id(user_id: int) -> Optional[int]:
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.id == user_id).first()
+        return user.clinic_id if user else None
+    finally:
+        db.close()
+
+
+def get_topic_clinic_ids(topics: List[str]) -> Dict[str, int]:
+    """Клиники планов и нарядов из топиков: один запрос на тип сущности"""
+    ids_by_entity: Dict[str, Set[int]] = {}
+    for topic in topics:
+        parts = topic.split(":") if isinstance(topic, str) else []
+        if len(parts) == 2 and parts[0] in CLINIC_TOPIC_MODELS and parts[1].isdigit():
+            ids_by_entity.setdefault(parts[0], set()).add(int(parts[1]))
+    if not ids_by_entity:
+        return {}
+
+    db = SessionLocal()
+    try:
+        clinic_ids = {}
+        for entity, ids in ids_by_entity.items():
+            model = CLINIC_TOPIC_MODELS[entity]
+            for entity_id, clinic_id in db.query(model.id, model.clinic_id).filter(model.id.in_(ids)):
+                clinic_ids[f"{entity}:{entity_id}"] = clinic_id
+        return clinic_ids
+    finally:
+        db.close()
+
+
+async def authenticate_websocket(websocket: WebSocket) -> Optional[WebSocketPrincipal]:
+    """Принять соединение и аутентифицировать его.
+
+    Токен берется из query-параметра ``token`` либо из первого сообщения
+    ``{"type": "auth", "token": "..."}`` (браузер не может передать заголовок Authorization).
+    """
+    await websocket.accept()
+
+    token = websocket.query_params.get("token")
+    if not token:
+        try:
+            raw = await asyncio.wait_for(websocket.receive_text(), timeout=AUTH_TIMEOUT_SECONDS)
+            message = json.loads(raw)
+            if isinstance(message, dict) and message.get("type") == "auth":
+                token = message.get("token")
+        except (asyncio.TimeoutError, ValueError):
+            token = None
+        except WebSocketDisconnect:
+            return None
+
+    principal = await asyncio.to_thread(resolve_principal, token)
+    if principal is None:
+        await websocket.close(code=WS_CLOSE_UNAUTHORIZED, reason="Недействительный токен аутентификации")
+        return None
+
+    return principal
+
+
 class ConnectionManager:
     def __init__(self):
         # Храним активные соединения по doctor_id
         self.active_connections: Dict[int, List[WebSocket]] = {}
         # Храним соединения по user_id для общих уведомлений
         self.user_connections: Dict[int, List[WebSocket]] = {}
+        # Аутентифицированный пользователь каждого соединения
+        self.principals: Dict[WebSocket, WebSocketPrincipal] = {}
+        # Подписки на топики доменных событий
+        self.topic_connections: Dict[str, List[WebSocket]] = {}
+        self.subscriptions: Dict[WebSocket, Set[str]] = {}
+        # Другие транспорты (SSE), получающие те же события о записях
+        self.listeners: List[Callable[..., None]] = []
+
+    def add_listener(self, listener: Callable[..., None]):
+        """Подписать транспорт на события о записях: listener(event_type, data, doctor_id, user_id, event_id)"""
+        self.listeners.append(listener)
+
+    def _notify_listeners(self, event_type: str, data: dict, doctor_id: int = None, user_id: int = None, event_id: int = None):
+        for listener in self.listeners:
+            try:
+                listener(event_type, data, doctor_id, user_id, event_id)
+            except Exception as e:
+                print(f"❌ Ошибка передачи события {event_type} слушателю: {e}")
+
+    async def connect(self, websocket: WebSocket, principal: WebSocketPrincipal, doctor_id: int = None, user_id: int = None):
+        # Соединение уже принято и аутентифицировано в authenticate_websocket
+        self.principals[websocket] = principal
 
-    async def connect(self, websocket: WebSocket, doctor_id: int = None, user_id: int = None):
-        await websocket.accept()
-        
         # Добавляем соединение для конкретного врача
         if doctor_id:
             if doctor_id not in self.active_connections:
                 self.active_connections[doctor_id] = []
             self.active_connections[doctor_id].append(websocket)
-            print(f"🔌 WebSocket подключен для врача {doctor_id}")
-        
+            print(f"🔌 WebSocket подключен для врача {doctor_id} (пользователь {principal.user_id})")
+
         # Добавляем соединение для пользователя
         if user_id:
             if user_id not in self.user_connections:
@@ -31,7 +196,40 @@ class ConnectionManager:
             self.user_connections[user_id].append(websocket)
             print(f"🔌 WebSocket подключен для пользователя {user_id}")
 
+    def subscribe(self, websocket: WebSocket, topics: List[str], topic_clinic_ids: Optional[Dict[str, int]] = None) -> List[str]:
+        """Подписать соединение на топики, разрешенные его пользователю"""
+        principal = self.principals.get(websocket)
+        if principal is None:
+            return []
+
+        subscribed = self.subscriptions.setdefault(websocket, set())
+        allowed = []
+        for topic in topics:
+            if not isinstance(topic, str) or not principal.can_subscribe_to_topic(topic, topic_clinic_ids):
+                continue
+            if topic not in subscribed:
+                subscribed.add(topic)
+                self.topic_connections.setdefault(topic, []).append(websocket)
+            allowed.append(topic)
+        return allowed
+
+    def unsubscribe(self, websocket: WebSocket, topics: List[str]):
+        subscribed = self.subscriptions.get(websocket, set())
+        for topic in topics:
+            if topic not in subscribed:
+                continue
+            subscribed.discard(topic)
+            connections = self.topic_connections.get(topic, [])
+            if websocket in connections:
+                connections.remove(websocket)
+            if not connections:
+                self.topic_connections.pop(topic, None)
+
     def disconnect(self, websocket: WebSocket, doctor_id: int = None, user_id: int = None):
+        self.principals.pop(websocket, None)
+        self.unsubscribe(websocket, list(self.subscriptions.get(websocket, ())))
+        self.subscriptions.pop(websocket, None)
+
         # Удаляем соединение для врача
         if doctor_id and doctor_id in self.active_connections:
             if websocket in self.active_connections[doctor_id]:
@@ -39,7 +237,7 @@ class ConnectionManager:
                 if not self.active_connections[doctor_id]:
                     del self.active_connections[doctor_id]
                 print(f"🔌 WebSocket отключен для врача {doctor_id}")
-        
+
         # Удаляем соединение для пользователя
         if user_id and user_id in self.user_connections:
             if websocket in self.user_connections[user_id]:
@@ -64,10 +262,10 @@ class ConnectionManager:
                 except Exception as e:
                     print(f"❌ Ошибка отправки врачу {doctor_id}: {e}")
                     disconnected.append(connection)
-            
+
             # Удаляем отключенные соединения
             for connection in disconnected:
-                self.active_connections[doctor_id].remove(connection)
+                self.disconnect(connection, doctor_id=doctor_id)
 
     async def broadcast_to_user(self, message: str, user_id: int):
         """Отправить сообщение всем подключенным клиентам конкретного пользователя"""
@@ -79,79 +277,174 @@ class ConnectionManager:
                 except Exception as e:
                     print(f"❌ Ошибка отправки пользователю {user_id}: {e}")
                     disconnected.append(connection)
-            
+
             # Удаляем отключенные соединения
             for connection in disconnected:
-                self.user_connections[user_id].remove(connection)
+                self.disconnect(connection, user_id=user_id)
+
+    async def broadcast_to_topic(self, topic: str, payload: dict):
+        """Отправить доменное событие всем подписчикам топика"""
+        connections = self.topic_connections.get(topic)
+        if not connections:
+            return
 
-    async def broadcast_appointment_update(self, appointment_data: dict, doctor_id: int = None, user_id: int = None):
+        message = json.dumps(payload, default=str)
+        disconnected = []
+        for connection in list(connections):
+            try:
+                await connection.send_text(message)
+            except Exception as e:
+                print(f"❌ Ошибка отправки события {topic}: {e}")
+                disconnected.append(connection)
+
+        for connection in disconnected:
+            self.unsubscribe(connection, [topic])
+
+    async def broadcast_appointment_update(self, appointment_data: dict, doctor_id: int = None, user_id: int = None, event_id: int = None):
         """Отправить обновление записи на прием"""
         message = json.dumps({
-            "type": "appointment_update",
+            "type": "appointment_updated",
+            "event_id": event_id,
             "data": appointment_data
         })
-        
+        self._notify_listeners("appointment_updated", appointment_data, doctor_id, user_id, event_id)
+
         if doctor_id:
             await self.broadcast_to_doctor(message, doctor_id)
-        
+
         if user_id:
             await self.broadcast_to_user(message, user_id)
 
-    async def broadcast_appointment_created(self, appointment_data: dict, doctor_id: int = None, user_id: int = None):
+    async def broadcast_appointment_created(self, appointment_data: dict, doctor_id: int = None, user_id: int = None, event_id: int = None):
         """Отправить уведомление о новой записи"""
         message = json.dumps({
             "type": "appointment_created",
+            "event_id": event_id,
             "data": appointment_data
         })
-        
+        self._notify_listeners("appointment_created", appointment_data, doctor_id, user_id, event_id)
+
+        if doctor_id:
+            await self.broadcast_to_doctor(message, doctor_id)
+
+        if user_id:
+            await self.broadcast_to_user(message, user_id)
+
+    async def broadcast_appointments_batch(self, batch_data: dict, doctor_id: int = None, user_id: int = None, event_id: int = None):
+        """Отправить одно уведомление о серии созданных или перенесенных записей"""
+        message = json.dumps({
+            "type": "appointments_batch",
+            "event_id": event_id,
+            "data": batch_data
+        })
+        self._notify_listeners("appointments_batch", batch_data, doctor_id, user_id, event_id)
+
         if doctor_id:
             await self.broadcast_to_doctor(message, doctor_id)
-        
+
         if user_id:
             await self.broadcast_to_user(message, user_id)
 
 # Глобальный менеджер соединений
 manager = ConnectionManager()
 
-@router.websocket("/ws/appointments/{doctor_id}")
+
+async def receive_until_expiry(websocket: WebSocket, principal: WebSocketPrincipal):
+    """Цикл приема сообщений клиента.
+
+    Токен повторно проверяется только когда клиент присылает новый
+    ({"type": "auth"}) или когда истекает срок действия текущего.
+    """
+    while True:
+        timeout = principal.seconds_until_expiry()
+        if timeout is not None and timeout <= 0:
+            await websocket.close(code=WS_CLOSE_UNAUTHORIZED, reason="Срок действия токена истек")
+            return
+
+        try:
+            data = await asyncio.wait_for(websocket.receive_text(), timeout=timeout)
+        except asyncio.TimeoutError:
+            # Токен истек — на следующей итерации соединение будет закрыто
+            continue
+
+        try:
+            message = json.loads(data)
+        except ValueError:
+            message = None
+
+        if isinstance(message, dict) and message.get("type") == "auth":
+            refreshed = await asyncio.to_thread(resolve_principal, message.get("token"))
+            if refreshed is None or refreshed.user_id != principal.user_id:
+                await websocket.close(code=WS_CLOSE_UNAUTHORIZED, reason="Недействительный токен аутентификации")
+                return
+            principal.role = refreshed.role
+            principal.clinic_id = refreshed.clinic_id
+            principal.expires_at = refreshed.expires_at
+            await manager.send_personal_message(json.dumps({"type": "auth_ok"}), websocket)
+            continue
+
+        if isinstance(message, dict) and message.get("type") == "subscribe":
+            requested = list(message.get("topics") or [])
+            # Клиника плана или наряда проверяется при подписке, а не при каждом событии
+            topic_clinic_ids = await asyncio.to_thread(get_topic_clinic_ids, requested)
+            topics = manager.subscribe(websocket, requested, topic_clinic_ids)
+            await manager.send_personal_message(json.dumps({"type": "subscribed", "topics": topics}), websocket)
+            continue
+
+        if isinstance(message, dict) and message.get("type") == "unsubscribe":
+            manager.unsubscribe(websocket, list(message.get("topics") or []))
+            continue
+
+        # Отправляем подтверждение (ping/pong для поддержания соединения)
+        await manager.send_personal_message(json.dumps({
+            "type": "pong",
+            "message": "Соединение активно"
+        }), websocket)
+
+
+@router.websocket("/appointments/{doctor_id}")
 async def websocket_endpoint(websocket: WebSocket, doctor_id: int):
     """WebSocket endpoint для real-time обновлений записей врача"""
-    await manager.connect(websocket, doctor_id=doctor_id)
-    
+    principal = await authenticate_websocket(websocket)
+    if principal is None:
+        return
+
+    # Авторизация подписки выполняется один раз при подключении
+    doctor_clinic_id = None
+    if principal.user_id != doctor_id and principal.role != UserRole.ADMIN:
+        doctor_clinic_id = await asyncio.to_thread(get_user_clinic_id, doctor_id)
+    if not principal.can_subscribe_to_doctor(doctor_id, doctor_clinic_id):
+        await websocket.close(code=WS_CLOSE_FORBIDDEN, reason="Недостаточно прав для подписки")
+        return
+
+    await manager.connect(websocket, principal, doctor_id=doctor_id)
+
     try:
-        while True:
-            # Ждем сообщения от клиента (ping/pong для поддержания соединения)
-            data = await websocket.receive_text()
-            
-            # Отправляем подтверждение
-            await manager.send_personal_message(json.dumps({
-                "type": "pong",
-                "message": "Соединение активно"
-            }), websocket)
-            
+        await receive_until_expiry(websocket, principal)
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket, doctor_id=doctor_id)
-        print(f"🔌 WebSocket отключен для врача {doctor_id}")
 
-@router.websocket("/ws/user/{user_id}")
+@router.websocket("/user/{user_id}")
 async def websocket_user_endpoint(websocket: WebSocket, user_id: int):
     """WebSocket endpoint для общих уведомлений пользователя"""
-    await manager.connect(websocket, user_id=user_id)
-    
+    principal = await authenticate_websocket(websocket)
+    if principal is None:
+        return
+
+    if not principal.can_subscribe_to_user(user_id):
+        await websocket.close(code=WS_CLOSE_FORBIDDEN, reason="Недостаточно прав для подписки")
+        return
+
+    await manager.connect(websocket, principal, user_id=user_id)
+
     try:
-        while True:
-            # Ждем сообщения от клиента
-            data = await websocket.receive_text()
-            
-            # Отправляем подтверждение
-            await manager.send_personal_message(json.dumps({
-                "type": "pong",
-                "message": "Соединение активно"
-            }), websocket)
-            
+        await receive_until_expiry(websocket, principal)
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket, user_id=user_id)
-        print(f"🔌 WebSocket отключен для пользователя {user_id}")
 
 # Функции для использования в других роутерах
 async def notify_appointment_created(appointment_data: dict, doctor_id: int = None, user_id: int = None):
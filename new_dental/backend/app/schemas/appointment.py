@@ -1,6 +1,6 @@
-from pydantic import BaseModel
-from typing import Optional
-from datetime import datetime
+from pydantic import BaseModel, Field, field_validator
+from typing import List, Literal, Optional
+from datetime import date, datetime
 from ..models.appointment import AppointmentStatus
 
 
@@ -9,6 +9,7 @@ class AppointmentBase(BaseModel):
     doctor_id: Optional[int] = None
     registrar_id: int
     appointment_datetime: datetime
+    duration_minutes: int = Field(30, ge=5, le=480, description="Длительность приема в минутах")
     service_type: Optional[str] = None
     notes: Optional[str] = None
 
@@ -23,9 +24,18 @@ class AppointmentCreate(AppointmentBase):
 class AppointmentUpdate(BaseModel):
     doctor_id: Optional[int] = None
     appointment_datetime: Optional[datetime] = None
+    duration_minutes: Optional[int] = Field(None, ge=5, le=480)
     status: Optional[str] = None
     notes: Optional[str] = None
 
+    @field_validator("appointment_datetime", "duration_minutes")
+    @classmethod
+    def reject_null(cls, value):
+        # Поля можно не передавать, но явный null недопустим: столбцы NOT NULL
+        if value is None:
+            raise ValueError("Значение не может быть null")
+        return value
+
     class Config:
         arbitrary_types_allowed = True
 
@@ -35,6 +45,7 @@ class AppointmentResponse(AppointmentBase):
     status: str
     created_at: datetime
     updated_at: Optional[datetime] = None
+    version: Optional[int] = None  # Для If-Match; у архивных записей нет
     # Данные пациента
     patient_name: Optional[str] = None
     patient_phone: Optional[str] = None
@@ -48,3 +59,44 @@ class AppointmentResponse(AppointmentBase):
     class Config:
         from_attributes = True
         arbitrary_types_allowed = True
+
+
+class FreeSlot(BaseModel):
+    start: datetime
+    end: datetime
+
+
+class FreeSlotsResponse(BaseModel):
+    doctor_id: int
+    duration_minutes: int
+    slots: List[FreeSlot]
+
+
+class AppointmentRecurrence(BaseModel):
+    start: datetime
+    frequency: Literal["daily", "weekly"] = "weekly"
+    interval: int = Field(1, ge=1, le=52, description="Каждый N-й день/неделю")
+    count: Optional[int] = Field(None, ge=1, le=100, description="Количество приемов")
+    until: Optional[date] = Field(None, description="Последний день серии (включительно)")
+
+
+class AppointmentBulkCreate(BaseModel):
+    patient_id: int
+    doctor_id: Optional[int] = None
+    registrar_id: int
+    duration_minutes: int = Field(30, ge=5, le=480)
+    service_type: Optional[str] = None
+    notes: Optional[str] = None
+    # Либо явный список времени приемов, либо правило повторения
+    datetimes: Optional[List[datetime]] = None
+    recurrence: Optional[AppointmentRecurrence] = None
+    # true — пропустить занятые слоты и создать остальные; false — ничего не создавать при конфликте
+    skip_conflicts: bool = False
+
+
+class AppointmentBulkReschedule(BaseModel):
+    doctor_id: int
+    date: date
+    # Куда переносим: на другой день (время сохраняется) и/или к другому врачу
+    target_date: Optional[date] = None
+    target_doctor_id: Optional[int] = None
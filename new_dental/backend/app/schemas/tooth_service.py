@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import List, Dict, Optional
+from datetime import datetime
 
 
 class ToothServiceBase(BaseModel):
@@ -23,3 +24,27 @@ class ToothServiceResponse(ToothServiceBase):
 class ToothServiceUpdate(BaseModel):
     service_ids: Optional[List[int]] = None
     service_statuses: Optional[Dict[int, str]] = None
+
+
+class ToothServiceStatusResponse(BaseModel):
+    id: int
+    tooth_service_id: int
+    treatment_plan_id: int
+    patient_id: int
+    clinic_id: int
+    tooth_id: int
+    service_id: int
+    status: str
+    updated_at: Optional[datetime] = None
+
+
+class ToothChartUpdate(BaseModel):
+    teeth: Dict[int, List[int]]  # {tooth_id: [service_ids]}; зубы без услуг удаляются из плана
+    service_statuses: Optional[Dict[int, Dict[int, str]]] = None  # {tooth_id: {service_id: status}}
+
+
+class ToothChartResponse(BaseModel):
+    treatment_plan_id: int
+    version: int  # Версия плана — для If-Match следующего сохранения
+    tooth_services: List[ToothServiceResponse]
+    changes: Dict[str, int]
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 class TreatmentOrderServiceCreate(BaseModel):
@@ -47,6 +47,9 @@ class TreatmentOrderResponse(BaseModel):
     total_amount: float
     status: str
     created_at: datetime
+    version: Optional[int] = None  # Для If-Match
+    # Размер разницы в строках услуг после PUT: {"inserted", "updated", "deleted"}
+    service_changes: Optional[Dict[str, int]] = None
 
     class Config:
         from_attributes = True
\ No newline at end of file
@@ -56,6 +56,7 @@ class TreatmentPlanResponse(TreatmentPlanBase):
     id: int
     created_at: datetime
     updated_at: Optional[datetime] = None
+    version: Optional[int] = None  # Для If-Match
     services: List[TreatmentPlanServiceResponse]
     teeth_services: Optional[Dict[int, List[int]]] = None  # {tooth_id: [service_ids]}
     # Данные пациента
@@ -73,6 +74,8 @@ class TreatmentPlanResponse(TreatmentPlanBase):
     selected_teeth: Optional[List[int]] = None
     treated_teeth: Optional[List[int]] = None
     status: Optional[str] = "active"
+    # Размер разницы в строках услуг после PUT: {"inserted", "updated", "deleted"}
+    service_changes: Optional[Dict[str, int]] = None
 
     class Config:
         from_attributes = True
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Скрипт для переноса старых приемов и отмененных/старых записей в архивные таблицы.
+Создает таблицы appointments_archive и visits_archive, если их нет.
+Запускать по расписанию (cron), например раз в сутки ночью.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.database import engine, SessionLocal
+from app.core.archive import archive_old_records
+from app.models import Base, ArchivedAppointment, ArchivedVisit
+
+def run_archival():
+    """Перенести в архив строки старше горизонта хранения"""
+    print("🔄 Архивируем старые записи и приемы...")
+    
+    Base.metadata.create_all(bind=engine, tables=[ArchivedAppointment.__table__, ArchivedVisit.__table__])
+    
+    db = SessionLocal()
+    try:
+        moved = archive_old_records(db)
+        print(f"✅ Перенесено в архив: приемов — {moved['visits']}, записей — {moved['appointments']}")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Ошибка при архивировании: {e}")
+        return False
+    finally:
+        db.close()
+    
+    return True
+
+if __name__ == "__main__":
+    if not run_archival():
+        sys.exit(1)
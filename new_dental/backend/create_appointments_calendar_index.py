@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Скрипт для пересоздания индекса ix_appointments_doctor_datetime как покрывающего
+(INCLUDE колонок, которые читает /appointments/calendar)
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.database import engine
+from sqlalchemy import text
+
+def create_appointments_calendar_index():
+    """Пересоздать индекс без блокировки записи в таблицу (CONCURRENTLY)"""
+    print("🔄 Пересоздаем индекс ix_appointments_doctor_datetime с INCLUDE...")
+    
+    try:
+        # CREATE/DROP INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("""
+                CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_appointments_doctor_datetime_covering
+                ON appointments (doctor_id, appointment_datetime)
+                INCLUDE (id, patient_id, duration_minutes, status, service_type)
+            """))
+            conn.execute(text("DROP INDEX CONCURRENTLY IF EXISTS ix_appointments_doctor_datetime"))
+            conn.execute(text("""
+                ALTER INDEX ix_appointments_doctor_datetime_covering
+                RENAME TO ix_appointments_doctor_datetime
+            """))
+            conn.execute(text("ANALYZE appointments"))
+        print("✅ Индекс ix_appointments_doctor_datetime пересоздан.")
+    except Exception as e:
+        print(f"❌ Ошибка при создании индекса: {e}")
+        return False
+    
+    return True
+
+if __name__ == "__main__":
+    if not create_appointments_calendar_index():
+        sys.exit(1)
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Скрипт для создания таблицы background_jobs (durable-режим очереди фоновых задач)
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.database import engine
+from app.models.background_job import BackgroundJob
+from app.models import Base
+
+def create_background_jobs_table():
+    """Создать таблицу background_jobs (нужна при TASK_QUEUE_MODE=database)"""
+    print("🔄 Создаем таблицу background_jobs...")
+    
+    try:
+        Base.metadata.create_all(bind=engine, tables=[BackgroundJob.__table__])
+        print("✅ Таблица background_jobs успешно создана!")
+    except Exception as e:
+        print(f"❌ Ошибка при создании таблицы background_jobs: {e}")
+        return False
+    
+    return True
+
+if __name__ == "__main__":
+    if not create_background_jobs_table():
+        sys.exit(1)
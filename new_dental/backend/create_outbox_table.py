@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Скрипт для создания таблицы outbox_events (очередь real-time уведомлений)
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.database import engine
+from app.models.outbox import OutboxEvent
+from app.models import Base
+
+def create_outbox_table():
+    """Создать таблицу outbox_events с индексами неотправленных и опубликованных событий"""
+    print("🔄 Создаем таблицу outbox_events...")
+    
+    try:
+        Base.metadata.create_all(bind=engine, tables=[OutboxEvent.__table__])
+        # create_all не добавляет индексы в уже существующую таблицу
+        for index in OutboxEvent.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
+        print("✅ Таблица outbox_events успешно создана!")
+    except Exception as e:
+        print(f"❌ Ошибка при создании таблицы outbox_events: {e}")
+        return False
+    
+    return True
+
+if __name__ == "__main__":
+    if not create_outbox_table():
+        sys.exit(1)
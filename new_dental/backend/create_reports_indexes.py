@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Скрипт для создания индексов отчетов по выручке (/reports/revenue):
+ix_treatment_orders_clinic_visit_date и ix_treatment_order_services_order
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.database import engine
+from sqlalchemy import text
+
+INDEXES = [
+    ("ix_treatment_orders_clinic_visit_date", "treatment_orders (clinic_id, visit_date)"),
+    ("ix_treatment_order_services_order", "treatment_order_services (treatment_order_id)"),
+]
+
+def create_reports_indexes():
+    """Создать индексы без блокировки записи в таблицы (CONCURRENTLY)"""
+    print("🔄 Создаем индексы для отчетов по выручке...")
+    
+    try:
+        # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for name, target in INDEXES:
+                print(f"➕ {name}")
+                conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {target}"))
+            conn.execute(text("ANALYZE treatment_orders"))
+            conn.execute(text("ANALYZE treatment_order_services"))
+        print("✅ Индексы для отчетов созданы.")
+    except Exception as e:
+        print(f"❌ Ошибка при создании индексов: {e}")
+        return False
+    
+    return True
+
+if __name__ == "__main__":
+    if not create_reports_indexes():
+        sys.exit(1)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Обслуживание месячных секций appointments и visits.
+
+Создает секции на несколько месяцев вперед и (по желанию) отсоединяет секции
+старше заданного срока — отсоединенные таблицы <таблица>_YYYY_MM остаются в базе
+для архива и удаляются вручную. Запускать по расписанию (cron), например раз в сутки:
+
+    python manage_partitions.py --months-ahead 3 --retain-months 36
+"""
+
+import sys
+import os
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import date
+from app.core.database import engine
+from app.core.partitions import (
+    PARTITIONED_TABLES,
+    add_months,
+    create_month_partition,
+    detach_partitions_before,
+    is_partitioned,
+    month_start,
+    partition_name,
+)
+
+
+def manage_partitions(months_ahead: int, retain_months: int = None) -> bool:
+    ok = True
+    today = date.today()
+    for table in PARTITIONED_TABLES:
+        with engine.begin() as conn:
+            if not is_partitioned(conn, table):
+                print(f"⚠️ Таблица {table} не секционирована — запустите partition_appointments_visits.py")
+                ok = False
+                continue
+
+        # Каждая секция в своей транзакции: если в default-секции уже есть строки
+        # за этот месяц, создание не удастся, но остальные секции будут созданы
+        for offset in range(months_ahead + 1):
+            month = add_months(month_start(today), offset)
+            try:
+                with engine.begin() as conn:
+                    if create_month_partition(conn, table, month):
+                        print(f"➕ Создана секция {partition_name(table, month)}")
+            except Exception as e:
+                print(f"❌ Не удалось создать секцию {partition_name(table, month)}: {e}")
+                print(f"ℹ️ Перенесите строки за этот месяц из {table}_default и повторите запуск.")
+                ok = False
+
+        if retain_months:
+            cutoff = add_months(month_start(today), -retain_months)
+            try:
+                with engine.begin() as conn:
+                    for name in detach_partitions_before(conn, table, cutoff):
+                        print(f"📦 Секция {name} отсоединена от {table}")
+            except Exception as e:
+                print(f"❌ Ошибка при отсоединении старых секций {table}: {e}")
+                ok = False
+
+    if ok:
+        print("✅ Секции appointments и visits в порядке.")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Обслуживание месячных секций appointments и visits")
+    parser.add_argument("--months-ahead", type=int, default=3, help="На сколько месяцев вперед создавать секции")
+    parser.add_argument("--retain-months", type=int, default=None, help="Отсоединять секции старше N месяцев")
+    args = parser.parse_args()
+
+    if not manage_partitions(args.months_ahead, args.retain_months):
+        sys.exit(1)
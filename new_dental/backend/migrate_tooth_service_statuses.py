@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Скрипт для переноса услуг зубов из JSON-столбцов tooth_services.service_ids /
+service_statuses в таблицу tooth_service_statuses (строка на услугу зуба).
+
+Перенос идемпотентен (ON CONFLICT DO NOTHING); услуги, которых уже нет в справочнике,
+пропускаются. JSON-столбцы после переноса приложением не используются: NOT NULL
+с service_ids снимается, а сами столбцы удаляются только с флагом --drop-json-columns
+(после проверки переноса).
+"""
+
+import sys
+import os
+import argparse
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.database import Base, engine
+from app.models import ToothServiceStatus
+from sqlalchemy import text
+
+COPY_SQL = """
+    INSERT INTO tooth_service_statuses (tooth_service_id, service_id, status, updated_at)
+    SELECT ts.id,
+           ids.service_id::int,
+           COALESCE(ts.service_statuses ->> ids.service_id, 'pending'),
+           now()
+    FROM tooth_services ts
+    CROSS JOIN LATERAL json_array_elements_text(ts.service_ids) AS ids(service_id)
+    WHERE EXISTS (SELECT 1 FROM services s WHERE s.id = ids.service_id::int)
+    ON CONFLICT (tooth_service_id, service_id) DO NOTHING
+"""
+
+
+def json_columns_exist(conn):
+    return conn.execute(text("""
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_name = 'tooth_services' AND column_name = 'service_ids'
+    """)).fetchone() is not None
+
+
+def migrate_tooth_service_statuses(drop_json_columns: bool = False):
+    print("🔄 Перенос статусов услуг зубов в tooth_service_statuses...")
+
+    try:
+        Base.metadata.create_all(bind=engine, tables=[ToothServiceStatus.__table__])
+        print("✅ Таблица tooth_service_statuses готова.")
+
+        with engine.begin() as conn:
+            if not json_columns_exist(conn):
+                print("ℹ️ JSON-столбцов в tooth_services уже нет — переносить нечего.")
+                return True
+
+            copied = conn.execute(text(COPY_SQL)).rowcount
+            print(f"✅ Перенесено статусов услуг: {copied}")
+
+            conn.execute(text("ALTER TABLE tooth_services ALTER COLUMN service_ids DROP NOT NULL"))
+
+            if drop_json_columns:
+                print("➖ Удаляем столбцы service_ids и service_statuses...")
+                conn.execute(text("ALTER TABLE tooth_services DROP COLUMN service_ids, DROP COLUMN service_statuses"))
+            else:
+                print("ℹ️ Столбцы service_ids и service_statuses оставлены; удалите их флагом --drop-json-columns.")
+    except Exception as e:
+        print(f"❌ Ошибка при переносе статусов услуг: {e}")
+        return False
+
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Перенос статусов услуг зубов из JSON в tooth_service_statuses")
+    parser.add_argument("--drop-json-columns", action="store_true", help="Удалить JSON-столбцы после переноса")
+    args = parser.parse_args()
+
+    if not migrate_tooth_service_statuses(args.drop_json_columns):
+        sys.exit(1)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Скрипт для перевода таблиц appointments и visits на помесячное секционирование
+(PARTITION BY RANGE по appointment_datetime / visit_date).
+
+Каждая таблица переводится в одной транзакции под ACCESS EXCLUSIVE блокировкой —
+запускайте в окно обслуживания. Старая таблица сохраняется как <таблица>_unpartitioned.
+
+Ограничения секционированной таблицы:
+- первичный ключ становится (id, <ключ секционирования>);
+- внешние ключи на appointments.id (visits, treatment_orders) удаляются —
+  PostgreSQL не позволяет ссылаться на столбец без ключа секционирования;
+- ограничение пересечения записей врача действует внутри каждой месячной секции.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import date
+from app.core.database import engine
+from app.core.partitions import (
+    PARTITIONED_TABLES,
+    add_months,
+    create_default_partition,
+    create_month_partition,
+    is_partitioned,
+    month_start,
+)
+from app.models import Appointment, Visit
+from sqlalchemy import text
+
+# Сколько месяцев вперед создавать секции сразу
+MONTHS_AHEAD = 3
+
+MODELS = {
+    "appointments": Appointment,
+    "visits": Visit,
+}
+
+
+def rename_old_table(conn, table):
+    """Переименовать старую таблицу вместе с ограничениями и индексами, чтобы освободить имена"""
+    old = f"{table}_unpartitioned"
+    conn.execute(text(f"ALTER TABLE {table} RENAME TO {old}"))
+
+    constraints = conn.execute(text("""
+        SELECT conname FROM pg_constraint
+        WHERE conrelid = CAST(:table AS regclass) AND contype IN ('p', 'u', 'x')
+    """), {"table": old}).scalars().all()
+    for name in constraints:
+        conn.execute(text(f'ALTER TABLE {old} RENAME CONSTRAINT "{name}" TO "{name[:48]}_unpartitioned"'))
+
+    indexes = conn.execute(text("""
+        SELECT indexname FROM pg_indexes
+        WHERE tablename = :table AND indexname NOT LIKE '%\\_unpartitioned'
+    """), {"table": old}).scalars().all()
+    for name in indexes:
+        conn.execute(text(f'ALTER INDEX "{name}" RENAME TO "{name[:48]}_unpartitioned"'))
+    return old
+
+
+def copy_outgoing_foreign_keys(conn, table, new):
+    """LIKE не копирует внешние ключи — переносим ссылки на patients, users и т.д."""
+    rows = conn.execute(text("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = CAST(:table AS regclass) AND contype = 'f'
+    """), {"table": table}).all()
+    for name, definition in rows:
+        conn.execute(text(f'ALTER TABLE {new} ADD CONSTRAINT "{name}" {definition}'))
+
+
+def drop_referencing_foreign_keys(conn, table):
+    rows = conn.execute(text("""
+        SELECT conrelid::regclass::text, conname FROM pg_constraint
+        WHERE confrelid = CAST(:table AS regclass) AND contype = 'f'
+    """), {"table": table}).all()
+    for referencing_table, name in rows:
+        print(f"➖ Удаляем внешний ключ {referencing_table}.{name} (ссылки на секционированную таблицу не поддерживаются)")
+        conn.execute(text(f'ALTER TABLE {referencing_table} DROP CONSTRAINT "{name}"'))
+
+
+def partition_table(table):
+    key = PARTITIONED_TABLES[table]
+    new = f"{table}_partitioned"
+
+    with engine.begin() as conn:
+        if is_partitioned(conn, table):
+            print(f"ℹ️ Таблица {table} уже секционирована.")
+            return
+
+        print(f"🔄 Переводим {table} на секционирование по {key}...")
+        conn.execute(text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+        sequence = conn.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table}).scalar()
+
+        conn.execute(text(f"""
+            CREATE TABLE {new} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+            PARTITION BY RANGE ({key})
+        """))
+        conn.execute(text(f"ALTER TABLE {new} ADD CONSTRAINT {new}_pkey PRIMARY KEY (id, {key})"))
+
+        # Секции от самого раннего месяца с данными до MONTHS_AHEAD вперед
+        first = conn.execute(text(f"SELECT MIN({key}) FROM {table}")).scalar()
+        month = month_start(first.date() if first else date.today())
+        last = add_months(month_start(date.today()), MONTHS_AHEAD)
+        created = 0
+        while month <= last:
+            create_month_partition(conn, table, month, parent=new)
+            month = add_months(month, 1)
+            created += 1
+        create_default_partition(conn, table, parent=new)
+        print(f"✅ Создано месячных секций: {created}")
+
+        copied = conn.execute(text(f"INSERT INTO {new} SELECT * FROM {table}")).rowcount
+        print(f"✅ Скопировано строк: {copied}")
+
+        drop_referencing_foreign_keys(conn, table)
+        copy_outgoing_foreign_keys(conn, table, new)
+        rename_old_table(conn, table)
+        conn.execute(text(f"ALTER TABLE {new} RENAME TO {table}"))
+        conn.execute(text(f"ALTER TABLE {table} RENAME CONSTRAINT {new}_pkey TO {table}_pkey"))
+        if sequence:
+            conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table}.id"))
+
+        # Индексы модели создаются на родительской таблице и наследуются секциями
+        for index in MODELS[table].__table__.indexes:
+            index.create(bind=conn)
+
+        conn.execute(text(f"ANALYZE {table}"))
+        print(f"✅ Таблица {table} секционирована (старая сохранена как {table}_unpartitioned).")
+
+
+def partition_appointments_visits():
+    try:
+        for table in PARTITIONED_TABLES:
+            partition_table(table)
+    except Exception as e:
+        print(f"❌ Ошибка при секционировании: {e}")
+        return False
+    return True
+
+if __name__ == "__main__":
+    if not partition_appointments_visits():
+        sys.exit(1)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Скрипт ночной сверки показателей дашборда (clinic_daily_metrics).
+Пересчитывает последние METRICS_RECONCILE_DAYS дней из записей и нарядов и исправляет
+расхождения, которые не поймала инкрементальная поддержка (правки базы в обход API).
+Множество пациентов врачей (clinic_doctor_patients) строится заново при каждом запуске.
+Создает таблицы, если их нет; с флагом --all пересчитывает всю историю (первичное заполнение).
+Запускать по расписанию (cron), например раз в сутки ночью.
+"""
+
+import sys
+import os
+import argparse
+from datetime import date, timedelta
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import settings
+from app.core.database import engine, SessionLocal
+from app.core.metrics import rebuild_doctor_patients, reconcile_metrics
+from app.models import Base, ClinicDailyMetrics, ClinicDoctorPatient
+
+def run_reconciliation(days: int, full: bool = False):
+    """Пересчитать показатели за последние days дней (или за всю историю)"""
+    Base.metadata.create_all(bind=engine, tables=[ClinicDailyMetrics.__table__, ClinicDoctorPatient.__table__])
+
+    date_from = None if full else date.today() - timedelta(days=days - 1)
+    print(f"🔄 Пересчитываем показатели {'за всю историю' if full else f'с {date_from}'}...")
+
+    db = SessionLocal()
+    try:
+        # Сегодняшние и будущие записи тоже сверяются: верхней границы нет
+        rows = reconcile_metrics(db, date_from)
+        pairs = rebuild_doctor_patients(db)
+        db.commit()
+        print(f"✅ Показатели пересчитаны: строк — {rows}, пар врач-пациент — {pairs}")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Ошибка при пересчете показателей: {e}")
+        return False
+    finally:
+        db.close()
+
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сверка предрасчитанных показателей дашборда клиники")
+    parser.add_argument("--days", type=int, default=settings.metrics_reconcile_days, help="Сколько последних дней пересчитать")
+    parser.add_argument("--all", action="store_true", help="Пересчитать всю историю")
+    args = parser.parse_args()
+
+    if not run_reconciliation(args.days, args.all):
+        sys.exit(1)
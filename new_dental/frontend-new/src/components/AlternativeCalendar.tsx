@@ -7,16 +7,17 @@ interface Appointment {
   id: number;
   patient_id: number;
   doctor_id: number;
-  registrar_id: number;
+  registrar_id?: number;
   appointment_datetime: string;
+  duration_minutes?: number;
   start_time?: string;
   end_time?: string;
   status: string;
   service_type?: string;
   notes?: string;
   patient_name?: string;
-  created_at: string;
-  updated_at: string;
+  created_at?: string;
+  updated_at?: string;
 }
 import AppointmentModal from './AppointmentModal';
 
@@ -56,7 +57,7 @@ const AlternativeCalendar: React.FC<AlternativeCalendarProps> = ({ doctorId, onN
       const startDate = format(monthStart, 'yyyy-MM-dd');
       const endDate = format(monthEnd, 'yyyy-MM-dd');
       console.log('📅 Загружаем записи для месяца:', { startDate, endDate, doctorId });
-      const data = await appointmentsApi.getAppointmentsByDateRange(doctorId, startDate, endDate);
+      const data = await appointmentsApi.getCalendar([doctorId], startDate, endDate);
       console.log('📋 Загружены записи:', data);
       setAppointments(data);
     } catch (error) {
@@ -103,7 +104,7 @@ const AlternativeCalendar: React.FC<AlternativeCalendarProps> = ({ doctorId, onN
       const startDate = format(selectedStartDate, 'yyyy-MM-dd');
       const endDate = selectedEndDate ? format(selectedEndDate, 'yyyy-MM-dd') : startDate;
       
-      const data = await appointmentsApi.getAppointmentsByDateRange(doctorId, startDate, endDate);
+      const data = await appointmentsApi.getCalendar([doctorId], startDate, endDate);
       setAppointments(data);
       
       // Сворачиваем все дни после загрузки записей
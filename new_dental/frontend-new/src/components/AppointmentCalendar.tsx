@@ -1,7 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import AppointmentModal from './AppointmentModal';
 import { appointmentsApi } from '../services/appointmentsApi';
-import { websocketService, AppointmentData } from '../services/websocket';
+import { websocketService, AppointmentData, AppointmentsBatchData } from '../services/websocket';
 // import type { Appointment as ApiAppointment } from '../services/appointmentsApi';
 
 // Интерфейс для отображения в календаре (с дополнительными полями для удобства)
@@ -22,6 +22,7 @@ interface Appointment {
   end_time: string;
   status: string;
   notes: string;
+  version?: number; // Версия записи для If-Match
 }
 
 
@@ -232,12 +233,24 @@ const AppointmentCalendar: React.FC<AppointmentCalendarProps> = ({
       }
     };
 
+    // Серия записей создана или перенесена одним запросом — перезагружаем календарь один раз
+    websocketService.onAppointmentsBatch = (data: AppointmentsBatchData) => {
+      console.log('📡 WebSocket: Серия записей изменена:', data);
+      fetchAppointments();
+    };
+
+    // Опрос, пока нет ни WebSocket, ни SSE, и перезагрузка после пропуска событий
+    websocketService.onResync = () => {
+      fetchAppointments();
+    };
+
     // Подключаемся к WebSocket
     websocketService.connect(doctorId);
 
     // Очистка при размонтировании
     return () => {
       console.log('🔌 Отключаем WebSocket');
+      websocketService.onResync = null;
       websocketService.disconnect();
     };
   }, [doctorId, onAppointmentCreated, onAppointmentUpdated]);
@@ -271,7 +284,8 @@ const AppointmentCalendar: React.FC<AppointmentCalendarProps> = ({
           start_time: time,
           end_time: time, // Пока используем то же время, можно добавить логику для расчета времени окончания
           status: apiApp.status,
-          notes: apiApp.notes || ''
+          notes: apiApp.notes || '',
+          version: apiApp.version
         };
       });
       
@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
-import api from '../services/api';
+import api, { confirmReloadAfterConflict, ifMatch, isVersionConflict, postIdempotent } from '../services/api';
 import TreatmentOrderModal from './TreatmentOrderModal';
 import { doctorsApi } from '../services/doctorsApi';
 import type { Doctor } from '../types/doctor';
@@ -38,6 +38,7 @@ interface Appointment {
   end_time: string;
   status: string;
   notes: string;
+  version?: number; // Версия записи для If-Match
 }
 
 interface TreatmentPlan {
@@ -524,7 +525,7 @@ const AppointmentModal: React.FC<AppointmentModalProps> = ({
       if (!existingPatient) {
         console.log('🆕 Создаем нового пациента в БД...');
         
-        const { data: newPatient } = await api.post('/patients/', {
+        const { data: newPatient } = await postIdempotent('/patients/', {
           full_name: formData.full_name,
           phone: formData.phone,
           iin: formData.iin,
@@ -581,7 +582,12 @@ const AppointmentModal: React.FC<AppointmentModalProps> = ({
       if (appointment) {
         // Обновление существующей записи
         console.log('💾 Обновляем запись в БД:', appointmentData);
-        const { data: updatedAppointment } = await api.put(`/appointments/${appointment.id}`, appointmentData);
+        // If-Match: если запись уже изменили (перенесли, отменили), сервер вернет 412 вместо перезаписи
+        const { data: updatedAppointment } = await api.put(
+          `/appointments/${appointment.id}`,
+          appointmentData,
+          ifMatch(appointment.version)
+        );
         console.log('✅ Запись обновлена в БД:', updatedAppointment);
         onAppointmentUpdated(updatedAppointment);
       } else {
@@ -594,6 +600,16 @@ const AppointmentModal: React.FC<AppointmentModalProps> = ({
       
       onClose();
     } catch (error) {
+      if (appointment && isVersionConflict(error)) {
+        setError('Запись уже изменил другой пользователь');
+        if (confirmReloadAfterConflict()) {
+          // Календарь перезагружает записи после обновления — передаем актуальную версию
+          const { data: currentAppointment } = await api.get(`/appointments/${appointment.id}`);
+          onAppointmentUpdated(currentAppointment);
+          onClose();
+        }
+        return;
+      }
       setError('Ошибка при сохранении записи');
       console.error('Ошибка при сохранении записи:', error);
     } finally {
@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef, useCallback } from 'react';
 import { useNavigate, useSearchParams } from 'react-router-dom';
-import api from '../services/api';
+import api, { confirmReloadAfterConflict, ifMatch, isVersionConflict, postIdempotent } from '../services/api';
 import TeethMap from '../components/TeethMap';
 import CalendarSwitcher from '../components/CalendarSwitcher';
 import { clinicPatientsApi } from '../services/clinicPatientsApi';
@@ -46,6 +46,7 @@ interface TreatmentPlan {
   total_cost: number; // Общая стоимость плана
   selected_teeth: number[]; // ID выбранных зубов
   treated_teeth?: number[]; // ID зубов, которые уже вылечены
+  version?: number; // Версия плана для If-Match
   teethServices?: Record<number, number[]>; // Услуги для каждого зуба: {зуб: [услуги]}
   teeth_services?: Record<number, number[]>; // Альтернативное поле от API
   // Новое поле для хранения данных о зубах и услугах в новом формате
@@ -730,7 +731,7 @@ const Doctor: React.FC = () => {
           birth_date: editingPatient.birth_date
         });
         
-        const { data: newPatient } = await api.post('/patients/', {
+        const { data: newPatient } = await postIdempotent('/patients/', {
           full_name: editingPatient.full_name,
           phone: cleanPhone,
           iin: editingPatient.iin,
@@ -885,16 +886,8 @@ const Doctor: React.FC = () => {
           
           const treatmentPlanId = response.data.id;
           
-          // Сохраняем данные о зубах и услугах
-          for (const [toothId, serviceIds] of Object.entries(teethServices)) {
-            if (serviceIds.length > 0) {
-              await api.post('/tooth-services', {
-                treatment_plan_id: treatmentPlanId,
-                tooth_id: parseInt(toothId),
-                service_ids: serviceIds
-              });
-            }
-          }
+          // Сохраняем данные о зубах и услугах — вся карта одним запросом
+          await api.put(`/tooth-services/treatment-plan/${treatmentPlanId}`, { teeth: teethServices });
           
           console.log('✅ План лечения и данные о зубах успешно сохранены в БД');
         } catch (error) {
@@ -948,28 +941,34 @@ const Doctor: React.FC = () => {
             }
           }
           
-          await api.put(`/treatment-plans/${editingTreatmentPlan.id}`, {
+          // If-Match с версией, которую видел врач: если план уже изменили (например, медсестра), сервер вернет 412
+          const { data: savedPlan } = await api.put(`/treatment-plans/${editingTreatmentPlan.id}`, {
             diagnosis: updatedPlan.diagnosis,
             notes: updatedPlan.treatment_description,
             services: servicesWithTeeth
-          });
+          }, ifMatch(editingTreatmentPlan.version));
           
-          // Удаляем старые данные о зубах и услугах
-          await api.delete(`/tooth-services/treatment-plan/${editingTreatmentPlan.id}`);
-          
-          // Сохраняем новые данные о зубах и услугах
-          for (const [toothId, serviceIds] of Object.entries(teethServices)) {
-            if (serviceIds.length > 0) {
-              await api.post('/tooth-services', {
-                treatment_plan_id: editingTreatmentPlan.id,
-                tooth_id: parseInt(toothId),
-                service_ids: serviceIds
-              });
-            }
-          }
+          // Сохраняем данные о зубах и услугах — сервер применит только разницу с сохраненной картой
+          const { data: savedChart } = await api.put(
+            `/tooth-services/treatment-plan/${editingTreatmentPlan.id}`,
+            { teeth: teethServices },
+            ifMatch(savedPlan.version)
+          );
           
+          // Следующее сохранение должно идти с новой версией
+          setTreatmentPlans(plans => plans.map(p =>
+            p.id === editingTreatmentPlan.id ? { ...p, version: savedChart.version } : p
+          ));
           console.log('✅ План лечения и данные о зубах успешно обновлены в БД');
         } catch (error) {
+          if (isVersionConflict(error)) {
+            setShowTreatmentPlanModal(false);
+            setEditingTreatmentPlan(null);
+            if (confirmReloadAfterConflict()) {
+              fetchData();
+            }
+            return;
+          }
           console.error('❌ Ошибка при обновлении в БД:', error);
         }
       }
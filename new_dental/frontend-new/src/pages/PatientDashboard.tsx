@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { authService } from '../services/auth';
+import { patientSummaryApi } from '../services/patientSummaryApi';
 import TeethMap from '../components/TeethMap';
 
 interface Patient {
@@ -85,70 +86,54 @@ const PatientDashboard: React.FC = () => {
 
   const fetchPatientData = async () => {
     try {
-      const testPatient: Patient = {
-        id: parseInt(patientId || '1'),
-        full_name: 'Иванов Иван Иванович',
-        phone: '+7 (777) 123-45-67',
-        iin: '030317123456',
-        birth_date: '2003-03-17',
-        created_at: '2024-01-15'
-      };
+      const summary = await patientSummaryApi.getSummary(parseInt(patientId || '1'));
+      const patientName = summary.patient.full_name;
 
-      const testTreatmentPlans: TreatmentPlan[] = [
-        {
-          id: 1,
-          patient_id: parseInt(patientId || '1'),
-          patient_name: testPatient.full_name,
-          diagnosis: 'Кариес зубов 18, 21',
-          treatment_description: 'Лечение кариеса, пломбирование',
-          created_at: '2024-01-20',
-          status: 'active',
-          services: [1, 2],
-          total_cost: 15000,
-          selected_teeth: [18, 21]
-        }
-      ];
+      const plans: TreatmentPlan[] = summary.treatment_plans.map(plan => ({
+        id: plan.id,
+        patient_id: summary.patient.id,
+        patient_name: patientName,
+        diagnosis: plan.diagnosis || '',
+        treatment_description: plan.notes || '',
+        created_at: plan.created_at,
+        status: plan.services.length > 0 && plan.services.every(line => line.is_completed) ? 'completed' : 'active',
+        services: Array.from(new Set(plan.services.map(line => line.service_id))),
+        total_cost: plan.services.reduce((sum, line) => sum + line.service_price * (line.quantity || 1), 0),
+        selected_teeth: Array.from(new Set(plan.services.map(line => line.tooth_id || 0).filter(toothId => toothId > 0)))
+      }));
 
-      const testAppointments: Appointment[] = [
-        {
-          id: 1,
-          patient_id: parseInt(patientId || '1'),
-          patient_name: testPatient.full_name,
-          doctor_id: 1,
-          appointment_date: '2024-01-25',
-          appointment_time: '10:00',
-          status: 'scheduled',
-          notes: 'Консультация по плану лечения'
-        }
-      ];
+      const patientAppointments: Appointment[] = summary.appointments.map(appointment => ({
+        id: appointment.id,
+        patient_id: summary.patient.id,
+        patient_name: patientName,
+        doctor_id: appointment.doctor_id || 0,
+        appointment_date: appointment.appointment_datetime,
+        appointment_time: appointment.appointment_datetime.slice(11, 16),
+        status: appointment.status,
+        notes: appointment.notes || ''
+      }));
 
-      const testServices: Service[] = [
-        {
-          id: 1,
-          name: 'Лечение кариеса',
-          description: 'Лечение кариозных полостей',
-          price: 8000,
-          category: 'therapy',
-          duration: '30 минут',
-          complexity: 'средняя',
-          is_active: true
-        },
-        {
-          id: 2,
-          name: 'Пломбирование',
-          description: 'Установка пломбы',
-          price: 7000,
-          category: 'therapy',
-          duration: '45 минут',
-          complexity: 'средняя',
-          is_active: true
+      // Справочник услуг — из строк планов (название и цена на момент назначения)
+      const planServices = new Map<number, Service>();
+      summary.treatment_plans.forEach(plan => plan.services.forEach(line => {
+        if (!planServices.has(line.service_id)) {
+          planServices.set(line.service_id, {
+            id: line.service_id,
+            name: line.service_name,
+            description: '',
+            price: line.service_price,
+            category: '',
+            duration: '',
+            complexity: '',
+            is_active: true
+          });
         }
-      ];
+      }));
 
-      setPatient(testPatient);
-      setTreatmentPlans(testTreatmentPlans);
-      setAppointments(testAppointments);
-      setServices(testServices);
+      setPatient(summary.patient);
+      setTreatmentPlans(plans);
+      setAppointments(patientAppointments);
+      setServices(Array.from(planServices.values()));
       setLoading(false);
     } catch (error) {
       console.error('Ошибка загрузки данных пациента:', error);
@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate, useParams } from 'react-router-dom';
-import api from '../services/api';
+import api, { confirmReloadAfterConflict, ifMatch, isVersionConflict } from '../services/api';
 import TeethMap from '../components/TeethMap';
 
 interface Service {
@@ -37,6 +37,7 @@ interface TreatmentPlan {
   teethServices?: Record<number, number[]>;
   toothServicesData?: any[];
   treated_teeth?: number[];
+  version?: number; // Версия плана для If-Match
   patient_allergies?: string;
   patient_chronic_diseases?: string;
   patient_contraindications?: string;
@@ -1087,8 +1088,8 @@ const TreatmentPlanPage: React.FC = () => {
       
       console.log('💾 Обновляем план лечения:', updatedPlan);
       
-      // Обновляем план лечения в БД
-      await api.put(`/treatment-plans/${planId}`, {
+      // Обновляем план лечения в БД; If-Match — версия, загруженная на эту страницу
+      const { data: savedPlan } = await api.put(`/treatment-plans/${planId}`, {
         diagnosis: updatedPlan.diagnosis,
         notes: updatedPlan.notes,
         patient_allergies: updatedPlan.patient_allergies,
@@ -1096,29 +1097,15 @@ const TreatmentPlanPage: React.FC = () => {
         patient_contraindications: updatedPlan.patient_contraindications,
         patient_special_notes: updatedPlan.patient_special_notes,
         status: updatedPlan.status
-      });
+      }, ifMatch(editingTreatmentPlan.version));
       
-      // Обновляем данные о зубах и услугах в БД
+      // Обновляем данные о зубах и услугах в БД — вся карта одним запросом
       try {
-        // Удаляем старые данные
-        await api.delete(`/tooth-services/treatment-plan/${planId}`);
-        
-        // Создаем новые данные
-        const servicesWithTeeth = [];
-        for (const [toothId, serviceIds] of Object.entries(teethServices)) {
-          if (serviceIds.length > 0) {
-            servicesWithTeeth.push({
-              treatment_plan_id: parseInt(planId!),
-              tooth_id: parseInt(toothId),
-              service_ids: serviceIds
-            });
-          }
-        }
-        
-        // Сохраняем новые данные
-        for (const serviceData of servicesWithTeeth) {
-          await api.post('/tooth-services/', serviceData);
-        }
+        const { data: savedChart } = await api.put(
+          `/tooth-services/treatment-plan/${planId}`,
+          { teeth: teethServices },
+          ifMatch(savedPlan.version)
+        );
         
         console.log('✅ План лечения и данные о зубах успешно обновлены в БД');
         
@@ -1130,7 +1117,8 @@ const TreatmentPlanPage: React.FC = () => {
         // Обновляем состояние плана, очищая selected_teeth
         setEditingTreatmentPlan(prev => prev ? {
           ...prev,
-          selected_teeth: []
+          selected_teeth: [],
+          version: savedChart.version
         } : null);
         
         // Показываем уведомление об успешном сохранении
@@ -1140,10 +1128,20 @@ const TreatmentPlanPage: React.FC = () => {
         navigate(-1);
         
       } catch (error) {
+        if (isVersionConflict(error)) {
+          throw error;
+        }
         console.error('❌ Ошибка при обновлении данных о зубах в БД:', error);
       }
       
     } catch (error) {
+      // План уже изменил другой пользователь — предлагаем загрузить актуальную версию
+      if (isVersionConflict(error)) {
+        if (confirmReloadAfterConflict()) {
+          fetchData();
+        }
+        return;
+      }
       console.error('❌ Ошибка при сохранении плана лечения:', error);
       alert('❌ Ошибка при сохранении плана лечения');
     } finally {
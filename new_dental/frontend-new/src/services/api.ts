@@ -97,4 +97,38 @@ api.interceptors.response.use(
   }
 );
 
+// Ключ идемпотентности: crypto.randomUUID недоступен вне https/localhost
+const newIdempotencyKey = () =>
+  typeof crypto !== 'undefined' && typeof crypto.randomUUID === 'function'
+    ? crypto.randomUUID()
+    : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+
+// POST создания с заголовком Idempotency-Key: при обрыве связи запрос повторяется
+// с тем же ключом, и сервер возвращает уже сохраненный ответ вместо создания дубля
+export const postIdempotent = async <T = any>(url: string, data: unknown, retries = 2) => {
+  const headers = { 'Idempotency-Key': newIdempotencyKey() };
+  for (let attempt = 0; ; attempt++) {
+    try {
+      return await api.post<T>(url, data, { headers });
+    } catch (error: any) {
+      // Повторяем только сетевые ошибки — если сервер ответил, ответ окончательный
+      if (attempt >= retries || error.response) {
+        throw error;
+      }
+    }
+  }
+};
+
+// Заголовок If-Match для оптимистической блокировки (версия не известна — без проверки)
+export const ifMatch = (version?: number | null) =>
+  version === undefined || version === null ? {} : { headers: { 'If-Match': `"${version}"` } };
+
+// 412 — изменение отправлено по устаревшей версии (If-Match), 409 — запись изменили параллельно
+export const isVersionConflict = (error: any) =>
+  error?.response?.status === 412 || error?.response?.status === 409;
+
+// Сообщить о конфликте версий; true — пользователь хочет загрузить актуальные данные
+export const confirmReloadAfterConflict = () =>
+  window.confirm('Данные уже изменил другой пользователь, ваши изменения не сохранены.\nЗагрузить актуальную версию?');
+
 export default api;
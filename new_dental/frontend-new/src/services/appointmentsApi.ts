@@ -1,4 +1,4 @@
-import api from './api';
+import api, { ifMatch, postIdempotent } from './api';
 
 export interface Appointment {
   id: number;
@@ -18,6 +18,27 @@ export interface Appointment {
   notes: string;
   created_at: string;
   updated_at: string;
+  version?: number;
+}
+
+// Запись в компактном формате календаря (/appointments/calendar)
+export interface CalendarAppointment {
+  id: number;
+  doctor_id: number;
+  patient_id: number;
+  patient_name: string;
+  appointment_datetime: string;
+  duration_minutes: number;
+  status: string;
+  service_type?: string;
+}
+
+interface CalendarPayload {
+  date_from: string;
+  date_to: string;
+  columns: string[];
+  rows: any[][];
+  patients: Record<string, string>;
 }
 
 export interface AppointmentCreate {
@@ -29,6 +50,31 @@ export interface AppointmentCreate {
   notes?: string;
 }
 
+export interface AppointmentBulkCreate {
+  patient_id: number;
+  doctor_id?: number;
+  registrar_id: number;
+  duration_minutes?: number;
+  service_type?: string;
+  notes?: string;
+  datetimes?: string[];
+  recurrence?: {
+    start: string;
+    frequency?: 'daily' | 'weekly';
+    interval?: number;
+    count?: number;
+    until?: string;
+  };
+  skip_conflicts?: boolean;
+}
+
+export interface AppointmentBulkReschedule {
+  doctor_id: number;
+  date: string;
+  target_date?: string;
+  target_doctor_id?: number;
+}
+
 export interface AppointmentUpdate {
   patient_id?: number;
   doctor_id?: number;
@@ -79,6 +125,30 @@ export const appointmentsApi = {
     return response.data;
   },
 
+  // Получить записи врачей для сетки календаря (даты включительно, формат yyyy-MM-dd)
+  getCalendar: async (doctorIds: number[], dateFrom: string, dateTo: string): Promise<CalendarAppointment[]> => {
+    const params = new URLSearchParams({ date_from: dateFrom, date_to: dateTo });
+    doctorIds.forEach(id => params.append('doctor_id', String(id)));
+    const response = await api.get(`/appointments/calendar?${params.toString()}`);
+    const payload: CalendarPayload = response.data;
+
+    const index = (name: string) => payload.columns.indexOf(name);
+    const [iId, iDoctor, iPatient, iStart, iDuration, iStatus, iService] = [
+      'id', 'doctor_id', 'patient_id', 'start', 'duration_minutes', 'status', 'service_type'
+    ].map(index);
+
+    return payload.rows.map(row => ({
+      id: row[iId],
+      doctor_id: row[iDoctor],
+      patient_id: row[iPatient],
+      patient_name: payload.patients[String(row[iPatient])] || '',
+      appointment_datetime: row[iStart],
+      duration_minutes: row[iDuration],
+      status: row[iStatus],
+      service_type: row[iService] ?? undefined,
+    }));
+  },
+
   // Получить записи по ID пациента
   getByPatientId: async (patientId: number): Promise<Appointment[]> => {
     // Получаем все записи с пагинацией
@@ -115,18 +185,31 @@ export const appointmentsApi = {
 
   // Создать новую запись
   create: async (appointment: AppointmentCreate): Promise<Appointment> => {
-    const response = await api.post('/appointments/', appointment);
+    const response = await postIdempotent('/appointments/', appointment);
+    return response.data;
+  },
+
+  // Создать серию записей (курс лечения) одним запросом
+  createBulk: async (payload: AppointmentBulkCreate): Promise<{ created: { id: number; appointment_datetime: string }[]; skipped: string[] }> => {
+    const response = await api.post('/appointments/bulk', payload);
+    return response.data;
+  },
+
+  // Перенести все записи врача за день на другой день и/или к другому врачу
+  rescheduleDay: async (payload: AppointmentBulkReschedule): Promise<{ moved: { id: number; appointment_datetime: string }[]; count: number }> => {
+    const response = await api.patch('/appointments/bulk', payload);
     return response.data;
   },
 
   // Обновить запись
-  update: async (id: number, appointment: AppointmentUpdate): Promise<Appointment> => {
-    const response = await api.put(`/appointments/${id}`, appointment);
+  // version — версия, которую видел пользователь: если запись уже изменили, сервер вернет 412
+  update: async (id: number, appointment: AppointmentUpdate, version?: number): Promise<Appointment> => {
+    const response = await api.put(`/appointments/${id}`, appointment, ifMatch(version));
     return response.data;
   },
 
   // Отменить запись
-  cancel: async (id: number): Promise<void> => {
-    await api.delete(`/appointments/${id}`);
+  cancel: async (id: number, version?: number): Promise<void> => {
+    await api.delete(`/appointments/${id}`, ifMatch(version));
   }
 };
@@ -9,6 +9,23 @@ export interface Clinic {
   is_active: boolean;
 }
 
+export interface ScheduleAppointment {
+  id: number;
+  patient_id: number;
+  patient_name: string;
+  start: string;
+  duration_minutes: number;
+  status: string;
+  service_type?: string | null;
+}
+
+export interface ClinicSchedule {
+  clinic_id: number;
+  date: string;
+  doctors: { doctor_id: number; doctor_name: string; appointments: ScheduleAppointment[] }[];
+  unassigned: ScheduleAppointment[];
+}
+
 export const clinicApi = {
   // Получить информацию о текущей клинике
   getCurrentClinic: async (): Promise<Clinic> => {
@@ -22,6 +39,12 @@ export const clinicApi = {
     return response.data;
   },
 
+  // Расписание всех врачей клиники на день (date в формате yyyy-MM-dd)
+  getSchedule: async (clinicId: number, date: string): Promise<ClinicSchedule> => {
+    const response = await api.get(`/clinics/${clinicId}/schedule`, { params: { date } });
+    return response.data;
+  },
+
   // Создать новую клинику (только для админа)
   createClinic: async (clinic: Omit<Clinic, 'id' | 'is_active'>): Promise<Clinic> => {
     const response = await api.post('/clinics/', clinic);
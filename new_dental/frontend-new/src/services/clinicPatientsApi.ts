@@ -34,6 +34,37 @@ export interface DoctorStats {
   full_name: string;
   role: string;
   patient_count: number;
+  appointments: number;
+  completed: number;
+  cancelled: number;
+  revenue: number;
+}
+
+export interface DashboardDay {
+  day: string;
+  appointments: number;
+  completed: number;
+  cancelled: number;
+  patients: number;
+  revenue: number;
+}
+
+export interface ClinicDashboard {
+  clinic_id: number;
+  date_from: string;
+  date_to: string;
+  days: DashboardDay[];
+  totals: Omit<DashboardDay, 'day'>;
+}
+
+export interface PatientImportReport {
+  clinic_id: number;
+  dry_run: boolean;
+  total: number;
+  created: number;
+  linked: number;
+  failed: number;
+  errors: { line: number; iin?: string; errors: string[] }[];
 }
 
 export const clinicPatientsApi = {
@@ -62,8 +93,29 @@ export const clinicPatientsApi = {
   },
 
   // Получить статистику по врачам
-  getDoctorsStats: async (): Promise<DoctorStats[]> => {
-    const response = await api.get<DoctorStats[]>('/clinic-patients/doctors-stats');
+  getDoctorsStats: async (dateFrom?: string, dateTo?: string): Promise<DoctorStats[]> => {
+    const params = new URLSearchParams();
+    if (dateFrom) params.append('date_from', dateFrom);
+    if (dateTo) params.append('date_to', dateTo);
+    const response = await api.get<DoctorStats[]>(`/clinic-patients/doctors-stats?${params.toString()}`);
+    return response.data;
+  },
+
+  // Показатели клиники по дням за период
+  getDashboard: async (dateFrom?: string, dateTo?: string, doctorId?: number): Promise<ClinicDashboard> => {
+    const params = new URLSearchParams();
+    if (dateFrom) params.append('date_from', dateFrom);
+    if (dateTo) params.append('date_to', dateTo);
+    if (doctorId) params.append('doctor_id', doctorId.toString());
+    const response = await api.get<ClinicDashboard>(`/clinic-patients/dashboard?${params.toString()}`);
+    return response.data;
+  },
+
+  // Импорт пациентов клиники из CSV или NDJSON
+  importPatients: async (file: File, dryRun: boolean = false): Promise<PatientImportReport> => {
+    const formData = new FormData();
+    formData.append('file', file);
+    const response = await api.post<PatientImportReport>(`/patients/import?dry_run=${dryRun}`, formData);
     return response.data;
   },
 
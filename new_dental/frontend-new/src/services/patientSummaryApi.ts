@@ -0,0 +1,96 @@
+import api from './api';
+
+export interface SummaryServiceLine {
+  id: number;
+  service_id: number;
+  service_name: string;
+  service_price: number;
+  quantity: number;
+  is_completed: number;
+  tooth_id?: number;
+  tooth_number?: number;
+}
+
+export interface PatientSummary {
+  patient: {
+    id: number;
+    full_name: string;
+    phone: string;
+    iin: string;
+    birth_date: string;
+    allergies?: string;
+    chronic_diseases?: string;
+    contraindications?: string;
+    special_notes?: string;
+    created_at: string;
+    updated_at?: string;
+  };
+  stats: {
+    appointments: number;
+    visits: number;
+    treatment_plans: number;
+    treatment_orders: number;
+    treatment_orders_total: number;
+  };
+  page_size: number;
+  appointments: {
+    id: number;
+    doctor_id?: number;
+    doctor_name?: string;
+    clinic_id: number;
+    appointment_datetime: string;
+    duration_minutes: number;
+    status: string;
+    service_type?: string;
+    notes?: string;
+    version: number;
+  }[];
+  visits: {
+    id: number;
+    doctor_id: number;
+    doctor_name?: string;
+    clinic_id: number;
+    appointment_id?: number;
+    visit_date: string;
+    service_id?: number;
+    service_name?: string;
+    service_price?: number;
+    diagnosis?: string;
+    treatment_notes?: string;
+    status: string;
+  }[];
+  treatment_plans: {
+    id: number;
+    doctor_id: number;
+    doctor_name?: string;
+    clinic_id: number;
+    diagnosis?: string;
+    notes?: string;
+    treated_teeth?: number[];
+    created_at: string;
+    updated_at?: string;
+    version: number;
+    services: SummaryServiceLine[];
+  }[];
+  treatment_orders: {
+    id: number;
+    doctor_id: number;
+    doctor_name?: string;
+    clinic_id: number;
+    appointment_id?: number;
+    visit_date: string;
+    total_amount: number;
+    status: string;
+    created_at: string;
+    version: number;
+    services: SummaryServiceLine[];
+  }[];
+}
+
+export const patientSummaryApi = {
+  // Сводка пациента одним запросом: данные, записи, приемы, планы и наряды
+  getSummary: async (patientId: number): Promise<PatientSummary> => {
+    const response = await api.get<PatientSummary>(`/patients/${patientId}/summary`);
+    return response.data;
+  },
+};
@@ -0,0 +1,76 @@
+import api from './api';
+
+export type RevenueGroupBy = 'day' | 'doctor' | 'service';
+
+export interface RevenueRow {
+  day?: string;
+  doctor_id?: number;
+  doctor_name?: string;
+  service_id?: number;
+  service_name?: string;
+  quantity?: number;
+  patients?: number;
+  orders: number;
+  revenue: number;
+}
+
+export interface RevenueReport {
+  clinic_id: number | null;
+  date_from: string;
+  date_to: string;
+  group_by: RevenueGroupBy;
+  rows: RevenueRow[];
+  totals: {
+    orders: number;
+    patients: number;
+    revenue: number;
+  };
+}
+
+export interface RevenueReportParams {
+  clinicId?: number;
+  from?: string;
+  to?: string;
+  groupBy?: RevenueGroupBy;
+}
+
+const revenueParams = (params: RevenueReportParams, format: 'json' | 'csv') => {
+  const search = new URLSearchParams({ group_by: params.groupBy || 'day', format });
+  if (params.clinicId) search.append('clinic_id', params.clinicId.toString());
+  if (params.from) search.append('from', params.from);
+  if (params.to) search.append('to', params.to);
+  return search.toString();
+};
+
+export type ExportEntity = 'patients' | 'visits' | 'treatment-orders';
+export type ExportFormat = 'csv' | 'ndjson';
+
+export interface ExportParams {
+  clinicId?: number;
+  from?: string;
+  to?: string;
+}
+
+export const reportsApi = {
+  // Выручка по нарядам за период
+  getRevenue: async (params: RevenueReportParams = {}): Promise<RevenueReport> => {
+    const response = await api.get<RevenueReport>(`/reports/revenue?${revenueParams(params, 'json')}`);
+    return response.data;
+  },
+
+  // Тот же отчет в CSV (для скачивания)
+  getRevenueCsv: async (params: RevenueReportParams = {}): Promise<Blob> => {
+    const response = await api.get(`/reports/revenue?${revenueParams(params, 'csv')}`, { responseType: 'blob' });
+    return response.data;
+  },
+
+  // Потоковая выгрузка пациентов, приемов или нарядов файлом
+  exportData: async (entity: ExportEntity, params: ExportParams = {}, format: ExportFormat = 'csv'): Promise<Blob> => {
+    const search = new URLSearchParams({ format });
+    if (params.clinicId) search.append('clinic_id', params.clinicId.toString());
+    if (params.from) search.append('from', params.from);
+    if (params.to) search.append('to', params.to);
+    const response = await api.get(`/reports/export/${entity}?${search.toString()}`, { responseType: 'blob' });
+    return response.data;
+  },
+};
@@ -1,4 +1,4 @@
-import api from './api';
+import api, { ifMatch, postIdempotent } from './api';
 import type { TreatmentOrder, TreatmentOrderCreate } from '../types/treatmentOrder';
 
 // Реэкспортируем типы для обратной совместимости
@@ -24,13 +24,14 @@ export const treatmentOrdersApi = {
 
   // Создать наряд
   create: async (treatmentOrder: TreatmentOrderCreate): Promise<TreatmentOrder> => {
-    const response = await api.post('/treatment-orders/', treatmentOrder);
+    const response = await postIdempotent('/treatment-orders/', treatmentOrder);
     return response.data;
   },
 
   // Обновить наряд
-  update: async (id: number, treatmentOrder: { notes?: string }): Promise<TreatmentOrder> => {
-    const response = await api.put(`/treatment-orders/${id}`, treatmentOrder);
+  // version — версия, которую видел пользователь: если наряд уже изменили, сервер вернет 412
+  update: async (id: number, treatmentOrder: { notes?: string }, version?: number): Promise<TreatmentOrder> => {
+    const response = await api.put(`/treatment-orders/${id}`, treatmentOrder, ifMatch(version));
     return response.data;
   },
 
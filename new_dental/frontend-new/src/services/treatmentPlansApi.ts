@@ -1,4 +1,4 @@
-import api from './api';
+import api, { ifMatch } from './api';
 
 export interface TreatmentPlan {
   id: number;
@@ -20,10 +20,37 @@ export interface TreatmentPlan {
   status: string;
   created_at: string;
   updated_at?: string;
+  version?: number;
   teethServices?: Record<number, number[]>;
   toothServicesData?: any[];
 }
 
+// Битовая карта зубов плана (/treatment-plans/{id}/chart): бит зуба — индекс в TOOTH_NUMBERS
+export interface ToothChart {
+  treatment_plan_id: number;
+  selected_mask: number;
+  treated_mask: number;
+  completed_mask: number;
+  services: number[];
+  service_masks: number[];
+  completed_service_masks: number[];
+}
+
+// Постоянные зубы 11–48 (биты 0–31), затем молочные 51–85 (биты 32–51)
+export const TOOTH_NUMBERS: number[] = [
+  ...[1, 2, 3, 4].flatMap(q => [1, 2, 3, 4, 5, 6, 7, 8].map(t => q * 10 + t)),
+  ...[5, 6, 7, 8].flatMap(q => [1, 2, 3, 4, 5].map(t => q * 10 + t)),
+];
+
+// Маски шире 32 бит — побитовые операторы JS их обрезают, поэтому проверяем арифметикой
+export const maskHasTooth = (mask: number, toothId: number): boolean => {
+  const bit = TOOTH_NUMBERS.indexOf(toothId);
+  return bit >= 0 && Math.floor(mask / 2 ** bit) % 2 === 1;
+};
+
+export const maskTeeth = (mask: number): number[] =>
+  TOOTH_NUMBERS.filter(toothId => maskHasTooth(mask, toothId));
+
 export interface TreatmentPlanCreate {
   patient_id: number;
   doctor_id: number;
@@ -81,6 +108,12 @@ export const treatmentPlansApi = {
     return response.data;
   },
 
+  // Получить компактную зубную карту плана
+  getChart: async (id: number): Promise<ToothChart> => {
+    const response = await api.get(`/treatment-plans/${id}/chart`);
+    return response.data;
+  },
+
   // Создать новый план лечения
   create: async (plan: TreatmentPlanCreate): Promise<TreatmentPlan> => {
     const response = await api.post('/treatment-plans/', plan);
@@ -88,8 +121,9 @@ export const treatmentPlansApi = {
   },
 
   // Обновить план лечения
-  update: async (id: number, plan: TreatmentPlanUpdate): Promise<TreatmentPlan> => {
-    const response = await api.put(`/treatment-plans/${id}`, plan);
+  // version — версия, которую видел пользователь: если план уже изменили, сервер вернет 412
+  update: async (id: number, plan: TreatmentPlanUpdate, version?: number): Promise<TreatmentPlan> => {
+    const response = await api.put(`/treatment-plans/${id}`, plan, ifMatch(version));
     return response.data;
   },
 
@@ -1,9 +1,19 @@
-import { api } from './api';
+import api from './api';
 
 export interface WebSocketMessage {
-  type: 'appointment_created' | 'appointment_updated' | 'pong';
+  type: 'appointment_created' | 'appointment_updated' | 'appointments_batch' | 'pong' | 'domain_event' | 'subscribed';
+  event_id?: number | null;
   data?: any;
   message?: string;
+  topic?: string;
+  topics?: string[];
+  changes?: DomainEventChange[];
+}
+
+export interface DomainEventChange {
+  entity: string;
+  id: number | null;
+  action: 'created' | 'updated' | 'deleted';
 }
 
 export interface AppointmentData {
@@ -20,8 +30,36 @@ export interface AppointmentData {
   updated_at?: string;
 }
 
+// Серия записей, созданная или перенесенная одним запросом
+export interface AppointmentsBatchData {
+  action: 'created' | 'rescheduled';
+  appointment_ids: number[];
+  doctor_id?: number | null;
+  patient_id?: number;
+  dates?: string[];
+  from?: { doctor_id: number; date: string };
+  to?: { doctor_id: number; date: string };
+}
+
+// События о записях, которые приходят и по WebSocket, и по SSE
+const APPOINTMENT_EVENTS = ['appointment_created', 'appointment_updated', 'appointments_batch'];
+// Пока нет ни WebSocket, ни SSE, календарь перезагружается с этим интервалом
+const POLL_INTERVAL_MS = 30000;
+// Пауза перед пересозданием закрытого SSE-потока (например, после истечения токена)
+const SSE_RECONNECT_DELAY_MS = 5000;
+
+const getToken = () =>
+  localStorage.getItem('access_token') || sessionStorage.getItem('access_token') || localStorage.getItem('token');
+
 class WebSocketService {
   private ws: WebSocket | null = null;
+  // SSE-поток вместо WebSocket, если прокси не пропускает WebSocket
+  private eventSource: EventSource | null = null;
+  private sseReconnectTimer: ReturnType<typeof setTimeout> | null = null;
+  private pollTimer: ReturnType<typeof setInterval> | null = null;
+  // ID последнего полученного события: SSE-поток продолжается с него (Last-Event-ID)
+  private lastEventId: number | null = null;
+  private wsOpened = false;
   private doctorId: number | null = null;
   private userId: number | null = null;
   private reconnectAttempts = 0;
@@ -29,6 +67,7 @@ class WebSocketService {
   private reconnectDelay = 1000;
   private isConnecting = false;
   private messageHandlers: Map<string, (data: any) => void> = new Map();
+  private topicHandlers: Map<string, Set<(changes: DomainEventChange[]) => void>> = new Map();
 
   constructor() {
     this.setupMessageHandlers();
@@ -49,6 +88,18 @@ class WebSocketService {
       this.onAppointmentUpdated?.(data);
     });
 
+    // Обработчик серий записей (одно уведомление на всю серию)
+    this.messageHandlers.set('appointments_batch', (data: AppointmentsBatchData) => {
+      console.log('📡 Получено уведомление о серии записей:', data);
+      this.onAppointmentsBatch?.(data);
+    });
+
+    // Обработчик доменных событий (планы лечения, наряды, приемы)
+    this.messageHandlers.set('domain_event', (message: WebSocketMessage) => {
+      const handlers = message.topic ? this.topicHandlers.get(message.topic) : undefined;
+      handlers?.forEach((handler) => handler(message.changes || []));
+    });
+
     // Обработчик для pong сообщений
     this.messageHandlers.set('pong', (data: any) => {
       console.log('📡 WebSocket соединение активно');
@@ -58,9 +109,12 @@ class WebSocketService {
   // Callbacks для обработки событий
   public onAppointmentCreated: ((data: AppointmentData) => void) | null = null;
   public onAppointmentUpdated: ((data: AppointmentData) => void) | null = null;
+  public onAppointmentsBatch: ((data: AppointmentsBatchData) => void) | null = null;
+  // Перезагрузить данные целиком: опрос без real-time соединения или пропущено слишком много событий
+  public onResync: (() => void) | null = null;
 
   async connect(doctorId: number, userId?: number) {
-    if (this.isConnecting || this.ws?.readyState === WebSocket.OPEN) {
+    if (this.isConnecting || this.ws?.readyState === WebSocket.OPEN || this.eventSource) {
       console.log('🔌 WebSocket уже подключен или подключается');
       return;
     }
@@ -71,9 +125,10 @@ class WebSocketService {
 
     try {
       // Получаем токен из localStorage
-      const token = localStorage.getItem('token');
+      const token = getToken();
       if (!token) {
         console.error('❌ Токен не найден для WebSocket подключения');
+        this.isConnecting = false;
         return;
       }
 
@@ -91,19 +146,26 @@ class WebSocketService {
         console.log('✅ WebSocket подключен для врача', doctorId);
         this.isConnecting = false;
         this.reconnectAttempts = 0;
+        this.wsOpened = true;
+        this.stopPolling();
         
         // Отправляем токен авторизации (если нужно)
         this.sendAuthToken(token);
+        // Восстанавливаем подписки на топики после переподключения
+        this.sendSubscribe(Array.from(this.topicHandlers.keys()));
       };
 
       this.ws.onmessage = (event) => {
         try {
           const message: WebSocketMessage = JSON.parse(event.data);
           console.log('📨 Получено WebSocket сообщение:', message);
+          if (message.event_id) {
+            this.lastEventId = message.event_id;
+          }
 
           const handler = this.messageHandlers.get(message.type);
           if (handler) {
-            handler(message.data);
+            handler(message.type === 'domain_event' ? message : message.data);
           } else {
             console.warn('⚠️ Неизвестный тип сообщения:', message.type);
           }
@@ -116,12 +178,17 @@ class WebSocketService {
         console.log('🔌 WebSocket соединение закрыто:', event.code, event.reason);
         this.isConnecting = false;
         this.ws = null;
+        if (!this.doctorId) {
+          return;
+        }
+        this.startPolling();
 
-        // Попытка переподключения
-        if (this.reconnectAttempts < this.maxReconnectAttempts) {
-          this.scheduleReconnect();
+        // WebSocket ни разу не открылся (прокси режет Upgrade) или попытки исчерпаны — переходим на SSE
+        if (!this.wsOpened || this.reconnectAttempts >= this.maxReconnectAttempts) {
+          console.warn('⚠️ WebSocket недоступен, переключаемся на SSE');
+          this.connectSSE();
         } else {
-          console.error('❌ Превышено максимальное количество попыток переподключения');
+          this.scheduleReconnect();
         }
       };
 
@@ -136,6 +203,78 @@ class WebSocketService {
     }
   }
 
+  // SSE-поток событий о записях врача. EventSource сам переподключается и передает
+  // Last-Event-ID; новый поток (после закрытия сервером) продолжается с lastEventId.
+  private connectSSE() {
+    const token = getToken();
+    if (!this.doctorId || !token || this.eventSource) {
+      return;
+    }
+
+    const params = new URLSearchParams({ token });
+    if (this.lastEventId !== null) {
+      params.set('last_event_id', String(this.lastEventId));
+    }
+    const sseUrl = `${api.defaults.baseURL}/sse/appointments/${this.doctorId}?${params.toString()}`;
+    console.log('🔌 Подключаемся к SSE для врача', this.doctorId);
+
+    const source = new EventSource(sseUrl);
+    this.eventSource = source;
+
+    source.onopen = () => {
+      console.log('✅ SSE подключен для врача', this.doctorId);
+      this.stopPolling();
+    };
+
+    APPOINTMENT_EVENTS.forEach((type) => {
+      source.addEventListener(type, (event) => {
+        const message = event as MessageEvent;
+        if (message.lastEventId) {
+          this.lastEventId = Number(message.lastEventId);
+        }
+        try {
+          this.messageHandlers.get(type)?.(JSON.parse(message.data));
+        } catch (error) {
+          console.error('❌ Ошибка парсинга SSE сообщения:', error);
+        }
+      });
+    });
+
+    // Пропущенных событий больше, чем сервер досылает, — перезагружаем данные целиком
+    source.addEventListener('resync', () => this.onResync?.());
+
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED) {
+        // Сервер закрыл поток (истек токен, переполнен буфер) — создаем новый с актуальным токеном
+        console.warn('⚠️ SSE поток закрыт, переподключение');
+        this.eventSource = null;
+        this.startPolling();
+        this.sseReconnectTimer = setTimeout(() => {
+          this.sseReconnectTimer = null;
+          this.connectSSE();
+        }, SSE_RECONNECT_DELAY_MS);
+      } else {
+        // EventSource переподключится сам и передаст Last-Event-ID
+        this.startPolling();
+      }
+    };
+  }
+
+  // Опрос только на время, пока нет ни WebSocket, ни SSE
+  private startPolling() {
+    if (this.pollTimer) {
+      return;
+    }
+    this.pollTimer = setInterval(() => this.onResync?.(), POLL_INTERVAL_MS);
+  }
+
+  private stopPolling() {
+    if (this.pollTimer) {
+      clearInterval(this.pollTimer);
+      this.pollTimer = null;
+    }
+  }
+
   private sendAuthToken(token: string) {
     if (this.ws && this.ws.readyState === WebSocket.OPEN) {
       // Отправляем токен как первое сообщение
@@ -146,6 +285,34 @@ class WebSocketService {
     }
   }
 
+  // Подписка на топик доменных событий, например `treatment_plan:5` или `clinic:1:treatment_orders`.
+  // Возвращает функцию отписки.
+  subscribe(topic: string, handler: (changes: DomainEventChange[]) => void): () => void {
+    if (!this.topicHandlers.has(topic)) {
+      this.topicHandlers.set(topic, new Set());
+      this.sendSubscribe([topic]);
+    }
+    this.topicHandlers.get(topic)!.add(handler);
+
+    return () => {
+      const handlers = this.topicHandlers.get(topic);
+      if (!handlers) return;
+      handlers.delete(handler);
+      if (handlers.size === 0) {
+        this.topicHandlers.delete(topic);
+        if (this.ws && this.ws.readyState === WebSocket.OPEN) {
+          this.ws.send(JSON.stringify({ type: 'unsubscribe', topics: [topic] }));
+        }
+      }
+    };
+  }
+
+  private sendSubscribe(topics: string[]) {
+    if (topics.length > 0 && this.ws && this.ws.readyState === WebSocket.OPEN) {
+      this.ws.send(JSON.stringify({ type: 'subscribe', topics }));
+    }
+  }
+
   private scheduleReconnect() {
     this.reconnectAttempts++;
     const delay = this.reconnectDelay * Math.pow(2, this.reconnectAttempts - 1);
@@ -160,14 +327,25 @@ class WebSocketService {
   }
 
   disconnect() {
+    // doctorId сбрасываем первым, чтобы onclose не запустил переподключение
+    this.doctorId = null;
+    this.userId = null;
     if (this.ws) {
       console.log('🔌 Отключаем WebSocket');
       this.ws.close();
       this.ws = null;
     }
-    this.doctorId = null;
-    this.userId = null;
+    if (this.eventSource) {
+      this.eventSource.close();
+      this.eventSource = null;
+    }
+    if (this.sseReconnectTimer) {
+      clearTimeout(this.sseReconnectTimer);
+      this.sseReconnectTimer = null;
+    }
+    this.stopPolling();
     this.reconnectAttempts = 0;
+    this.wsOpened = false;
   }
 
   sendPing() {
@@ -180,10 +358,13 @@ class WebSocketService {
   }
 
   isConnected(): boolean {
-    return this.ws?.readyState === WebSocket.OPEN;
+    return this.ws?.readyState === WebSocket.OPEN || this.eventSource?.readyState === EventSource.OPEN;
   }
 
   getConnectionState(): string {
+    if (this.eventSource) {
+      return this.eventSource.readyState === EventSource.OPEN ? 'connected (sse)' : 'connecting (sse)';
+    }
     if (!this.ws) return 'disconnected';
     
     switch (this.ws.readyState) {
@@ -16,6 +16,7 @@ export interface TreatmentOrder {
   status?: string;
   created_at: string;
   updated_at?: string;
+  version?: number;
   services: TreatmentOrderService[];
 }
 